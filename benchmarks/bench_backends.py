@@ -0,0 +1,145 @@
+"""Compare the cache backends on a synthetic tile set.
+
+Tiles are written by the built-in seeder storage and by the MapProxy cache
+of a generated project, then read back by MapProxy like the server does.
+A share of the tiles is empty, which is what linking single color images
+of the file backend is meant for.
+
+    python benchmarks/bench_backends.py --tiles 20000 --empty-share 0.5
+
+MapProxy and Pillow have to be installed in the environment running the benchmark.
+"""
+import io
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import click
+from PIL import Image
+from mapproxy.cache.tile import Tile
+from mapproxy.config.loader import load_configuration
+from mapproxy.image import ImageResult
+from mapproxy.image.opts import ImageOptions
+
+from fixtures import _png
+from geoarchive.config import FileCacheBackend, GeoPackageCacheBackend, MBTilesCacheBackend, SqliteCacheBackend
+from geoarchive.project import Project
+from geoarchive.services.base import Layer
+from geoarchive.storage import open_storage
+from geoarchive.tiles import WEBMERCATOR
+
+BACKENDS = {
+    'compact': None,
+    'file': FileCacheBackend(),
+    'file-linked': FileCacheBackend(link_single_color_images=True),
+    'sqlite': SqliteCacheBackend(),
+    'mbtiles': MBTilesCacheBackend(),
+    'geopackage': GeoPackageCacheBackend(),
+}
+
+LEVEL = 12
+# metatiles of mapproxy-seed store 4x4 tiles at once
+BATCH_SIZE = 16
+
+
+def synthetic_tiles(count: int, empty_share: float, generator: random.Random) -> list[tuple[int, int, int, bytes]]:
+    def noise() -> bytes:
+        # coarse noise compresses to the size of a typical imagery tile
+        image = Image.frombytes('RGB', (48, 48), generator.randbytes(48 * 48 * 3)).resize((256, 256), Image.NEAREST)
+        buffer = io.BytesIO()
+        image.save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    # a handful of distinct images keeps the setup fast, the backends
+    # do not compare the content of tiles which are not single color
+    images = [noise() for _ in range(8)]
+    empty = _png(0)
+
+    side = int(count ** 0.5) + 1
+    return [
+        (LEVEL, 2300 + i % side, 1400 + i // side, empty if generator.random() < empty_share else generator.choice(images))
+        for i in range(count)
+    ]
+
+
+def _size(path: Path) -> int:
+    return sum(os.lstat(Path(root) / name).st_size for root, _, names in os.walk(path) for name in names)
+
+
+def _mapproxy_cache(path: Path, backend):
+    project = Project.create(path, name='bench', create_environment=False)
+    project.add_source(Layer(name='bench', type='tms', url='http://127.0.0.1/{z}/{x}/{y}.png', bounds=(-180, -85, 180, 85)))
+    project.set_source_backend('bench', backend)
+    project.save(path)
+    return load_configuration(str(path / 'mapproxy.yaml')).caches['cache-bench'].caches()[0][2].cache
+
+
+def bench_backend(backend, tiles: list[tuple[int, int, int, bytes]], generator: random.Random) -> dict:
+    result = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp)
+
+        try:
+            storage = open_storage(path / 'native', 'cache-bench', WEBMERCATOR, backend)
+        except NotImplementedError:
+            result['native_write'] = None
+        else:
+            started = time.perf_counter()
+            for z, x, y, data in tiles:
+                storage.store(z, x, y, data)
+            storage.close()
+            result['native_write'] = len(tiles) / (time.perf_counter() - started)
+
+        cache = _mapproxy_cache(path / 'mapproxy', backend)
+        image_opts = ImageOptions(format='image/png')
+
+        started = time.perf_counter()
+        for i in range(0, len(tiles), BATCH_SIZE):
+            cache.store_tiles([
+                Tile((x, y, z), ImageResult(io.BytesIO(data), image_opts=image_opts))
+                for z, x, y, data in tiles[i:i + BATCH_SIZE]
+            ])
+        result['mapproxy_write'] = len(tiles) / (time.perf_counter() - started)
+
+        coords = [(x, y, z) for z, x, y, _ in tiles]
+        generator.shuffle(coords)
+        started = time.perf_counter()
+        for coord in coords:
+            tile = Tile(coord)
+            cache.load_tile(tile)
+            tile.image_result_buffer().read()
+        result['mapproxy_read'] = len(tiles) / (time.perf_counter() - started)
+
+        result['megabytes'] = _size(path / 'mapproxy' / 'cache_data') / 1024 / 1024
+    return result
+
+
+@click.command()
+@click.option('--tiles', 'count', default=10_000, type=int)
+@click.option('--empty-share', default=0.3, type=float, help='Share of empty tiles')
+@click.option('--backends', default=','.join(BACKENDS), help='Comma separated backends to compare')
+@click.option('--json', 'as_json', is_flag=True)
+def main(count: int, empty_share: float, backends: str, as_json: bool):
+    logging.disable(logging.WARNING)
+    generator = random.Random(0)
+    tiles = synthetic_tiles(count, empty_share, generator)
+
+    results = {name: bench_backend(BACKENDS[name], tiles, generator) for name in backends.split(',')}
+
+    if as_json:
+        click.echo(json.dumps(results, indent=2))
+        return
+
+    click.echo(f'{"backend":<12} {"native write/s":>15} {"mapproxy write/s":>17} {"read/s":>10} {"size":>10}')
+    for name, result in results.items():
+        native = f'{result["native_write"]:>15.0f}' if result['native_write'] else f'{"-":>15}'
+        click.echo(f'{name:<12} {native} {result["mapproxy_write"]:>17.0f} {result["mapproxy_read"]:>10.0f} '
+                   f'{result["megabytes"]:>8.1f}MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Time Project.save for projects with a growing number of sources.
+
+    python benchmarks/bench_save.py --sizes 100,1000,4000 --layout sharded
+"""
+import json
+import logging
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import click
+
+from geoarchive.config import TileGridConfig
+from geoarchive.project import Project
+from geoarchive.services.base import Layer
+
+
+def make_layers(count: int) -> list[Layer]:
+    generator = random.Random(count)
+    native_grid = TileGridConfig(
+        srid='EPSG:3857',
+        origin=(-5120900, 9998100),
+        resolutions=[264.5838, 132.2919, 66.14596, 26.45838, 13.22919, 6.614596, 2.645838],
+        tile_size=(512, 512),
+    )
+
+    layers = []
+    for i in range(count):
+        lon, lat = generator.uniform(22, 40), generator.uniform(44, 52)
+        bounds = (lon, lat, lon + generator.uniform(0.01, 1), lat + generator.uniform(0.01, 1))
+        if i % 3 == 0:
+            layers.append(Layer(
+                name=f'arcgis-{i}', type='arcgis', url=f'https://host{i % 17}.example/arcgis/rest/services/S{i}/MapServer',
+                bounds=bounds, opts=dict(layers=f'show:{i % 5}'),
+                coverage=[bounds[:2] + (bounds[0] + 0.005, bounds[1] + 0.005), bounds[2:] + bounds[2:]] if i % 2 else None,
+            ))
+        else:
+            layers.append(Layer(
+                name=f'tms-{i}', type='tms', url=f'https://host{i % 17}.example/tiles/{i}/{{z}}/{{x}}/{{y}}.png',
+                bounds=bounds, min_level=i % 4, max_level=6 if i % 10 == 1 else 14 + i % 5,
+                tile_grid=native_grid if i % 10 == 1 else None,
+            ))
+    return layers
+
+
+def make_project(path: Path, count: int, layout: str = 'single') -> Project:
+    project = Project.create(path, name='bench', create_environment=False)
+    project.set_config_layout(layout)
+    layers = make_layers(count)
+    for layer in layers:
+        project.add_source(layer)
+    for i in range(0, count, 50):
+        project.add_cache(f'merged-{i}', [layer.name for layer in layers[i:i + 50]])
+    return project
+
+
+def timed(function, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+@click.command()
+@click.option('--sizes', default='100,1000,4000')
+@click.option('--repeat', default=3, type=int)
+@click.option('--layout', type=click.Choice(['single', 'sharded']), default='single')
+@click.option('--json', 'as_json', is_flag=True)
+def main(sizes: str, repeat: int, layout: str, as_json: bool):
+    logging.disable(logging.INFO)
+
+    results = []
+    for size in map(int, sizes.split(',')):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'project'
+            project = make_project(path, size, layout)
+
+            # a forced save writes every file, the following ones
+            # find everything or all but one source unchanged on disk
+            source = next(iter(project.get_sources().values()))
+            source_url = source.url
+
+            def one_source_save():
+                source.url = f'{source_url}?v={time.perf_counter_ns()}'
+                project.save(path)
+
+            results.append(dict(
+                sources=size,
+                changed=timed(lambda: project.save(path, force=True), repeat),
+                one_source=timed(one_source_save, repeat),
+                unchanged=timed(lambda: project.save(path), repeat),
+                load=timed(lambda: Project.load(path), repeat),
+            ))
+
+    if as_json:
+        click.echo(json.dumps(results, indent=2))
+        return
+
+    click.echo(f'{"sources":>8} {"save":>10} {"one":>10} {"unchanged":>10} {"load":>10}')
+    for result in results:
+        click.echo(f'{result["sources"]:>8} {result["changed"]:>9.3f}s {result["one_source"]:>9.3f}s '
+                   f'{result["unchanged"]:>9.3f}s {result["load"]:>9.3f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""Load test the production server with a growing number of workers.
+
+Tiles are served by MapProxy under gunicorn from a generated project whose
+sources point at the local fixture server. Every request asks for a tile
+which is not cached yet, so each one goes through MapProxy to the upstream.
+
+    python benchmarks/bench_serve.py --workers 1,2,4 --concurrency 32 --requests 2000
+
+gunicorn has to be installed in the environment running the benchmark.
+"""
+import json
+import logging
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import click
+import requests
+
+from fixtures import FixtureOptions, FixtureServer
+from geoarchive.mapproxy import write_wsgi_app
+from geoarchive.project import Project
+from geoarchive.services.base import Layer
+
+LEVEL = 10
+
+
+def make_project(path: Path, server: FixtureServer, sources: int) -> Project:
+    project = Project.create(path, name='bench', create_environment=False)
+    for i in range(sources):
+        project.add_source(Layer(name=f'tiles-{i}', type='tms', url=f'{server.url}/tiles/{i}/{{z}}/{{x}}/{{y}}.png',
+                                 bounds=(-180, -85, 180, 85)))
+    project.save(path)
+    write_wsgi_app(path)
+    return project
+
+
+def _wait_ready(url: str, process: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise click.ClickException('gunicorn exited with code %s' % process.returncode)
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            # the port may accept connections before the workers answer
+            time.sleep(0.1)
+    raise click.ClickException('gunicorn did not start in %ss' % timeout)
+
+
+def _tile_maps(url: str) -> list[str]:
+    return re.findall(r'href="([^"]+)"', requests.get(f'{url}/tms/1.0.0/', timeout=10).text)
+
+
+def load_test(url: str, tile_maps: list[str], count: int, concurrency: int, generator: random.Random) -> dict:
+    # distinct tiles, so no request is answered from the MapProxy cache
+    tiles = set()
+    while len(tiles) < count:
+        tiles.add((generator.choice(tile_maps), generator.randrange(2 ** LEVEL), generator.randrange(2 ** LEVEL)))
+
+    session = requests.Session()
+    session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+
+    def fetch(tile: tuple[str, int, int]) -> tuple[float, bool]:
+        tile_map, x, y = tile
+        started = time.perf_counter()
+        response = session.get(f'{tile_map}/{LEVEL}/{x}/{y}.png', timeout=60)
+        return time.perf_counter() - started, response.ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(fetch, tiles))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _ in results)
+    return dict(
+        tiles=len(results),
+        errors=sum(1 for _, ok in results if not ok),
+        seconds=elapsed,
+        tiles_per_second=len(results) / elapsed,
+        p50=latencies[len(latencies) // 2],
+        p95=latencies[int(len(latencies) * 0.95)],
+    )
+
+
+@click.command()
+@click.option('--workers', 'worker_counts', default='1,2,4', help='Comma separated worker counts to test')
+@click.option('--threads', default=4, type=int, help='Threads of every worker')
+@click.option('--concurrency', default=32, type=int, help='Concurrent client requests')
+@click.option('--requests', 'count', default=2000, type=int, help='Tiles requested for every worker count')
+@click.option('--sources', default=10, type=int)
+@click.option('--latency', default=0.02, type=float, help='Delay of every upstream response in seconds')
+@click.option('--port', default=8799, type=int)
+@click.option('--json', 'as_json', is_flag=True)
+def main(worker_counts: str, threads: int, concurrency: int, count: int, sources: int,
+         latency: float, port: int, as_json: bool):
+    logging.disable(logging.INFO)
+    generator = random.Random(0)
+    url = f'http://127.0.0.1:{port}'
+
+    results = []
+    with FixtureServer(FixtureOptions(latency=latency)) as server, tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'project'
+        make_project(path, server, sources)
+
+        for workers in map(int, worker_counts.split(',')):
+            process = subprocess.Popen([
+                sys.executable, '-m', 'gunicorn', '--chdir', str(path), '--bind', f'127.0.0.1:{port}',
+                '--workers', str(workers), '--threads', str(threads), 'wsgi:application',
+            ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                _wait_ready(url, process)
+                results.append(dict(workers=workers, threads=threads,
+                                    **load_test(url, _tile_maps(url), count, concurrency, generator)))
+            finally:
+                process.terminate()
+                process.wait()
+
+    if as_json:
+        click.echo(json.dumps(results, indent=2))
+        return
+
+    click.echo(f'{"workers":>8} {"tiles/s":>10} {"p50":>9} {"p95":>9} {"errors":>7}')
+    for result in results:
+        click.echo(f'{result["workers"]:>8} {result["tiles_per_second"]:>10.1f} {result["p50"]:>8.3f}s '
+                   f'{result["p95"]:>8.3f}s {result["errors"]:>7}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+"""Local stand-in for the upstream catalogs and tile servers.
+
+Serves an ArcGIS REST catalog, SoftPro JSON and HTML catalogs and tiles
+with configurable size, latency and error rate:
+
+    python benchmarks/fixtures.py --port 8000 --latency 0.02 --error-rate 0.01
+"""
+import dataclasses
+import io
+import json
+import random
+import struct
+import threading
+import time
+import urllib.parse
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import click
+from PIL import Image
+
+WEBMERCATOR_RESOLUTION = 156543.03392800014
+ORIGIN_SHIFT = 20037508.342789244
+
+
+@dataclasses.dataclass
+class FixtureOptions:
+    latency: float = 0.0
+    error_rate: float = 0.0
+    folders: int = 3
+    depth: int = 2
+    services: int = 4
+    layers: int = 5
+    softpro_layers: int = 200
+    tile_size: int = 20_000
+    tile_format: str = 'png'
+    seed: int = 0
+
+
+def _png(size: int) -> bytes:
+    # a valid 256x256 png padded with an ancillary chunk to the wanted size
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    image = zlib.compress(b''.join(b'\0' + bytes(256 * 4) for _ in range(256)))
+    data = b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', 256, 256, 8, 6, 0, 0, 0))
+    data += chunk(b'IDAT', image)
+    padding = max(0, size - len(data) - 24)
+    return data + chunk(b'teXt', b'padding\0' + bytes(padding)) + chunk(b'IEND', b'')
+
+
+def _jpeg(size: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.new('RGB', (256, 256), (90, 110, 70)).save(buffer, 'JPEG')
+    data = buffer.getvalue()
+    # pad with comment segments right after the SOI marker
+    padding = b''
+    remaining = max(0, size - len(data))
+    while remaining > 4:
+        length = min(remaining - 2, 65535)
+        padding += b'\xff\xfe' + struct.pack('>H', length) + bytes(length - 2)
+        remaining -= length + 2
+    return data[:2] + padding + data[2:]
+
+
+class FixtureServer:
+    def __init__(self, options: FixtureOptions, host: str = '127.0.0.1', port: int = 0):
+        self.options = options
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(options.seed)
+        self._png = _png(options.tile_size) if options.tile_format in ('png', 'mixed') else None
+        self._jpeg = _jpeg(options.tile_size) if options.tile_format in ('jpeg', 'mixed') else None
+
+        handler = type('Handler', (_Handler,), dict(fixture=self))
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def __enter__(self) -> 'FixtureServer':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            return self._random.random() < self.options.error_rate
+
+    def folder(self, path: list[str]) -> dict:
+        prefix = '/'.join(path) + '/' if path else ''
+        folders = [] if len(path) >= self.options.depth else [
+            f'{prefix}F{i}' for i in range(self.options.folders)
+        ]
+        services = [
+            dict(name=f'{prefix}S{i}', type='MapServer') for i in range(self.options.services)
+        ]
+        services.append(dict(name=f'{prefix}Features', type='FeatureServer'))
+        return dict(folders=folders, services=services)
+
+    def extent(self, name: str, index: int = -1) -> dict:
+        generator = random.Random(f'{name}/{index}')
+        x, y = generator.uniform(2.4e6, 4.4e6), generator.uniform(5.5e6, 6.8e6)
+        size = generator.uniform(5e3, 1e5)
+        return dict(xmin=x, ymin=y, xmax=x + size, ymax=y + size, spatialReference=dict(wkid=102100, latestWkid=3857))
+
+    def layer(self, name: str, index: int) -> dict:
+        return dict(id=index, name=f'Layer {index}', type='Feature Layer', extent=self.extent(name, index))
+
+    def service(self, name: str) -> dict:
+        layers = [self.layer(name, i) for i in range(self.options.layers)]
+        extents = [layer['extent'] for layer in layers]
+        data = dict(
+            serviceDescription=f'Service {name}',
+            mapName=name.rsplit('/', 1)[-1],
+            layers=[dict(id=layer['id'], name=layer['name'], parentLayerId=-1, defaultVisibility=True,
+                         subLayerIds=None, minScale=0, maxScale=0, type=layer['type']) for layer in layers],
+            fullExtent=dict(
+                xmin=min(extent['xmin'] for extent in extents), ymin=min(extent['ymin'] for extent in extents),
+                xmax=max(extent['xmax'] for extent in extents), ymax=max(extent['ymax'] for extent in extents),
+                spatialReference=dict(wkid=102100, latestWkid=3857)
+            ),
+        )
+        if name.endswith('S0'):
+            data['tileInfo'] = dict(
+                rows=256, cols=256,
+                origin=dict(x=-ORIGIN_SHIFT, y=ORIGIN_SHIFT),
+                spatialReference=dict(wkid=102100, latestWkid=3857),
+                lods=[dict(level=z, resolution=WEBMERCATOR_RESOLUTION / 2 ** z, scale=591657527.591555 / 2 ** z)
+                      for z in range(20)],
+            )
+        return data
+
+    def softpro_layers(self) -> list[dict]:
+        return [
+            dict(id=str(i), name=f'Layer {i}', category=f'Category {i % 10}', service='tms' if i % 5 else 'vtile',
+                 url=f'/tiles/softpro-{i}/{{z}}/{{x}}/{{y}}.png', bounds='22.1,44.3,40.2,52.4')
+            for i in range(self.options.softpro_layers)
+        ]
+
+    def softpro_html(self) -> str:
+        items = ''.join(
+            f'<li class="access-list__item"><input type="checkbox" map-layer="{i}">'
+            f'<span class="access-list__item_name">Map {i}</span></li>'
+            for i in range(self.options.softpro_layers)
+        )
+        return f'<html><body><ul class="access-list">{items}</ul></body></html>'
+
+    def tile(self, x: int = 0) -> tuple[bytes, str]:
+        # mixed sources serve jpeg tiles and png tiles at every other column
+        if self._jpeg is not None and (self._png is None or x % 2):
+            return self._jpeg, 'image/jpeg'
+        return self._png, 'image/png'
+
+
+def _number(segment: str) -> int:
+    segment = segment.split('.')[0]
+    return int(segment) if segment.isdigit() else 0
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    fixture: FixtureServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, data) -> None:
+        self._send(200, json.dumps(data).encode(), 'application/json')
+
+    def do_GET(self):
+        if self.fixture.options.latency:
+            time.sleep(self.fixture.options.latency)
+        if self.fixture.should_fail():
+            self._send(503, b'', 'text/plain')
+            return
+
+        path = urllib.parse.urlparse(self.path).path.strip('/').split('/')
+        if path[:3] == ['arcgis', 'rest', 'services']:
+            self._arcgis(path[3:])
+        elif path == ['softpro', 'layers.json']:
+            self._send_json(self.fixture.softpro_layers())
+        elif path == ['softpro', 'legacy.html']:
+            self._send(200, self.fixture.softpro_html().encode(), 'text/html')
+        elif path[0] == 'tiles' and len(path) >= 4:
+            self._send(200, *self.fixture.tile(_number(path[-2])))
+        else:
+            self._send(404, b'', 'text/plain')
+
+    def _arcgis(self, path: list[str]) -> None:
+        if 'MapServer' not in path:
+            self._send_json(self.fixture.folder(path))
+            return
+
+        index = path.index('MapServer')
+        name, rest = '/'.join(path[:index]), path[index + 1:]
+        if not rest:
+            self._send_json(self.fixture.service(name))
+        elif rest == ['layers']:
+            self._send_json(dict(layers=[self.fixture.layer(name, i) for i in range(self.fixture.options.layers)]))
+        elif rest[0] == 'tile' and len(rest) == 4:
+            self._send(200, *self.fixture.tile(_number(rest[3])))
+        elif rest[0] in ('tile', 'export'):
+            self._send(200, *self.fixture.tile())
+        elif rest[0].isdigit():
+            self._send_json(self.fixture.layer(name, int(rest[0])))
+        else:
+            self._send(404, b'', 'text/plain')
+
+
+@click.command()
+@click.option('--host', default='127.0.0.1')
+@click.option('--port', default=8000, type=int)
+@click.option('--latency', default=0.0, type=float, help='Delay of every response in seconds')
+@click.option('--error-rate', default=0.0, type=float, help='Share of requests answered with 503')
+@click.option('--folders', default=3, type=int)
+@click.option('--depth', default=2, type=int)
+@click.option('--services', default=4, type=int)
+@click.option('--layers', default=5, type=int)
+@click.option('--softpro-layers', default=200, type=int)
+@click.option('--tile-size', default=20_000, type=int)
+@click.option('--tile-format', default='png', type=click.Choice(['png', 'jpeg', 'mixed']))
+def main(host: str, port: int, **options):
+    with FixtureServer(FixtureOptions(**options), host=host, port=port) as server:
+        click.echo(f'Serving fixtures on {server.url}')
+        click.echo(f' - arcgis: {server.url}/arcgis/rest/services')
+        click.echo(f' - softpro: {server.url}/softpro/layers.json')
+        click.echo(f' - softpro_legacy: {server.url}/softpro/legacy.html')
+        click.echo(f' - tiles: {server.url}/tiles/{{z}}/{{x}}/{{y}}.png')
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""Run the benchmark suite against the local fixture server.
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --latency 0.02 --error-rate 0.01 --compare results.json
+"""
+import json
+import logging
+import platform
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import click
+
+from bench_save import make_project
+from fixtures import FixtureOptions, FixtureServer
+from geoarchive.config import TMSSourceConfig
+from geoarchive.project import Project
+from geoarchive.seeding import Seeder, count_source_tiles
+from geoarchive.services import get_service_protocol
+from geoarchive.services.client import HttpClient
+
+CATALOGS = {
+    'arcgis': '/arcgis/rest/services',
+    'arcgis_layers': '/arcgis/rest/services/S1/MapServer',
+    'softpro': '/softpro/layers.json',
+    'softpro_legacy': '/softpro/legacy.html',
+}
+
+
+def _client(workers: int) -> HttpClient:
+    # errors of the fixture server are retried quickly, the
+    # benchmark measures the crawl and not the backoff
+    return HttpClient(retries=5, backoff=0.01, max_backoff=0.1, pool_size=workers)
+
+
+def _requests(client: HttpClient) -> int:
+    return sum(stats.requests for stats in client.stats.values())
+
+
+def bench_crawl(server: FixtureServer, workers: int) -> dict:
+    results = {}
+    for service_type, catalog in CATALOGS.items():
+        client = _client(workers)
+        protocol = get_service_protocol(service_type, server.url + catalog, client=client, max_workers=workers)
+
+        started = time.perf_counter()
+        layers = protocol.list_layers()
+        elapsed = time.perf_counter() - started
+
+        results[service_type] = dict(
+            seconds=elapsed,
+            layers=len(layers),
+            requests=_requests(client),
+            layers_per_second=len(layers) / elapsed,
+        )
+    return results
+
+
+def bench_project(sources: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'project'
+        project = make_project(path, sources)
+
+        started = time.perf_counter()
+        project.save(path, force=True)
+        save = time.perf_counter() - started
+
+        started = time.perf_counter()
+        project.save(path)
+        unchanged_save = time.perf_counter() - started
+
+        started = time.perf_counter()
+        Project.load(path)
+        load = time.perf_counter() - started
+
+    return dict(sources=sources, save_seconds=save, unchanged_save_seconds=unchanged_save, load_seconds=load)
+
+
+def bench_seed(server: FixtureServer, tiles: int, workers: int) -> dict:
+    # a square around the center of the map with roughly the requested number of tiles
+    level, size = 14, 0.0
+    source = TMSSourceConfig(type='tms', name='bench', url=server.url + '/tiles/{z}/{x}/{y}.png',
+                             bounds=(0, 0, 0, 0), min_level=level, max_level=level)
+    while sum(count_source_tiles(source, range(level, level + 1)).values()) < tiles:
+        size += 0.01
+        source.bounds = (0, 0, size, size)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        client = _client(workers)
+        stats = Seeder(Path(tmp), client, workers=workers, report_interval=3600).seed(source)
+
+    return dict(
+        tiles=stats.tiles,
+        errors=stats.errors,
+        requests=_requests(client),
+        seconds=stats.elapsed,
+        tiles_per_second=stats.tiles_per_second,
+        megabytes_per_second=stats.bytes / 1024 / 1024 / max(stats.elapsed, 1e-9),
+    )
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _flatten(results: dict, prefix: str = '') -> dict[str, float]:
+    values = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            values.update(_flatten(value, f'{prefix}{key}.'))
+        elif isinstance(value, (int, float)):
+            values[f'{prefix}{key}'] = value
+    return values
+
+
+def _compare(baseline: dict, current: dict) -> None:
+    baseline_values, current_values = _flatten(baseline['results']), _flatten(current['results'])
+    click.echo(f'{"metric":<48} {"baseline":>12} {"current":>12} {"change":>8}')
+    for metric, value in current_values.items():
+        if metric not in baseline_values:
+            continue
+
+        old = baseline_values[metric]
+        change = f'{(value - old) / old * 100:+.1f}%' if old else ''
+        click.echo(f'{metric:<48} {old:>12.4g} {value:>12.4g} {change:>8}')
+
+
+@click.command()
+@click.option('--latency', default=0.005, type=float, help='Delay of every fixture response in seconds')
+@click.option('--error-rate', default=0.0, type=float, help='Share of fixture requests answered with 503')
+@click.option('--folders', default=3, type=int, help='Subfolders of every ArcGIS folder')
+@click.option('--depth', default=2, type=int, help='Depth of the ArcGIS folder tree')
+@click.option('--services', default=4, type=int, help='Map services in every ArcGIS folder')
+@click.option('--layers', default=5, type=int, help='Layers of every ArcGIS map service')
+@click.option('--softpro-layers', default=200, type=int)
+@click.option('--tile-size', default=20_000, type=int, help='Size of the served tiles in bytes')
+@click.option('--sources', default=1000, type=int, help='Sources of the saved and loaded project')
+@click.option('--tiles', default=2000, type=int, help='Tiles to seed')
+@click.option('--workers', default=16, type=int)
+@click.option('--output', type=click.Path(dir_okay=False, path_type=Path), help='Write the results to a file')
+@click.option('--compare', type=click.Path(exists=True, dir_okay=False, path_type=Path),
+              help='Compare the results with an earlier run')
+def main(sources: int, tiles: int, workers: int, output: Path | None, compare: Path | None, **fixture_options):
+    logging.basicConfig(level=logging.ERROR)
+    options = FixtureOptions(**fixture_options)
+
+    with FixtureServer(options) as server:
+        results = dict(
+            crawl=bench_crawl(server, workers),
+            project=bench_project(sources),
+            seed=bench_seed(server, tiles, workers),
+        )
+
+    report = dict(
+        meta=dict(
+            commit=_commit(),
+            python=platform.python_version(),
+            platform=platform.platform(),
+            created_at=time.strftime('%Y-%m-%dT%H:%M:%S'),
+            options=dict(sources=sources, tiles=tiles, workers=workers, **fixture_options),
+        ),
+        results=results,
+    )
+
+    if output is not None:
+        output.write_text(json.dumps(report, indent=2))
+
+    if compare is not None:
+        _compare(json.loads(compare.read_text()), report)
+    elif output is None:
+        click.echo(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
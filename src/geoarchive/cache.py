@@ -1,42 +1,165 @@
 import hashlib
 import json
-import os
+import logging
+import sqlite3
+from datetime import datetime
 from pathlib import Path
 
-import pydantic
-
+from geoarchive import profiling
 from geoarchive.services.base import Layer
+from geoarchive.spatial import WGS84, to_wgs84
+from geoarchive.tiles import Bbox
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS layers (
+    id INTEGER PRIMARY KEY,
+    catalog TEXT NOT NULL,
+    name TEXT NOT NULL,
+    data TEXT NOT NULL,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    minx REAL, miny REAL, maxx REAL, maxy REAL,
+    UNIQUE (catalog, name)
+);
+CREATE INDEX IF NOT EXISTS layers_name ON layers (name);
+'''
+
+# bounds in EPSG:4326 are mirrored into an r-tree by triggers,
+# so every write through the layers table keeps it current
+_RTREE_SCHEMA = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS layer_bounds USING rtree(id, minx, maxx, miny, maxy);
+CREATE TRIGGER IF NOT EXISTS layers_insert AFTER INSERT ON layers WHEN new.minx IS NOT NULL BEGIN
+    INSERT INTO layer_bounds VALUES (new.id, new.minx, new.maxx, new.miny, new.maxy);
+END;
+CREATE TRIGGER IF NOT EXISTS layers_update AFTER UPDATE OF minx, miny, maxx, maxy ON layers
+WHEN old.minx IS NOT new.minx OR old.miny IS NOT new.miny OR old.maxx IS NOT new.maxx OR old.maxy IS NOT new.maxy
+BEGIN
+    DELETE FROM layer_bounds WHERE id = old.id;
+    INSERT INTO layer_bounds SELECT new.id, new.minx, new.maxx, new.miny, new.maxy WHERE new.minx IS NOT NULL;
+END;
+CREATE TRIGGER IF NOT EXISTS layers_delete AFTER DELETE ON layers BEGIN
+    DELETE FROM layer_bounds WHERE id = old.id;
+END;
+'''
+
+_UPSERT = '''
+INSERT INTO layers (catalog, name, data, first_seen, last_seen, minx, miny, maxx, maxy)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (catalog, name) DO UPDATE SET
+    data = excluded.data, last_seen = excluded.last_seen,
+    minx = excluded.minx, miny = excluded.miny, maxx = excluded.maxx, maxy = excluded.maxy
+'''
+
+
+class CatalogStore:
+    _FILE = '.cache/catalog.sqlite'
+
+    def __init__(self, project_path: Path):
+        self._project_path = project_path
+        filename = project_path / self._FILE
+        filename.parent.mkdir(parents=True, exist_ok=True)
+
+        # concurrent imports wait for each other instead of failing
+        self._db = sqlite3.connect(filename, timeout=60)
+        self._db.execute('PRAGMA journal_mode=wal')
+        self._db.executescript(_SCHEMA)
+        try:
+            self._db.executescript(_RTREE_SCHEMA)
+            self._rtree = True
+        except sqlite3.OperationalError:
+            logging.debug('SQLite is built without r-tree, areas are queried by a table scan')
+            self._rtree = False
+
+    def close(self) -> None:
+        self._db.close()
+
+    def exists(self, catalog: str, name: str) -> bool:
+        return self._db.execute(
+            'SELECT 1 FROM layers WHERE catalog = ? AND name = ?', (catalog, name)
+        ).fetchone() is not None
+
+    def upsert(self, catalog: str, layers: list[Layer], seen_at: datetime | None = None) -> None:
+        seen_at = (seen_at or datetime.now()).isoformat()
+        rows = []
+        for layer in layers:
+            bbox = to_wgs84(layer.bounds, layer.bounds_srid or WGS84) or (None, None, None, None)
+            rows.append((catalog, layer.name, layer.model_dump_json(), seen_at, seen_at, *bbox))
+
+        with self._db:
+            self._db.executemany(_UPSERT, rows)
+
+    def query(self, bbox: Bbox, catalogs: list[str] | None = None) -> list[tuple[str, str, Bbox]]:
+        table = 'layer_bounds b JOIN layers l ON l.id = b.id' if self._rtree else 'layers l'
+        alias = 'b' if self._rtree else 'l'
+        sql = (f'SELECT l.catalog, l.name, l.minx, l.miny, l.maxx, l.maxy FROM {table} '
+               f'WHERE {alias}.minx <= ? AND {alias}.maxx >= ? AND {alias}.miny <= ? AND {alias}.maxy >= ?')
+        params = [bbox[2], bbox[0], bbox[3], bbox[1]]
+        if catalogs:
+            sql += ' AND l.catalog IN (%s)' % ','.join('?' * len(catalogs))
+            params.extend(catalogs)
+
+        return [
+            (catalog, name, (minx, miny, maxx, maxy))
+            for catalog, name, minx, miny, maxx, maxy in self._db.execute(sql + ' ORDER BY l.catalog, l.name', params)
+        ]
+
+    def migrate(self, catalog: str) -> None:
+        # catalogs cached as a single json file before the store existed
+        legacy_dir = self._project_path / '.cache/remotes/'
+        legacy_path = legacy_dir / f'{hashlib.md5(catalog.encode()).hexdigest()}.json'
+        if not legacy_path.exists():
+            return
+
+        with profiling.span('cache', 'migrate', url=catalog):
+            try:
+                data = json.loads(legacy_path.read_text())
+                layers = [Layer.model_validate(layer) for layer in (data or {}).values()]
+            except (ValueError, AttributeError) as e:
+                # kept aside for a look by hand, the catalog is crawled again
+                backup_path = legacy_path.with_suffix('.json.bak')
+                logging.warning('Failed to migrate the cache of %s, kept as %s: %s', catalog, backup_path, e)
+                legacy_path.rename(backup_path)
+                legacy_path.with_suffix('.index.json').unlink(missing_ok=True)
+                return
+
+            if layers and not self._db.execute('SELECT 1 FROM layers WHERE catalog = ?', (catalog,)).fetchone():
+                seen_at = datetime.fromtimestamp(legacy_path.stat().st_mtime)
+                self.upsert(catalog, layers, seen_at=seen_at)
+                logging.info('Migrated %s cached layers of %s', len(layers), catalog)
+
+        legacy_path.unlink()
+        legacy_path.with_suffix('.index.json').unlink(missing_ok=True)
 
 
 class CacheService:
-    def __init__(self, data: dict | None):
-        self._cached = data if data is not None else {}
+    def __init__(self, store: CatalogStore, url: str):
+        self._store = store
+        self._url = url
+        self._pending: dict[str, Layer] = {}
 
     def exists(self, layer: Layer) -> bool:
-        return layer.name in self._cached
+        return layer.name in self._pending or self._store.exists(self._url, layer.name)
 
     def set(self, layer: Layer):
-        self._cached[layer.name] = layer.model_dump()
+        self._pending[layer.name] = layer
+
+    def checkpoint(self, every: int = 50):
+        if len(self._pending) >= every:
+            self.save()
 
     @classmethod
     def load(cls, url: str, project_path: Path):
-        cache_dir = project_path / '.cache/remotes/'
-        cache_path = cache_dir / f'{hashlib.md5(url.encode()).hexdigest()}.json'
+        # layers are read from the store when asked for, nothing is loaded upfront
+        with profiling.span('cache', 'load', url=url):
+            store = CatalogStore(project_path)
+            store.migrate(url)
+        return cls(store, url)
 
-        if not cache_path.exists():
-            return cls(data=None)
+    def save(self):
+        # only the layers set since the last save are written, in one transaction
+        with profiling.span('cache', 'save', url=self._url, layers=len(self._pending)):
+            self._store.upsert(self._url, list(self._pending.values()))
+        self._pending.clear()
 
-        with cache_path.open() as f:
-            try:
-                data = json.load(f)
-            except json.JSONDecodeError:
-                data = None
-            return cls(data=data)
-
-    def save(self, url: str, project_path: Path):
-        cache_dir = project_path / '.cache/remotes/'
-        cache_path = cache_dir / f'{hashlib.md5(url.encode()).hexdigest()}.json'
-        os.makedirs(cache_dir, exist_ok=True)
-
-        with open(cache_path, 'w') as f:
-            f.write(json.dumps(self._cached))
+    def close(self) -> None:
+        self._store.close()
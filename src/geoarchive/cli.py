@@ -1,20 +1,68 @@
+import cProfile
 import logging
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 
 import click
+import pydantic
+import requests
+import yaml
+from pydantic import TypeAdapter
 
+from geoarchive.dedupe import ContentFingerprints, find_duplicates, source_key
 from geoarchive.environment import run_env_binary
+from geoarchive.mapproxy import is_seedable, source_aliases, write_wsgi_app
+from geoarchive.profiling import get_profiler
 from geoarchive.project import Project
-from geoarchive.services import get_service_protocol
-from geoarchive.cache import CacheService
+from geoarchive.scheduler import SeedScheduler, SeedState, SeedTask, load_seed_tasks
+from geoarchive.images import detect_format
+from geoarchive.seeding import (Seeder, SeedStats, count_source_tiles, fetch_tile, probe_image_format, probe_tiles,
+                                sample_tiles, source_health)
+from geoarchive.services import get_service_protocol, get_service_types
+from geoarchive.services.base import Layer
+from geoarchive.services.client import HttpClient
+from geoarchive.services.response_cache import ResponseCache
+from geoarchive.spatial import WGS84, bbox_intersects, to_wgs84
+from geoarchive.tiles import Bbox, source_levels
+from geoarchive.cache import CacheService, CatalogStore
+from geoarchive.config import (ArcgisSourceConfig, CacheBackendConfig, CatalogConfig, CatalogImportConfig,
+                               TMSSourceConfig)
 
 workdir = Path('.')
 
 
 @click.group()
-def cli():
+@click.option('--profile', is_flag=True, help='Print a timing summary when the command finishes')
+@click.option('--profile-json', type=click.Path(dir_okay=False, path_type=Path),
+              help='Write the recorded timing spans to a JSON file')
+@click.option('--profile-cprofile', type=click.Path(dir_okay=False, path_type=Path),
+              help='Run the command under cProfile and write the stats to a file')
+@click.pass_context
+def cli(ctx: click.Context, profile: bool, profile_json: Path | None, profile_cprofile: Path | None):
     logging.basicConfig(level=logging.INFO, force=True)
 
+    if not (profile or profile_json or profile_cprofile):
+        return
+
+    profiler = get_profiler()
+    profiler.enable()
+    python_profiler = None
+    if profile_cprofile is not None:
+        python_profiler = cProfile.Profile()
+        python_profiler.enable()
+
+    def report():
+        if python_profiler is not None:
+            python_profiler.disable()
+            python_profiler.dump_stats(profile_cprofile)
+        if profile_json is not None:
+            profiler.dump_json(profile_json)
+        if profile:
+            click.echo(profiler.summary(), err=True)
+
+    ctx.call_on_close(report)
+
 
 @cli.command()
 @click.argument('project_name')
@@ -74,42 +122,505 @@ def add_cache(path: Path, name: str, sources: str):
     project.save(path)
 
 
+@cli.command()
+@click.option('--path', default=workdir, type=Path)
+@click.option('--source', 'source_names', multiple=True, type=str, help='Source whose cache uses the backend')
+@click.option('--cache', 'cache_names', multiple=True, type=str, help='Merged cache which uses the backend')
+@click.option('--type', 'backend_type', required=True,
+              type=click.Choice(['compact', 'file', 'sqlite', 'mbtiles', 'geopackage']))
+@click.option('--directory-layout', default='tc',
+              type=click.Choice(['tc', 'mp', 'tms', 'reverse_tms', 'quadkey', 'arcgis']),
+              help='Directory layout of a file cache')
+@click.option('--link-single-color-images', is_flag=True, type=bool,
+              help='Store single color tiles of a file cache once and link them')
+@click.option('--wal', is_flag=True, type=bool, help='Use write-ahead logging for sqlite and mbtiles caches')
+@click.option('--levels', is_flag=True, type=bool, help='Store every level of a geopackage cache in its own file')
+def set_backend(path: Path, source_names: tuple[str, ...], cache_names: tuple[str, ...], backend_type: str,
+                **options):
+    if not source_names and not cache_names:
+        raise click.UsageError('Pass at least one --source or --cache')
+
+    project = Project.load(path)
+    # options of other backend types are ignored by the model
+    backend = TypeAdapter(CacheBackendConfig).validate_python(dict(type=backend_type, **options))
+
+    for name in source_names:
+        if name not in project.get_sources():
+            raise click.BadParameter('Source `%s` does not exist' % name, param_hint='--source')
+        project.set_source_backend(name, backend)
+    for name in cache_names:
+        if name not in project.get_caches():
+            raise click.BadParameter('Cache `%s` does not exist' % name, param_hint='--cache')
+        project.set_cache_backend(name, backend)
+
+    project.save(path)
+    click.echo(f'Using the {backend_type} backend for {len(source_names) + len(cache_names)} caches')
+
+
+def _parse_bbox(ctx: click.Context, param: click.Parameter, value: str | None) -> Bbox | None:
+    if value is None:
+        return None
+    try:
+        bbox = tuple(float(part) for part in value.split(','))
+    except ValueError:
+        bbox = ()
+    if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+        raise click.BadParameter('Expected `minx,miny,maxx,maxy`, got `%s`' % value)
+    return bbox
+
+
+def _aoi_wgs84(aoi: Bbox | None, srid: str) -> Bbox | None:
+    if aoi is None:
+        return None
+    bbox = to_wgs84(aoi, srid)
+    if bbox is None:
+        raise click.BadParameter('Cannot transform the area from %s' % srid, param_hint='--aoi-srid')
+    return bbox
+
+
+def _in_aoi(layer: Layer, aoi: Bbox | None) -> bool:
+    if aoi is None:
+        return True
+    bbox = to_wgs84(layer.bounds, layer.bounds_srid)
+    if bbox is None:
+        logging.warning('Layer %s has bounds in %s which cannot be compared with the area', layer.name,
+                        layer.bounds_srid)
+        return True
+    return bbox_intersects(bbox, aoi)
+
+
 @cli.command()
 @click.option('--path', default=workdir, type=Path)
 @click.option('--type', type=str, required=True)
 @click.option('--url', type=str, required=True)
 @click.option('--new-only', is_flag=True, type=bool)
-def import_sources(path: Path, type: str, url: str, new_only: bool = False):
+@click.option('--workers', default=1, type=click.IntRange(min=1),
+              help='Number of concurrent catalog requests')
+@click.option('--per-host', default=None, type=click.IntRange(min=1),
+              help='Maximum number of concurrent requests to a single host')
+@click.option('--timeout', default=60, type=float, help='Request timeout in seconds')
+@click.option('--retries', default=3, type=click.IntRange(min=0),
+              help='Number of retries for timeouts and 429/5xx responses')
+@click.option('--cache-ttl', default=3600, type=float,
+              help='Seconds a cached catalog response is used without revalidation')
+@click.option('--cache-size', default=512, type=int, help='Maximum size of the response cache in MB')
+@click.option('--no-cache', is_flag=True, type=bool, help='Do not use the response cache')
+@click.option('--refresh-interval', default=None, type=click.IntRange(min=0),
+              help='Seconds after which imported sources are re-queried by `refresh`')
+@click.option('--no-probe', is_flag=True, type=bool,
+              help='Do not download sample tiles to detect the tile format')
+@click.option('--alias-duplicates', is_flag=True, type=bool,
+              help='Serve sources with the url of an existing source from the cache of that source')
+@click.option('--aoi', default=None, callback=_parse_bbox,
+              help='Import only layers intersecting the area `minx,miny,maxx,maxy`')
+@click.option('--aoi-srid', default=WGS84, type=str, help='Spatial reference of the area of interest')
+def import_sources(path: Path, type: str, url: str, new_only: bool = False,
+                   workers: int = 1, per_host: int | None = None,
+                   timeout: float = 60, retries: int = 3,
+                   cache_ttl: float = 3600, cache_size: int = 512, no_cache: bool = False,
+                   refresh_interval: int | None = None, no_probe: bool = False, alias_duplicates: bool = False,
+                   aoi: Bbox | None = None, aoi_srid: str = WGS84):
+    aoi = _aoi_wgs84(aoi, aoi_srid)
     project = Project.load(path)
-    service = get_service_protocol(type, url)
+    source_keys = {source_key(source): name for name, source in project.get_sources().items()}
+    response_cache = None
+    if not no_cache:
+        response_cache = ResponseCache(path / '.cache/http/', ttl=cache_ttl, max_bytes=cache_size * 1024 * 1024)
+
+    client = HttpClient(timeout=timeout, retries=retries, pool_size=workers,
+                        max_per_host=per_host, cache=response_cache)
+    service = get_service_protocol(type, url, client=client, max_workers=workers)
 
     cache = CacheService.load(url, project_path=path)
 
-    confirmed_layers = []
-    for layer in service.list_layers():
-        if new_only and cache.exists(layer):
-            logging.info(f'Skipping layer {layer.name} because already exists in cache')
-            continue
+    # formats are probed in the background, a slow or dead
+    # upstream never holds up the prompt for the next layer
+    probes = ThreadPoolExecutor(max_workers=workers)
+    confirmed: list[tuple[Layer, Future | None]] = []
+
+    # layers are processed as soon as they are discovered, whatever
+    # was confirmed so far is kept even if the crawl is interrupted
+    try:
+        for layer in service.iter_layers():
+            if new_only and cache.exists(layer):
+                logging.info(f'Skipping layer {layer.name} because already exists in cache')
+                # still seen upstream
+                cache.set(layer)
+                continue
+
+            # layers outside of the area are still cached for later queries
+            if not _in_aoi(layer, aoi):
+                cache.set(layer)
+                continue
+
+            if click.confirm(f"Do you want to include layer {layer.name}?", default=True):
+                probe = None
+                if not no_probe and _should_probe(layer):
+                    probe = probes.submit(probe_image_format, client, layer)
+                confirmed.append((layer, probe))
+
+            cache.set(layer)
+            cache.checkpoint()
+
+        probes.shutdown()
+    finally:
+        # an interrupted import keeps the confirmed layers, without the formats not probed yet
+        probes.shutdown(cancel_futures=True)
+        for layer, probe in confirmed:
+            if probe is not None and not probe.cancelled():
+                if probe.exception() is not None:
+                    logging.warning('Failed to probe the format of %s: %s', layer.name, probe.exception())
+                else:
+                    layer.image_format, layer.transparent = probe.result()
+            _add_layer(project, layer, CatalogConfig(type=type, url=url), refresh_interval,
+                       source_keys, alias_duplicates)
+
+        client.log_stats()
+        cache.save()
+        cache.close()
+        project.save(path)
+
+    click.echo('Importing sources type=%s url=%s' % (type, url))
+
+
+def _add_layer(project: Project, layer: Layer, catalog: CatalogConfig, refresh_interval: int | None,
+               source_keys: dict[str, str], alias_duplicates: bool) -> None:
+    project.add_source(layer, catalog=catalog, refresh_interval=refresh_interval)
 
-        if click.confirm(f"Do you want to include layer {layer.name}?", default=True):
-            confirmed_layers.append(layer)
+    duplicate = source_keys.setdefault(source_key(layer), layer.name)
+    if duplicate != layer.name:
+        logging.warning('Layer %s has the same url as source %s', layer.name, duplicate)
+        if alias_duplicates:
+            project.set_alias(layer.name, duplicate)
 
-        cache.set(layer)
 
-    for layer in confirmed_layers:
-        project.add_source(layer)
+@cli.command()
+@click.option('--path', default=workdir, type=Path)
+@click.argument('catalogs_file', type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option('--new-only', is_flag=True, type=bool)
+@click.option('--jobs', '-j', default=8, type=click.IntRange(min=1), help='Number of catalogs crawled at once')
+@click.option('--workers', default=4, type=click.IntRange(min=1),
+              help='Number of concurrent catalog requests of every crawl')
+@click.option('--per-host', default=None, type=click.IntRange(min=1),
+              help='Maximum number of concurrent requests to a single host')
+@click.option('--timeout', default=60, type=float, help='Request timeout in seconds')
+@click.option('--retries', default=3, type=click.IntRange(min=0),
+              help='Number of retries of failed requests')
+@click.option('--cache-ttl', default=3600, type=float,
+              help='Seconds a cached catalog response stays valid')
+@click.option('--cache-size', default=512, type=int, help='Maximum size of the response cache in MB')
+@click.option('--no-cache', is_flag=True, type=bool, help='Do not use the response cache')
+@click.option('--no-probe', is_flag=True, type=bool,
+              help='Do not download sample tiles to detect the tile format')
+@click.option('--alias-duplicates', is_flag=True, type=bool,
+              help='Serve sources with the url of an existing source from the cache of that source')
+@click.option('--aoi', default=None, callback=_parse_bbox,
+              help='Import only layers intersecting the area `minx,miny,maxx,maxy`')
+@click.option('--aoi-srid', default=WGS84, type=str, help='Spatial reference of the area of interest')
+def import_batch(path: Path, catalogs_file: Path, new_only: bool = False, jobs: int = 8, workers: int = 4,
+                 per_host: int | None = None, timeout: float = 60, retries: int = 3,
+                 cache_ttl: float = 3600, cache_size: int = 512, no_cache: bool = False,
+                 no_probe: bool = False, alias_duplicates: bool = False,
+                 aoi: Bbox | None = None, aoi_srid: str = WGS84):
+    """Import every layer of the catalogs listed in a yaml file
+
+    The file is a list of catalogs with `type`, `url` and an optional `refresh_interval`.
+    """
+    try:
+        with catalogs_file.open(encoding='utf-8') as f:
+            catalogs = TypeAdapter(list[CatalogImportConfig]).validate_python(yaml.safe_load(f) or [])
+    except (yaml.YAMLError, pydantic.ValidationError) as e:
+        raise click.BadParameter(str(e), param_hint='CATALOGS_FILE')
+    for catalog in catalogs:
+        if catalog.type not in get_service_types():
+            raise click.BadParameter('Unknown catalog type `%s` of %s' % (catalog.type, catalog.url),
+                                     param_hint='CATALOGS_FILE')
+    aoi = _aoi_wgs84(aoi, aoi_srid)
 
-    cache.save(url, path)
+    project = Project.load(path)
+    response_cache = None
+    if not no_cache:
+        response_cache = ResponseCache(path / '.cache/http/', ttl=cache_ttl, max_bytes=cache_size * 1024 * 1024)
+
+    client = HttpClient(timeout=timeout, retries=retries, pool_size=jobs * workers,
+                        max_per_host=per_host, cache=response_cache)
+
+    def crawl(catalog: CatalogImportConfig) -> tuple[list[Layer], Exception | None]:
+        # the layers found before a failure are still imported, a catalog
+        # which fails, even with a broken cache, never stops the others
+        layers, error, cache = [], None, None
+        try:
+            service = get_service_protocol(catalog.type, catalog.url, client=client, max_workers=workers)
+            cache = CacheService.load(catalog.url, project_path=path)
+            for layer in service.iter_layers():
+                if new_only and cache.exists(layer):
+                    cache.set(layer)
+                    continue
+                if not _in_aoi(layer, aoi):
+                    cache.set(layer)
+                    continue
+                if not no_probe and _should_probe(layer):
+                    layer.image_format, layer.transparent = probe_image_format(client, layer)
+                layers.append(layer)
+                cache.set(layer)
+        except Exception as e:
+            logging.error('Failed to crawl %s %s: %s', catalog.type, catalog.url, e)
+            error = e
+        finally:
+            if cache is not None:
+                try:
+                    cache.save()
+                except Exception as e:
+                    logging.error('Failed to cache the layers of %s %s: %s', catalog.type, catalog.url, e)
+                    error = error or e
+                finally:
+                    cache.close()
+        logging.info('Crawled %s %s: %s layers', catalog.type, catalog.url, len(layers))
+        return layers, error
+
+    # catalogs are crawled in parallel, the project is only touched
+    # from here and written once after all of them are merged
+    source_keys = {source_key(source): name for name, source in project.get_sources().items()}
+    failed = []
+    imported = 0
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for catalog, (layers, error) in zip(catalogs, executor.map(crawl, catalogs)):
+            for layer in layers:
+                _add_layer(project, layer, CatalogConfig(type=catalog.type, url=catalog.url),
+                           catalog.refresh_interval, source_keys, alias_duplicates)
+            imported += len(layers)
+            if error is not None:
+                failed.append(catalog)
+
+    client.log_stats()
     project.save(path)
 
-    click.echo('Importing sources type=%s url=%s' % (type, url))
+    click.echo(f'Imported {imported} layers from {len(catalogs) - len(failed)} catalogs')
+    if failed:
+        raise click.ClickException('Failed catalogs: %s' % ', '.join(catalog.url for catalog in failed))
+
+
+@cli.command()
+@click.option('--path', default=workdir, type=Path)
+@click.option('--aoi', required=True, callback=_parse_bbox, help='Area `minx,miny,maxx,maxy` to search')
+@click.option('--aoi-srid', default=WGS84, type=str, help='Spatial reference of the area')
+@click.option('--url', 'urls', multiple=True, type=str, help='Catalog to search, all cached catalogs by default')
+def query(path: Path, aoi: Bbox, aoi_srid: str, urls: tuple[str, ...]):
+    aoi = _aoi_wgs84(aoi, aoi_srid)
+
+    store = CatalogStore(path)
+    try:
+        # catalogs cached before the store existed are moved into it first
+        for url in urls or {source.catalog.url for source in Project.load(path).get_sources().values()
+                            if source.catalog is not None}:
+            store.migrate(url)
+        layers = store.query(aoi, catalogs=list(urls))
+    finally:
+        store.close()
+
+    for url, name, bounds in layers:
+        bbox = ','.join(f'{value:.5f}' for value in bounds)
+        click.echo(f' - layer name={name} bounds={bbox} catalog={url}')
+
+    click.echo(f'Found {len(layers)} layers in {len({url for url, _, _ in layers})} catalogs')
+
+
+def _should_probe(source: Layer | TMSSourceConfig | ArcgisSourceConfig) -> bool:
+    # arcgis exports are requested as png, only the format of tiles is up to the upstream
+    return source.type == 'tms' and source.image_format is None
 
 
 @cli.command()
 @click.option('--path', default=workdir, type=Path)
-def rewrite(path: Path):
+@click.option('--source', 'source_names', multiple=True, type=str, help='Source to probe, all sources by default')
+@click.option('--force', is_flag=True, type=bool, help='Probe sources with a known format again')
+@click.option('--workers', default=4, type=click.IntRange(min=1), help='Number of sources probed at once')
+def detect_formats(path: Path, source_names: tuple[str, ...], force: bool, workers: int):
     project = Project.load(path)
+    sources = project.get_sources()
+    for name in source_names:
+        if name not in sources:
+            raise click.BadParameter('Source `%s` does not exist' % name, param_hint='--source')
+
+    selected = [
+        source for name, source in sources.items()
+        if (not source_names or name in source_names)
+        and source.type == 'tms' and (force or source.image_format is None)
+    ]
+
+    client = HttpClient(pool_size=workers * 4, retries=2)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for source, (image_format, transparent) in zip(
+                selected, executor.map(lambda source: probe_image_format(client, source), selected)):
+            logging.info('Source %s: format=%s transparent=%s', source.name, image_format, transparent)
+            if image_format is not None:
+                source.image_format, source.transparent = image_format, transparent
+
     project.save(path)
+    click.echo(f'Probed {len(selected)} sources')
+
+
+@cli.command()
+@click.option('--path', default=workdir, type=Path)
+@click.option('--source', 'source_names', multiple=True, type=str, help='Source to probe, all sources by default')
+@click.option('--workers', default=8, type=click.IntRange(min=1), help='Number of sources probed at once')
+@click.option('--tiles', default=8, type=click.IntRange(min=1), help='Number of tiles requested from every source')
+@click.option('--timeout', default=10, type=float, help='Request timeout in seconds')
+@click.option('--slow', default=5.0, type=float, help='p95 latency in seconds above which a source is degraded')
+@click.option('--min-availability', default=0.9, type=click.FloatRange(0, 1),
+              help='Share of answered requests below which a source is degraded')
+@click.option('--clear', is_flag=True, type=bool, help='Forget the health of the sources instead of probing them')
+def probe(path: Path, source_names: tuple[str, ...], workers: int, tiles: int, timeout: float,
+          slow: float, min_availability: float, clear: bool):
+    project = Project.load(path)
+    sources = project.get_sources()
+    for name in source_names:
+        if name not in sources:
+            raise click.BadParameter('Source `%s` does not exist' % name, param_hint='--source')
+
+    selected = [source for name, source in sources.items() if not source_names or name in source_names]
+    if clear:
+        for source in selected:
+            source.health = None
+        project.save(path)
+        click.echo(f'Cleared the health of {len(selected)} sources')
+        return
+
+    # a dead upstream should fail fast, retries would only multiply the timeouts
+    client = HttpClient(timeout=timeout, retries=0, pool_size=workers * tiles)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(lambda source: probe_tiles(client, source, tiles), selected))
+
+    click.echo(f'{"source":<40} {"status":<12} {"available":>9} {"p50":>8} {"p95":>8} {"throughput":>12}')
+    for source, probes in zip(selected, results):
+        source.health = source_health(probes, slow=slow, min_availability=min_availability)
+        if _should_probe(source):
+            image_format, transparent = detect_format([probe.data for probe in probes if probe.data])
+            if image_format is not None:
+                source.image_format, source.transparent = image_format, transparent
+
+        health = source.health
+        p50 = f'{health.p50:>7.3f}s' if health.p50 is not None else f'{"-":>8}'
+        p95 = f'{health.p95:>7.3f}s' if health.p95 is not None else f'{"-":>8}'
+        throughput = f'{_format_size(health.bytes_per_second)}/s' if health.bytes_per_second else '-'
+        click.echo(f'{source.name:<40} {health.status:<12} {health.availability:>9.0%} {p50} {p95} {throughput:>12}')
+
+    project.save(path)
+    statuses = [source.health.status for source in selected]
+    click.echo(f'Probed {len(selected)} sources: ' + ', '.join(
+        f'{statuses.count(status)} {status}' for status in ('healthy', 'degraded', 'unavailable')
+    ))
+
+
+@cli.command()
+@click.option('--path', default=workdir, type=Path)
+@click.option('--compare-tiles', is_flag=True, type=bool,
+              help='Also compare sample tiles of overlapping sources, not only their urls')
+@click.option('--tiles', default=8, type=click.IntRange(min=1), help='Number of tiles sampled from every source')
+@click.option('--min-matches', default=4, type=click.IntRange(min=1),
+              help='Number of identical tiles which make two sources duplicates')
+@click.option('--workers', default=8, type=click.IntRange(min=1), help='Number of concurrent tile requests')
+@click.option('--alias', 'make_aliases', is_flag=True, type=bool,
+              help='Serve every duplicate from the cache of the first source of its cluster')
+@click.option('--clear', is_flag=True, type=bool, help='Remove all aliases')
+def dedupe(path: Path, compare_tiles: bool, tiles: int, min_matches: int, workers: int,
+           make_aliases: bool, clear: bool):
+    project = Project.load(path)
+    sources = project.get_sources()
+
+    if clear:
+        for name in sources:
+            project.set_alias(name, None)
+        project.save(path)
+        click.echo('Removed all aliases')
+        return
+
+    fingerprints = None
+    if compare_tiles:
+        fingerprints = ContentFingerprints(HttpClient(pool_size=workers, retries=1), workers=workers, count=tiles)
+    try:
+        clusters = find_duplicates(sources.values(), fingerprints, min_matches=min_matches)
+    finally:
+        if fingerprints is not None:
+            fingerprints.close()
+
+    for i, cluster in enumerate(clusters, start=1):
+        click.echo(f'Cluster {i}:')
+        for source in cluster:
+            role = 'keep' if source is cluster[0] else 'alias'
+            click.echo(f'  {role:<5} {source.name} {source.type} {source.url}')
+            if make_aliases:
+                project.set_alias(source.name, None if source is cluster[0] else cluster[0].name)
+
+    if make_aliases:
+        project.save(path)
+    duplicates = sum(len(cluster) - 1 for cluster in clusters)
+    click.echo(f'Found {duplicates} duplicate sources in {len(clusters)} clusters')
+
+
+@cli.command()
+@click.option('--path', default=workdir, type=Path)
+@click.option('--all', 'refresh_all', is_flag=True, type=bool,
+              help='Refresh every imported source regardless of its refresh interval')
+@click.option('--prune', is_flag=True, type=bool, help='Remove sources which disappeared upstream')
+@click.option('--workers', default=1, type=click.IntRange(min=1),
+              help='Number of concurrent catalog requests')
+def refresh(path: Path, refresh_all: bool = False, prune: bool = False, workers: int = 1):
+    project = Project.load(path)
+
+    if refresh_all:
+        sources = list(project.get_sources().values())
+    else:
+        sources = project.get_expired_sources()
+
+    catalogs: dict[tuple[str, str], list[str]] = {}
+    for source in sources:
+        if source.catalog is None:
+            logging.info('Skip source %s because it was not imported from a catalog', source.name)
+            continue
+        catalogs.setdefault((source.catalog.type, source.catalog.url), []).append(source.name)
+
+    client = HttpClient(pool_size=workers)
+    changed = 0
+    for (type, url), names in catalogs.items():
+        click.echo(f'Refreshing {len(names)} sources from {type} catalog {url}')
+        service = get_service_protocol(type, url, client=client, max_workers=workers)
+
+        wanted = set(names)
+        for layer in service.iter_layers():
+            if layer.name not in wanted:
+                continue
+            wanted.remove(layer.name)
+
+            changes = project.refresh_source(layer)
+            for field, (old, new) in changes.items():
+                click.echo(f' ~ {layer.name} {field}: {old} -> {new}')
+            changed += bool(changes)
+
+        for name in sorted(wanted):
+            if prune:
+                click.echo(f' - {name} removed upstream, pruning')
+                project.remove_source(name)
+                changed += 1
+            else:
+                click.echo(f' ! {name} removed upstream')
+
+    client.log_stats()
+    if catalogs:
+        project.save(path)
+
+    click.echo(f'Refreshed {sum(map(len, catalogs.values()))} sources, {changed} changed')
+
+
+@cli.command()
+@click.option('--path', default=workdir, type=Path)
+@click.option('--layout', type=click.Choice(['single', 'sharded']), default=None,
+              help='Write mapproxy.yaml as one file or as one file per source')
+def rewrite(path: Path, layout: str | None):
+    project = Project.load(path)
+    if layout is not None:
+        project.set_config_layout(layout)
+    project.save(path, force=True)
 
     click.echo('Rewriting configs')
 
@@ -117,9 +628,21 @@ def rewrite(path: Path):
 @cli.command()
 @click.option('--path', default=workdir, type=Path)
 @click.option('--bind', '-b', default=None, type=str)
-def serve(path: Path, bind: str):
+@click.option('--production', is_flag=True, type=bool,
+              help='Serve with gunicorn instead of the single-threaded development server')
+@click.option('--workers', '-w', default=os.cpu_count() or 1, type=click.IntRange(min=1),
+              help='Number of worker processes in production mode')
+@click.option('--threads', default=4, type=click.IntRange(min=1),
+              help='Number of threads of every worker in production mode')
+@click.option('--timeout', default=120, type=click.IntRange(min=1),
+              help='Seconds after which a worker handling a request is restarted in production mode')
+def serve(path: Path, bind: str, production: bool, workers: int, threads: int, timeout: int):
     project = Project.load(path)
 
+    if production:
+        _serve_production(project, path, bind or 'localhost:8080', workers, threads, timeout)
+        return
+
     click.echo(f'Serving project {project.name} in development mode')
     click.echo('THIS MODE SHOULD NOT BE USED IN PRODUCTION')
 
@@ -131,15 +654,122 @@ def serve(path: Path, bind: str):
     run_env_binary(path, 'mapproxy-util', *args)
 
 
+def _serve_production(project: Project, path: Path, bind: str, workers: int, threads: int, timeout: int):
+    if not (path / '.venv' / 'bin' / 'gunicorn').exists():
+        raise click.ClickException('gunicorn is not installed in the project environment, run `upgrade` first')
+
+    wsgi_path = write_wsgi_app(path)
+    click.echo(f'Serving project {project.name} on {bind} with {workers} workers and {threads} threads each')
+
+    # mapproxy.yaml changes are picked up by every worker without a restart,
+    # SIGHUP makes gunicorn replace the workers gracefully
+    run_env_binary(path, 'gunicorn',
+                   '--chdir', str(path.absolute()),
+                   '--bind', bind,
+                   '--workers', str(workers),
+                   '--threads', str(threads),
+                   '--timeout', str(timeout),
+                   '--graceful-timeout', str(timeout),
+                   '--access-logfile', '-',
+                   f'{wsgi_path.stem}:application')
+
+
+def _format_size(size: float) -> str:
+    for unit in ('B', 'KB', 'MB', 'GB', 'TB'):
+        if size < 1024 or unit == 'TB':
+            return f'{size:.1f}{unit}'
+        size /= 1024
+
+
+def _format_duration(seconds: float) -> str:
+    hours, remainder = divmod(int(seconds), 3600)
+    return f'{hours}h{remainder // 60:02d}m'
+
+
+@cli.command()
+@click.option('--path', default=workdir, type=Path)
+@click.option('--levels', 'show_levels', is_flag=True, type=bool, help='Print tile counts of every level')
+@click.option('--sample', default=0, type=click.IntRange(min=0),
+              help='Number of tiles per source downloaded to estimate the average tile size')
+@click.option('--tile-size', default=20, type=float,
+              help='Average tile size in KB used when tiles are not sampled')
+@click.option('--rate', default=100, type=float, help='Expected seeding throughput in tiles per second')
+@click.option('--workers', default=16, type=click.IntRange(min=1), help='Number of concurrent sample requests')
+def plan(path: Path, show_levels: bool = False, sample: int = 0, tile_size: float = 20,
+         rate: float = 100, workers: int = 16):
+    project = Project.load(path)
+    sources = project.get_sources()
+
+    average_sizes = {}
+    if sample:
+        client = HttpClient(pool_size=workers, retries=1)
+
+        def average_size(source):
+            levels = source_levels(source)
+            if not levels:
+                logging.warning('Skip sampling source %s because it has no levels', source.name)
+                return None
+
+            sizes = []
+            for z, x, y in sample_tiles(source, sample, levels[-1]):
+                try:
+                    data = fetch_tile(client, source, z, x, y)
+                except requests.RequestException as e:
+                    logging.warning('Failed to sample tile of %s: %s', source.name, e)
+                    continue
+                if data is not None:
+                    sizes.append(len(data))
+            return sum(sizes) / len(sizes) if sizes else None
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            average_sizes = dict(zip(sources, executor.map(average_size, sources.values())))
+
+    total_tiles = total_bytes = 0
+    for name, source in sources.items():
+        counts = count_source_tiles(source, source_levels(source))
+        tiles = sum(counts.values())
+        size = tiles * (average_sizes.get(name) or tile_size * 1024)
+        total_tiles += tiles
+        total_bytes += size
+
+        click.echo(f'{name}: tiles={tiles} size={_format_size(size)} time={_format_duration(tiles / rate)}')
+        if show_levels:
+            for z, count in counts.items():
+                click.echo(f'  level {z:2d}: {count}')
+
+    click.echo(f'Total: sources={len(sources)} tiles={total_tiles} '
+               f'size={_format_size(total_bytes)} time={_format_duration(total_tiles / rate)}')
+
+
 @cli.command(context_settings=dict(
     ignore_unknown_options=True,
     allow_extra_args=True,
 ))
 @click.option('--path', default=workdir, type=Path)
+@click.option('--native', is_flag=True, type=bool,
+              help='Download tiles with the built-in engine instead of mapproxy-seed')
+@click.option('--workers', default=16, type=click.IntRange(min=1),
+              help='Number of concurrent tile requests of the built-in engine')
+@click.option('--source', 'source_names', multiple=True, type=str,
+              help='Seed only the given sources with the built-in engine')
+@click.option('--jobs', '-j', default=None, type=click.IntRange(min=1),
+              help='Run up to N mapproxy-seed processes in parallel, one per seed task')
+@click.option('--per-host', default=None, type=click.IntRange(min=1),
+              help='Maximum number of parallel seed tasks against a single upstream host')
+@click.option('--restart', is_flag=True, type=bool, help='Forget which seed tasks were already completed')
 @click.pass_context
-def seed(ctx, path: Path):
+def seed(ctx, path: Path, native: bool = False, workers: int = 16, source_names: tuple[str, ...] = (),
+         jobs: int | None = None, per_host: int | None = None, restart: bool = False):
     project = Project.load(path)
 
+    if native:
+        _seed_native(project, path, workers, source_names)
+        return
+
+    if jobs is not None:
+        _seed_parallel(project, path, jobs, per_host, restart, ctx.args)
+        return
+
     click.echo(f'Serving project {project.name} in development mode')
     click.echo('THIS MODE SHOULD NOT BE USED IN PRODUCTION')
 
@@ -148,4 +778,59 @@ def seed(ctx, path: Path):
         '-f', str(path / 'mapproxy.yaml'),
         *ctx.args]
 
-    run_env_binary(path, 'mapproxy-seed', *args)
\ No newline at end of file
+    run_env_binary(path, 'mapproxy-seed', *args)
+
+
+def _seed_parallel(project: Project, path: Path, jobs: int, per_host: int | None,
+                   restart: bool, extra_args: list[str]):
+    state = SeedState(path / '.cache/seed-state.json')
+    if restart:
+        state.reset()
+
+    def run_task(task: SeedTask):
+        run_env_binary(path, 'mapproxy-seed',
+                       '-s', str(path / 'seeds.yaml'),
+                       '-f', str(path / 'mapproxy.yaml'),
+                       '--seed', task.name,
+                       *extra_args)
+
+    tasks = load_seed_tasks(path, project.get_sources(), project.get_caches())
+    failed = SeedScheduler(state, jobs=jobs, per_host=per_host).run(tasks, run_task)
+    if failed:
+        raise click.ClickException('Failed seeds: %s' % ', '.join(task.name for task in failed))
+
+    click.echo(f'Seeded project {project.name}')
+
+
+def _seed_native(project: Project, path: Path, workers: int, source_names: tuple[str, ...]):
+    sources = project.get_sources()
+    for name in source_names:
+        if name not in sources:
+            raise click.BadParameter('Source `%s` does not exist' % name, param_hint='--source')
+
+    # duplicates are seeded through the source whose cache they share,
+    # sources named explicitly are seeded regardless of their health
+    aliases = source_aliases(sources.values())
+    names = {aliases.get(name, name) for name in source_names}
+    selected = [
+        source for name, source in sources.items()
+        if name not in aliases and (name in names or not source_names and is_seedable(source))
+    ]
+    for name, source in sources.items():
+        if not source_names and name not in aliases and not is_seedable(source):
+            logging.warning('Skip source %s because it was unavailable at %s', name, source.health.checked_at)
+
+    client = HttpClient(pool_size=workers, retries=2)
+    seeder = Seeder(path, client, workers=workers)
+
+    total = SeedStats()
+    for source in sorted(selected, key=lambda source: source.health is not None and source.health.status == 'degraded'):
+        try:
+            stats = seeder.seed(source)
+        except NotImplementedError as e:
+            raise click.ClickException(str(e))
+        for field in ('tiles', 'skipped', 'missing', 'errors', 'bytes'):
+            setattr(total, field, getattr(total, field) + getattr(stats, field))
+
+    client.log_stats()
+    click.echo(f'Seeded project {project.name}: {total.summary()}')
\ No newline at end of file
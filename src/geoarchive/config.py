@@ -5,11 +5,71 @@ import pydantic
 from pydantic import TypeAdapter, Field
 
 
+class CompactCacheBackend(pydantic.BaseModel):
+    type: Literal['compact'] = 'compact'
+
+
+class FileCacheBackend(pydantic.BaseModel):
+    type: Literal['file'] = 'file'
+    directory_layout: Literal['tc', 'mp', 'tms', 'reverse_tms', 'quadkey', 'arcgis'] = 'tc'
+    link_single_color_images: bool = False
+
+
+class SqliteCacheBackend(pydantic.BaseModel):
+    # one MBTiles file per level
+    type: Literal['sqlite'] = 'sqlite'
+    wal: bool = False
+
+
+class MBTilesCacheBackend(pydantic.BaseModel):
+    type: Literal['mbtiles'] = 'mbtiles'
+    wal: bool = False
+
+
+class GeoPackageCacheBackend(pydantic.BaseModel):
+    type: Literal['geopackage'] = 'geopackage'
+    levels: bool = False
+
+
+CacheBackendConfig = Annotated[
+    CompactCacheBackend | FileCacheBackend | SqliteCacheBackend | MBTilesCacheBackend | GeoPackageCacheBackend,
+    Field(discriminator='type')
+]
+
+
 class CacheConfig(pydantic.BaseModel):
     name: str
     sources: list[str]
 
     grids: list[str] = pydantic.Field(default_factory=lambda: ['webmercator'])
+    backend: CacheBackendConfig | None = None
+
+
+class TileGridConfig(pydantic.BaseModel):
+    srid: str
+    origin: tuple[float, float]
+    resolutions: list[float]
+    tile_size: tuple[int, int] = (256, 256)
+
+
+class SourceHealth(pydantic.BaseModel):
+    status: Literal['healthy', 'degraded', 'unavailable']
+    checked_at: datetime = pydantic.Field(default_factory=datetime.now)
+
+    requests: int
+    availability: float
+    p50: float | None = None
+    p95: float | None = None
+    bytes_per_second: float | None = None
+
+
+class CatalogConfig(pydantic.BaseModel):
+    type: str
+    url: str
+
+
+class CatalogImportConfig(CatalogConfig):
+    refresh_interval: int | None = None
 
 
 class TMSSourceConfig(pydantic.BaseModel):
@@ -19,6 +79,7 @@ class TMSSourceConfig(pydantic.BaseModel):
 
     bounds: tuple[float, float, float, float]
     bounds_srid: str = 'EPSG:4326'
+    coverage: list[tuple[float, float, float, float]] | None = None
 
     created_at: datetime = pydantic.Field(default_factory=datetime.now)
     cached_at: datetime | None = None
@@ -26,6 +87,17 @@ class TMSSourceConfig(pydantic.BaseModel):
     refresh_interval: int | None = None
     opts: dict | None = None
 
+    min_level: int | None = None
+    max_level: int | None = None
+    tile_grid: TileGridConfig | None = None
+    image_format: Literal['png', 'jpeg', 'mixed'] | None = None
+    transparent: bool | None = None
+    cache_backend: CacheBackendConfig | None = None
+    health: SourceHealth | None = None
+    alias_of: str | None = None
+
+    catalog: CatalogConfig | None = None
+
 
 class ArcgisSourceConfig(pydantic.BaseModel):
     type: Literal['arcgis']
@@ -34,6 +106,7 @@ class ArcgisSourceConfig(pydantic.BaseModel):
 
     bounds: tuple[float, float, float, float]
     bounds_srid: str = 'EPSG:4326'
+    coverage: list[tuple[float, float, float, float]] | None = None
 
     created_at: datetime = pydantic.Field(default_factory=datetime.now)
     cached_at: datetime | None = None
@@ -41,6 +114,17 @@ class ArcgisSourceConfig(pydantic.BaseModel):
     refresh_interval: int | None = None
     opts: dict | None = None
 
+    min_level: int | None = None
+    max_level: int | None = None
+    tile_grid: TileGridConfig | None = None
+    image_format: Literal['png', 'jpeg', 'mixed'] | None = None
+    transparent: bool | None = None
+    cache_backend: CacheBackendConfig | None = None
+    health: SourceHealth | None = None
+    alias_of: str | None = None
+
+    catalog: CatalogConfig | None = None
+
 
 class WMSSourceConfig(pydantic.BaseModel):
     type: Literal['wms']
@@ -56,6 +140,8 @@ class ProjectConfigV2(pydantic.BaseModel):
         ..., default_factory=dict
     )
 
+    config_layout: Literal['single', 'sharded'] = 'single'
+
     version: Literal[2] = 2
 
     def upgrade(self) -> None:
@@ -0,0 +1,161 @@
+import hashlib
+import logging
+import re
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator
+
+import requests
+
+from geoarchive.config import TMSSourceConfig, ArcgisSourceConfig
+from geoarchive.seeding import PROBE_LEVEL, fetch_tile, sample_tiles
+from geoarchive.services.base import Layer
+from geoarchive.services.client import HttpClient
+from geoarchive.spatial import bbox_intersects, to_wgs84
+from geoarchive.tiles import Bbox, TileCoord, source_extents, source_grid, source_levels
+
+Source = TMSSourceConfig | ArcgisSourceConfig
+
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def source_key(source: Source | Layer) -> str:
+    # the same endpoint reached through different catalogs, mirrors
+    # served over http and https or with a `www.` prefix share a key
+    parsed = urllib.parse.urlsplit(source.url)
+    host = (parsed.hostname or '').lower().removeprefix('www.')
+    if parsed.port and parsed.port != _DEFAULT_PORTS.get(parsed.scheme.lower()):
+        host = f'{host}:{parsed.port}'
+
+    path = re.sub('/+', '/', urllib.parse.unquote(parsed.path)).rstrip('/')
+    # arcgis rest urls are case insensitive
+    if source.type == 'arcgis' or '/rest/services/' in path.lower():
+        path = path.lower()
+    query = urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(parsed.query)))
+
+    layers = (source.opts or {}).get('layers', '')
+    return f'{source.type}:{host}{path}?{query}#{layers}'
+
+
+def candidate_pairs(sources: list[Source]) -> Iterator[tuple[Source, Source]]:
+    # a sweep over the bounds sorted by their west edge, only
+    # sources which overlap are ever compared tile by tile
+    bounds = [(bbox, source) for source in sources if (bbox := to_wgs84(source.bounds, source.bounds_srid))]
+    bounds.sort(key=lambda item: item[0][0])
+
+    active: list[tuple[Bbox, Source]] = []
+    for bbox, source in bounds:
+        active = [item for item in active if item[0][2] >= bbox[0]]
+        for other_bbox, other in active:
+            if bbox_intersects(bbox, other_bbox):
+                yield other, source
+        active.append((bbox, source))
+
+
+class ContentFingerprints:
+    def __init__(self, client: HttpClient, workers: int = 8, count: int = 8):
+        self._client = client
+        self._count = count
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._samples: dict[str, list[TileCoord]] = {}
+        self._hashes: dict[tuple[str, TileCoord], str | None] = {}
+
+    def close(self) -> None:
+        self._executor.shutdown(cancel_futures=True)
+
+    def _sample(self, source: Source) -> list[TileCoord]:
+        # every source is sampled once, whatever it is compared with,
+        # so the tiles it is asked for repeat across its pairs
+        if source.name not in self._samples:
+            levels = source_levels(source)
+            level = min(max(levels.start, PROBE_LEVEL), levels.stop - 1)
+            self._samples[source.name] = sample_tiles(source, self._count, level)
+        return self._samples[source.name]
+
+    def shared_tiles(self, a: Source, b: Source) -> list[TileCoord]:
+        # tiles are compared by their coordinates, so only sources
+        # of the same grid which overlap in space and levels qualify
+        grid = source_grid(a)
+        if source_grid(b).name != grid.name:
+            return []
+
+        extents = [source_extents(source, grid.srid) for source in (a, b)]
+        return [
+            tile for tile in dict.fromkeys(self._sample(a) + self._sample(b))
+            if tile[0] in source_levels(a) and tile[0] in source_levels(b)
+            and all(any(bbox_intersects(grid.tile_bbox(*tile), bbox) for bbox in bboxes) for bboxes in extents)
+        ]
+
+    def _hash(self, source: Source, tile: TileCoord) -> str | None:
+        key = (source.name, tile)
+        if key not in self._hashes:
+            try:
+                data = fetch_tile(self._client, source, *tile)
+            except requests.RequestException as e:
+                logging.warning('Failed to fetch tile %s/%s/%s of %s: %s', *tile, source.name, e)
+                data = None
+            self._hashes[key] = hashlib.sha1(data).hexdigest() if data else None
+        return self._hashes[key]
+
+    def same_content(self, a: Source, b: Source, min_matches: int = 4) -> bool:
+        tiles = self.shared_tiles(a, b)
+        if len(tiles) < min_matches:
+            return False
+
+        hashes = list(self._executor.map(lambda item: self._hash(*item),
+                                         [(source, tile) for tile in tiles for source in (a, b)]))
+
+        pairs = [(x, y) for x, y in zip(hashes[::2], hashes[1::2]) if x is not None and y is not None]
+        # blank and single color tiles look the same in every source,
+        # a sample of identical tiles tells nothing about the imagery
+        return len(pairs) >= min_matches and all(x == y for x, y in pairs) and len({x for x, _ in pairs}) > 1
+
+
+def _preference(source: Source) -> tuple:
+    # tiles are cheaper to seed than exports, and sources which
+    # answer well are the better ones to keep
+    status = source.health.status if source.health is not None else 'healthy'
+    return (
+        source.alias_of is not None,
+        ('healthy', 'degraded', 'unavailable').index(status),
+        source.type != 'tms',
+        source.created_at,
+        source.name,
+    )
+
+
+def find_duplicates(sources: Iterable[Source], fingerprints: ContentFingerprints | None = None,
+                    min_matches: int = 4) -> list[list[Source]]:
+    sources = list(sources)
+    parents = {source.name: source.name for source in sources}
+
+    def find(name: str) -> str:
+        while parents[name] != name:
+            parents[name] = parents[parents[name]]
+            name = parents[name]
+        return name
+
+    def union(a: str, b: str) -> None:
+        parents[find(a)] = find(b)
+
+    by_key: dict[str, str] = {}
+    for source in sources:
+        key = source_key(source)
+        if key in by_key:
+            union(source.name, by_key[key])
+        by_key.setdefault(key, source.name)
+        # an alias made earlier stays a duplicate of its source
+        if source.alias_of in parents:
+            union(source.name, source.alias_of)
+
+    if fingerprints is not None:
+        for a, b in candidate_pairs(sources):
+            if find(a.name) != find(b.name) and fingerprints.same_content(a, b, min_matches):
+                union(a.name, b.name)
+
+    clusters: dict[str, list[Source]] = {}
+    for source in sources:
+        clusters.setdefault(find(source.name), []).append(source)
+
+    # the source which is kept comes first
+    return [sorted(cluster, key=_preference) for cluster in clusters.values() if len(cluster) > 1]
@@ -3,12 +3,15 @@ import subprocess
 import sys
 from pathlib import Path
 
+from geoarchive import profiling
+
 
 def create_env(path: Path):
     logging.info('Creating environment')
-    subprocess.run([
-        sys.executable, '-m', 'venv', str(path / '.venv')
-    ], check=True)
+    with profiling.span('subprocess', 'venv'):
+        subprocess.run([
+            sys.executable, '-m', 'venv', str(path / '.venv')
+        ], check=True)
 
     logging.info('Installing dependencies')
     update_env(path)
@@ -22,10 +25,12 @@ def update_env(path: Path):
                    'importlib_resources',
                    'pyproj',
                    'setuptools',
-                   'requests')
+                   'requests',
+                   'gunicorn')
 
 
 def run_env_binary(path: Path, binary: str, *args) -> None:
-    subprocess.run([
-        str(path / '.venv' / 'bin' / binary), *args
-    ], check=True)
+    with profiling.span('subprocess', binary, args=' '.join(args)):
+        subprocess.run([
+            str(path / '.venv' / 'bin' / binary), *args
+        ], check=True)
@@ -0,0 +1,27 @@
+import hashlib
+import os
+from pathlib import Path
+
+
+def _digest(data: bytes) -> bytes:
+    return hashlib.sha256(data).digest()
+
+
+def write_if_changed(path: Path, data: str | bytes) -> bool:
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+
+    # an unchanged file is not touched, so its mtime stays the same
+    # and MapProxy does not reload a configuration which did not change
+    try:
+        if path.stat().st_size == len(data) and _digest(path.read_bytes()) == _digest(data):
+            return False
+    except FileNotFoundError:
+        pass
+
+    # write through a temporary file, so readers never see a partial file
+    tmp_path = path.with_name(f'.{path.name}.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return True
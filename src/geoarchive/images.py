@@ -0,0 +1,53 @@
+import struct
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+JPEG_SIGNATURE = b'\xff\xd8\xff'
+
+# colour types of PNG images with an alpha channel
+PNG_ALPHA_COLOR_TYPES = (4, 6)
+
+
+def image_format(data: bytes) -> str | None:
+    if data.startswith(PNG_SIGNATURE):
+        return 'png'
+    if data.startswith(JPEG_SIGNATURE):
+        return 'jpeg'
+    return None
+
+
+def _png_chunks(data: bytes):
+    position = len(PNG_SIGNATURE)
+    while position + 8 <= len(data):
+        length, kind = struct.unpack_from('>I4s', data, position)
+        yield kind, data[position + 8:position + 8 + length]
+        position += length + 12
+
+
+def has_alpha(data: bytes) -> bool:
+    # only the headers are read, a png with an alpha channel
+    # may still turn out to be fully opaque once decoded
+    if image_format(data) != 'png':
+        return False
+
+    for kind, chunk in _png_chunks(data):
+        if kind == b'IHDR' and chunk[9] in PNG_ALPHA_COLOR_TYPES:
+            return True
+        if kind == b'tRNS':
+            return True
+        if kind == b'IDAT':
+            return False
+    return False
+
+
+def detect_format(samples: list[bytes]) -> tuple[str | None, bool | None]:
+    formats = {image_format(sample) for sample in samples} - {None}
+    if not formats:
+        return None, None
+
+    transparent = any(has_alpha(sample) for sample in samples)
+    if formats == {'jpeg'}:
+        return 'jpeg', False
+    if formats == {'png'}:
+        return 'png', transparent
+    # jpeg where the tile is opaque and png at the edges of the data
+    return 'mixed', True
@@ -1,79 +1,359 @@
+import hashlib
+import json
+import logging
+import math
 from pathlib import Path
 from typing import Iterable
 
 import yaml
 
-from geoarchive.config import TMSSourceConfig, CacheConfig
+from geoarchive import profiling
+from geoarchive.__about__ import __version__
+from geoarchive.config import TMSSourceConfig, CacheConfig, CacheBackendConfig
+from geoarchive.files import write_if_changed
+from geoarchive.tiles import WEBMERCATOR, TileGrid, scheme_grid, scheme_name, source_grid, source_levels, transform_bbox
 
 
-def write_config(sources: Iterable[TMSSourceConfig], path: Path, additional_caches: list[CacheConfig] | None = None):
-    _write_config(path, sources, additional_caches)
-    _write_seeds(path, sources, additional_caches)
+def merged_seed_name(cache_name: str) -> str:
+    return f'merged-{cache_name}'
 
 
-def _write_config(path, configured_sources: Iterable[TMSSourceConfig], additional_caches: list[CacheConfig] | None = None):
-    sources = {}
+def is_seedable(source: TMSSourceConfig) -> bool:
+    return source.health is None or source.health.status != 'unavailable'
+
+
+def source_aliases(sources: Iterable[TMSSourceConfig]) -> dict[str, str]:
+    # a duplicate is served from the cache of the source it is an alias of,
+    # aliases of missing sources are ignored
+    sources = {source.name: source for source in sources}
+    aliases = {}
+    for name, source in sources.items():
+        seen = {name}
+        target = source.alias_of
+        while target in sources and target not in seen and sources[target].alias_of:
+            seen.add(target)
+            target = sources[target].alias_of
+        if target in sources and target not in seen:
+            aliases[name] = target
+    return aliases
+
+
+FRAGMENTS_DIR = 'conf.d'
+JPEG_QUALITY = 90
+WSGI_APP_FILE = 'wsgi.py'
+
+# the reloader rebuilds the app of every worker when mapproxy.yaml or one of
+# its base files gets a newer mtime, unchanged configs are never rewritten
+_WSGI_APP = '''\
+import os
+
+from mapproxy.wsgiapp import make_wsgi_app
+
+application = make_wsgi_app(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mapproxy.yaml'),
+                            reloader=True)
+'''
+
+_Dumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+
+class _ConfigDumper(_Dumper):
+    # the same coverage is used in several places, it has
+    # to be written out every time instead of as an alias
+    def ignore_aliases(self, data):
+        return True
+
+
+def dump_yaml(data: dict, name: str = '') -> str:
+    with profiling.span('yaml', name) as span:
+        text = yaml.dump(data, Dumper=_ConfigDumper, default_flow_style=False, allow_unicode=True)
+        span['bytes'] = len(text)
+    return text
+
+
+def write_config(sources: Iterable[TMSSourceConfig], path: Path, additional_caches: list[CacheConfig] | None = None,
+                 fingerprint: str | None = None, layout: str = 'single', force: bool = False):
+    # configs generated from the very same project are not built again
+    fingerprint_path = path / '.cache' / 'config.fingerprint'
+    fingerprint = fingerprint and f'{__version__}:{fingerprint}'
+    if not force and fingerprint and (path / 'mapproxy.yaml').exists() and (path / 'seeds.yaml').exists() \
+            and fingerprint_path.exists() and fingerprint_path.read_text() == fingerprint:
+        logging.info('Skip configs because the project is unchanged')
+        return
+
+    with profiling.span('config', 'build'):
+        config, seeds = build_config(list(sources), additional_caches or [])
+
+    writer = _ConfigWriter(path, force=force)
+    if layout == 'sharded':
+        config = _write_fragments(writer, config)
+    else:
+        _remove_fragments(path, keep=set())
+
+    for filename, data in (('mapproxy.yaml', config), ('seeds.yaml', seeds)):
+        if writer.write(filename, data):
+            logging.info('Written %s', filename)
+        else:
+            logging.info('Skip %s because it is unchanged', filename)
+    writer.save()
+
+    if fingerprint:
+        fingerprint_path.parent.mkdir(parents=True, exist_ok=True)
+        write_if_changed(fingerprint_path, fingerprint)
+
+
+def write_wsgi_app(path: Path) -> Path:
+    wsgi_path = path / WSGI_APP_FILE
+    write_if_changed(wsgi_path, _WSGI_APP)
+    return wsgi_path
+
+
+class _ConfigWriter:
+    def __init__(self, path: Path, force: bool = False):
+        self.path = path
+        self._digests_path = path / '.cache' / 'config-digests.json'
+        try:
+            self._digests = {} if force else json.loads(self._digests_path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._digests = {}
+
+    def write(self, filename: str, data: dict) -> bool:
+        # the dicts are compared instead of the dumped yaml, which is much
+        # cheaper for the large configs and fragments which did not change
+        digest = hashlib.md5(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+        if self._digests.get(filename) == digest and (self.path / filename).exists():
+            return False
+
+        (self.path / filename).parent.mkdir(parents=True, exist_ok=True)
+        self._digests[filename] = digest
+        return write_if_changed(self.path / filename, dump_yaml(data, filename))
+
+    def save(self) -> None:
+        self._digests = {
+            filename: digest for filename, digest in self._digests.items()
+            if (self.path / filename).exists()
+        }
+        self._digests_path.parent.mkdir(parents=True, exist_ok=True)
+        write_if_changed(self._digests_path, json.dumps(self._digests, sort_keys=True))
+
+
+def _write_fragments(writer: _ConfigWriter, config: dict) -> dict:
+    # every source with its cache goes into its own file, so a change
+    # of a single source only rewrites that file; the layers are kept in
+    # the root config, MapProxy merges layers from several files slowly
+    fragments = {}
+    source_caches = set()
+    for name, source in config['sources'].items():
+        source_caches.add(f'cache-{name}')
+        fragments[f'sources/{name}.yaml'] = dict(
+            sources={name: source},
+            caches={f'cache-{name}': config['caches'][f'cache-{name}']}
+        )
+
+    for name, cache in config['caches'].items():
+        if name not in source_caches:
+            fragments[f'caches/{name}.yaml'] = dict(
+                caches={name: cache}
+            )
+
+    written = sum(writer.write(f'{FRAGMENTS_DIR}/{filename}', fragment) for filename, fragment in fragments.items())
+    _remove_fragments(writer.path, keep=set(fragments))
+    logging.info('Written %s of %s config fragments', written, len(fragments))
+
+    return dict(
+        base=[f'{FRAGMENTS_DIR}/{filename}' for filename in fragments],
+        layers=config['layers'],
+        services=config['services'],
+        grids=config['grids']
+    )
+
+
+def _remove_fragments(path: Path, keep: set[str]) -> None:
+    fragments_dir = path / FRAGMENTS_DIR
+    if not fragments_dir.exists():
+        return
+
+    for filename in fragments_dir.glob('*/*.yaml'):
+        if filename.relative_to(fragments_dir).as_posix() not in keep:
+            filename.unlink()
+
+
+def _source_grids(configured_sources: Iterable[TMSSourceConfig]) -> dict[str, TileGrid]:
+    schemes = {}
     for layer in configured_sources:
-        if layer.type == 'tms':
-            configration = dict(
-                coverage=dict(
-                    bbox=list(layer.bounds),
-                    srs=layer.bounds_srid
-                ),
-                http=dict(
-                    ssl_no_cert_checks=True
-                ),
-                grid='GLOBAL_WEBMERCATOR',
-                type='tile',
+        if source_grid(layer) is not WEBMERCATOR:
+            schemes.setdefault(scheme_name(layer.tile_grid), []).append(layer)
+
+    # one grid per tiling scheme, large enough for all of its sources
+    grids = {}
+    for layers in schemes.values():
+        tile_grid = layers[0].tile_grid
+        grid = scheme_grid(tile_grid, [
+            transform_bbox(layer.bounds, layer.bounds_srid, tile_grid.srid) for layer in layers
+        ])
+        grids.update((layer.name, grid) for layer in layers)
+    return grids
+
+
+def _tile_url(url: str) -> str:
+    # MapProxy fills %(z)s style placeholders, a literal % has to be escaped
+    url = url.replace('%', '%%')
+    for placeholder in ('z', 'x', 'y'):
+        url = url.replace(f'{{{placeholder}}}', f'%({placeholder})s')
+    return url
+
+
+def _level_limit(grid: TileGrid, level: int, neighbour: int) -> float:
+    resolution = grid.resolutions[level]
+    if 0 <= neighbour < len(grid.resolutions):
+        return math.sqrt(resolution * grid.resolutions[neighbour])
+    # the first or last level of the grid, halfway to an imagined neighbour
+    return resolution * math.sqrt(2) if neighbour < level else resolution / math.sqrt(2)
+
+
+def grid_levels(source: TMSSourceConfig, grid: TileGrid) -> range:
+    # the levels of a native grid are numbered on its own resolutions,
+    # another grid is matched by the resolutions the source serves
+    own_grid = source_grid(source)
+    levels = source_levels(source)
+    if not levels:
+        return range(0)
+
+    min_res = _level_limit(own_grid, levels.start, levels.start - 1)
+    max_res = _level_limit(own_grid, levels.stop - 1, levels.stop)
+    if own_grid.srid != grid.srid:
+        # units differ between projections, they are scaled at the source
+        own_bbox = transform_bbox(source.bounds, source.bounds_srid, own_grid.srid)
+        bbox = transform_bbox(source.bounds, source.bounds_srid, grid.srid)
+        if own_bbox[2] > own_bbox[0] and bbox[2] > bbox[0]:
+            scale = (bbox[2] - bbox[0]) / (own_bbox[2] - own_bbox[0])
+            min_res, max_res = min_res * scale, max_res * scale
+
+    matching = [z for z, resolution in enumerate(grid.resolutions) if max_res < resolution <= min_res]
+    return range(matching[0], matching[-1] + 1) if matching else range(0)
+
+
+def merged_levels(grid: TileGrid, sources: Iterable[TMSSourceConfig]) -> range:
+    levels = [levels for levels in (grid_levels(source, grid) for source in sources) if levels]
+    if not levels:
+        return range(0)
+    return range(min(level.start for level in levels), max(level.stop for level in levels))
+
+
+def cache_grid(cache: CacheConfig, sources: Iterable[TMSSourceConfig]) -> TileGrid:
+    # seeding levels are given for the first grid of a merged cache
+    grids = {grid.name: grid for grid in _source_grids(sources).values()}
+    return grids.get(cache.grids[0], WEBMERCATOR) if cache.grids else WEBMERCATOR
+
+
+def _source_config(layer: TMSSourceConfig, grid: TileGrid, coverage: dict) -> dict:
+    if layer.type == 'tms':
+        configration = dict(
+            coverage=coverage,
+            http=dict(
+                ssl_no_cert_checks=True
+            ),
+            # tiles of a native grid are stored as they are,
+            # without reprojecting and resampling them
+            grid=grid.name if grid is not WEBMERCATOR else 'GLOBAL_WEBMERCATOR',
+            type='tile',
+            url=_tile_url(layer.url),
+            on_error={
+                404: dict(
+                    response='transparent',
+                    cache=True
+                )
+            }
+        )
+    elif layer.type == 'arcgis':
+        configration = dict(
+            coverage=coverage,
+            http=dict(
+                ssl_no_cert_checks=True
+            ),
+            image=dict(transparent=True),
+            supported_srs=[layer.bounds_srid],
+            type='arcgis',
+            req=dict(
                 url=layer.url,
-                on_error={
-                    404: dict(
-                        response='transparent',
-                        cache=True
-                    )
-                }
-            )
-        elif layer.type == 'arcgis':
-            configration = dict(
-                coverage=dict(
-                    bbox=list(layer.bounds),
-                    srs=layer.bounds_srid
-                ),
-                http=dict(
-                    ssl_no_cert_checks=True
-                ),
-                image=dict(transparent=True),
-                supported_srs=[layer.bounds_srid],
-                type='arcgis',
-                req=dict(
-                    url=layer.url,
-                    transparent=True,
-                ),
-                on_error={
-                    404: dict(
-                        response='transparent',
-                        cache=True
-                    )
-                }
+                transparent=True,
+            ),
+            on_error={
+                404: dict(
+                    response='transparent',
+                    cache=True
+                )
+            }
+        )
+
+        if layer.opts and layer.opts['layers']:
+            configration['req']['layers'] = layer.opts['layers']
+    else:
+        raise NotImplementedError("Unsupported layer %s" % layer.type)
+
+    # do not request levels the upstream does not serve, MapProxy compares
+    # the limits without tolerance, so they lie between two levels
+    levels = source_levels(layer)
+    if layer.min_level is not None:
+        configration['min_res'] = _level_limit(grid, levels.start, levels.start - 1)
+    if layer.max_level is not None:
+        configration['max_res'] = _level_limit(grid, levels.stop - 1, levels.stop)
+
+    return configration
+
+
+def build_config(configured_sources: list[TMSSourceConfig],
+                 additional_caches: list[CacheConfig]) -> tuple[dict, dict]:
+    source_grids = _source_grids(configured_sources)
+    aliases = source_aliases(configured_sources)
+
+    sources = {}
+    layers = []
+    caches = {}
+    seeds = {}
+    coverages = {}
+    source_configs = {}
+    for layer in configured_sources:
+        grid = source_grids.get(layer.name, WEBMERCATOR)
+        coverage = _coverage(layer)
+
+        layers.append(
+            dict(
+                name=layer.name,
+                sources=[
+                    f'cache-{aliases.get(layer.name, layer.name)}'
+                ],
+                title=layer.name
             )
+        )
+        coverages[layer.name] = coverage
+        source_configs[layer.name] = layer
 
-            if layer.opts and layer.opts['layers']:
-                configration['req']['layers'] = layer.opts['layers']
-        else:
-            raise NotImplementedError("Unsupported layer %s" % layer.type)
+        # duplicates get neither an upstream nor a cache of their own
+        if layer.name in aliases:
+            continue
 
-        sources[layer.name] = configration
+        sources[layer.name] = _source_config(layer, grid, coverage)
+        caches[f'cache-{layer.name}'] = dict(
+            **_cache_backend(layer.cache_backend),
+            **_image_options(layer.image_format),
+            grids=[grid.name],
+            sources=[layer.name]
+        )
+
+        # seeding a dead upstream only waits for timeouts, the
+        # cache still serves what was seeded before it went down
+        if not is_seedable(layer):
+            continue
 
-    layers = [
-        dict(
-            name=layer.name,
-            sources=[
+        seeds[layer.name] = dict(
+            caches=[
                 f'cache-{layer.name}'
             ],
-            title=layer.name
+            coverages=[
+                layer.name
+            ],
+            levels=_levels(source_levels(layer))
         )
-        for layer in configured_sources
-    ]
 
     for cache in additional_caches:
         layers.append(
@@ -85,23 +365,51 @@ def _write_config(path, configured_sources: Iterable[TMSSourceConfig], additiona
                 title=cache.name
             )
         )
+        cache_sources = [source_configs[source] for source in cache.sources if source in source_configs]
 
-    caches = {
-        f'cache-{layer.name}': dict(
-            cache=dict(type='compact', version=2),
-            grids=['webmercator'],
-            sources=[layer.name],
-            format='image/png'
+        # merged caches read tiles from the per-source caches,
+        # so building them does not hit the upstream servers again
+        caches[f'cache-merged-{cache.name}'] = dict(
+            **_cache_backend(cache.backend),
+            # tiles are composed of all sources, they stay opaque only if every source is
+            **_image_options('jpeg' if cache_sources and all(
+                source.image_format == 'jpeg' for source in cache_sources
+            ) else None),
+            grids=list(cache.grids),
+            sources=list(dict.fromkeys(f'cache-{aliases.get(source, source)}' for source in cache.sources))
         )
-        for layer in configured_sources
-    }
 
-    for cache in additional_caches:
-        caches[f'cache-merged-{cache.name}'] = dict(
-            cache=dict(type='compact', version=2),
-            grids=cache.grids,
-            sources=cache.sources,
-            format='image/png'
+        seeded_sources = [
+            source for source in cache_sources if is_seedable(source_configs[aliases.get(source.name, source.name)])
+        ]
+        levels = merged_levels(cache_grid(cache, configured_sources), seeded_sources)
+        if not seeded_sources or not levels:
+            continue
+
+        seeds[merged_seed_name(cache.name)] = dict(
+            caches=[
+                f'cache-merged-{cache.name}'
+            ],
+            coverages=[
+                merged_seed_name(cache.name)
+            ],
+            levels=_levels(levels)
+        )
+        coverages[merged_seed_name(cache.name)] = dict(
+            union=[coverages[source.name] for source in seeded_sources]
+        )
+
+    grids = dict(
+        webmercator=dict(base='GLOBAL_WEBMERCATOR')
+    )
+    for grid in source_grids.values():
+        grids[grid.name] = dict(
+            srs=grid.srid,
+            bbox=list(grid.bbox),
+            bbox_srs=grid.srid,
+            origin='nw',
+            res=list(grid.resolutions),
+            tile_size=list(grid.tile_size)
         )
 
     services = dict(
@@ -113,44 +421,66 @@ def _write_config(path, configured_sources: Iterable[TMSSourceConfig], additiona
         layers=layers,
         caches=caches,
         services=services,
-        grids=dict(
-            webmercator=dict(base='GLOBAL_WEBMERCATOR')
-        )
+        grids=grids
+    )
+    seeds = dict(
+        coverages=coverages,
+        seeds=seeds
     )
+    return config, seeds
 
-    with open(path / 'mapproxy.yaml', 'w') as f:
-        yaml.dump(config, f, default_flow_style=False, allow_unicode=True)
-    return sources
 
+def _cache_backend(backend: CacheBackendConfig | None) -> dict:
+    if backend is None or backend.type == 'compact':
+        return dict(cache=dict(type='compact', version=2))
+
+    if backend.type == 'file':
+        configuration = dict(cache=dict(type='file', directory_layout=backend.directory_layout))
+        if backend.link_single_color_images:
+            configuration['link_single_color_images'] = True
+        return configuration
+
+    if backend.type in ('sqlite', 'mbtiles'):
+        cache = dict(type=backend.type)
+        if backend.wal:
+            cache['sqlite_wal'] = True
+        return dict(cache=cache)
+
+    if backend.type == 'geopackage':
+        cache = dict(type='geopackage')
+        if backend.levels:
+            cache['levels'] = True
+        return dict(cache=cache)
+
+    raise NotImplementedError('Unsupported cache backend %s' % backend.type)
 
-def _write_seeds(path, configured_sources: Iterable[TMSSourceConfig], additional_caches: list[CacheConfig] | None = None):
-    seeds = {
-        layer.name: dict(
-            caches=[
-                f'cache-{layer.name}'
-            ],
-            coverages=[
-                layer.name
-            ],
-            levels=dict(
-                to=18
-            )
-        )
-        for layer in configured_sources
-    }
 
-    # todo: seeds for additional_caches?
+def _image_options(image_format: str | None) -> dict:
+    # tiles of a cache in the upstream format are stored as they
+    # arrive, the encoding options apply to merged and mixed tiles
+    if image_format == 'jpeg':
+        return dict(format='image/jpeg', image=dict(encoding_options=dict(jpeg_quality=JPEG_QUALITY)))
+    if image_format == 'mixed':
+        return dict(format='mixed', request_format='image/png',
+                    image=dict(transparent=True, encoding_options=dict(jpeg_quality=JPEG_QUALITY)))
+    return dict(format='image/png')
 
-    coverages = {
-        layer.name: dict(
-            bbox=list(layer.bounds),
-            srs=layer.bounds_srid
+
+def _levels(levels: range) -> dict:
+    if levels.start == 0:
+        return dict(to=levels.stop - 1)
+    return {'from': levels.start, 'to': levels.stop - 1}
+
+
+def _coverage(layer: TMSSourceConfig) -> dict:
+    if layer.coverage:
+        # scattered data is covered by several boxes instead of one
+        # large extent, so the empty space between them is not seeded
+        return dict(
+            union=[dict(bbox=list(bbox), srs=layer.bounds_srid) for bbox in layer.coverage]
         )
-        for layer in configured_sources
-    }
-    seeds = dict(
-        coverages=coverages,
-        seeds=seeds
+
+    return dict(
+        bbox=list(layer.bounds),
+        srs=layer.bounds_srid
     )
-    with open(path / 'seeds.yaml', 'w', encoding='utf-8') as f:
-        yaml.dump(seeds, f, default_flow_style=False, allow_unicode=True)
@@ -0,0 +1,115 @@
+import contextlib
+import dataclasses
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Iterator
+
+
+@dataclasses.dataclass
+class Span:
+    kind: str
+    name: str
+    started: float
+    elapsed: float = 0.0
+    attrs: dict = dataclasses.field(default_factory=dict)
+
+
+# spans of these kinds are named after a url or file, they
+# are summarized per kind instead of per name
+_GROUPED_KINDS = ('http', 'yaml')
+
+
+def _stage(span: Span) -> str:
+    return span.kind if span.kind in _GROUPED_KINDS else f'{span.kind}:{span.name}'
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * q / 100))]
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.spans: list[Span] = []
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+
+    def enable(self) -> None:
+        self.enabled = True
+        self._started = time.perf_counter()
+
+    @contextlib.contextmanager
+    def span(self, kind: str, name: str, **attrs) -> Iterator[dict]:
+        # attributes known only at the end, like the response status,
+        # are added to the yielded dict by the instrumented code
+        if not self.enabled:
+            yield attrs
+            return
+
+        span = Span(kind=kind, name=name, started=time.perf_counter() - self._started, attrs=attrs)
+        started = time.perf_counter()
+        try:
+            yield span.attrs
+        except BaseException as e:
+            span.attrs['error'] = type(e).__name__
+            raise
+        finally:
+            span.elapsed = time.perf_counter() - started
+            with self._lock:
+                self.spans.append(span)
+
+    def summary(self, slowest: int = 10) -> str:
+        lines = []
+
+        stages: dict[str, list[Span]] = {}
+        for span in self.spans:
+            stages.setdefault(_stage(span), []).append(span)
+
+        lines.append(f'{"stage":<24} {"count":>7} {"total":>9} {"p50":>9} {"p95":>9} {"max":>9}')
+        for stage, spans in sorted(stages.items()):
+            elapsed = [span.elapsed for span in spans]
+            lines.append(f'{stage:<24} {len(spans):>7} {sum(elapsed):>8.2f}s {percentile(elapsed, 50):>8.3f}s '
+                         f'{percentile(elapsed, 95):>8.3f}s {max(elapsed):>8.3f}s')
+
+        hosts: dict[str, list[Span]] = {}
+        for span in stages.get('http', []):
+            hosts.setdefault(span.attrs.get('host', ''), []).append(span)
+
+        if hosts:
+            lines.append('')
+            lines.append(f'{"host":<40} {"requests":>8} {"errors":>6} {"bytes":>11} '
+                         f'{"p50":>8} {"p95":>8} {"p99":>8}')
+            for host, spans in sorted(hosts.items(), key=lambda item: -sum(span.elapsed for span in item[1])):
+                elapsed = [span.elapsed for span in spans]
+                errors = sum(1 for span in spans if 'error' in span.attrs or span.attrs.get('status', 200) >= 400)
+                size = sum(span.attrs.get('bytes', 0) for span in spans)
+                lines.append(f'{host:<40} {len(spans):>8} {errors:>6} {size:>11} {percentile(elapsed, 50):>7.3f}s '
+                             f'{percentile(elapsed, 95):>7.3f}s {percentile(elapsed, 99):>7.3f}s')
+
+        if self.spans:
+            lines.append('')
+            lines.append('Slowest calls:')
+            for span in sorted(self.spans, key=lambda span: -span.elapsed)[:slowest]:
+                attrs = ' '.join(f'{key}={value}' for key, value in span.attrs.items() if key != 'host')
+                lines.append(f'{span.elapsed:>8.3f}s {span.kind:<10} {span.name} {attrs}'.rstrip())
+
+        return '\n'.join(lines)
+
+    def dump_json(self, path: Path) -> None:
+        path.write_text(json.dumps([dataclasses.asdict(span) for span in self.spans], indent=2, default=str))
+
+
+_profiler = Profiler()
+
+
+def get_profiler() -> Profiler:
+    return _profiler
+
+
+def span(kind: str, name: str, **attrs):
+    return _profiler.span(kind, name, **attrs)
@@ -1,14 +1,17 @@
+import hashlib
 import logging
+from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Self
 
-from geoarchive import environment, mapproxy
+from geoarchive import environment, mapproxy, profiling
 from geoarchive.config import (
     ProjectConfig,
     TMSSourceConfig,
     ArcgisSourceConfig,
-    ProjectConfigDynamic, CacheConfig
+    ProjectConfigDynamic, CacheConfig, CatalogConfig, CacheBackendConfig
 )
+from geoarchive.files import write_if_changed
 from geoarchive.services.base import Layer
 
 
@@ -18,28 +21,74 @@ class Project(object):
     def __init__(self, config: ProjectConfig | None = None):
         self._config = config or ProjectConfig()
 
-    def add_source(self, layer: Layer) -> None:
-        exiting_layer = self._config.sources.get(layer.name)
+    # fields of a source which are taken from the upstream catalog
+    _REFRESHED_FIELDS = ('type', 'url', 'bounds', 'bounds_srid', 'coverage', 'opts', 'min_level', 'max_level', 'tile_grid',
+                         'image_format', 'transparent')
+
+    def add_source(self, layer: Layer, catalog: CatalogConfig | None = None,
+                   refresh_interval: int | None = None) -> None:
+        if layer.name in self._config.sources:
+            # a re-import takes what the catalog says, the schedule, health,
+            # cache backend and alias set on the source are kept
+            logging.info('Layer %s exists, refreshing', layer.name)
+            self.refresh_source(layer)
+            source = self._config.sources[layer.name]
+            if catalog is not None:
+                source.catalog = catalog
+            if refresh_interval is not None:
+                source.refresh_interval = refresh_interval
+            return
 
         logging.info('Layer %s does not exists, adding new', layer.name)
+        source = self._make_source(layer, catalog=catalog, refresh_interval=refresh_interval)
+        self._config.sources[source.name] = source
+
+    @classmethod
+    def _make_source(cls, layer: Layer, **kwargs) -> TMSSourceConfig | ArcgisSourceConfig:
         if layer.type == 'tms':
-            source = TMSSourceConfig(
-                name=layer.name, type=layer.type,
-                url=layer.url, bounds=layer.bounds,
-                bounds_srid=layer.bounds_srid,
-                opts=layer.opts
-            )
+            source_class = TMSSourceConfig
         elif layer.type == 'arcgis':
-            source = ArcgisSourceConfig(
-                name=layer.name, type=layer.type,
-                url=layer.url, bounds=layer.bounds,
-                bounds_srid=layer.bounds_srid,
-                opts=layer.opts
-            )
+            source_class = ArcgisSourceConfig
         else:
             raise NotImplementedError('Unsupported layer %s' % layer.type)
 
-        self._config.sources[source.name] = source
+        fields = {field: getattr(layer, field) for field in cls._REFRESHED_FIELDS}
+        return source_class(name=layer.name, **fields, **kwargs)
+
+    def refresh_source(self, layer: Layer) -> dict[str, tuple]:
+        source = self._config.sources[layer.name]
+        # a format probed from sample tiles is kept, most catalogs do not list it
+        if layer.image_format is None:
+            layer = layer.model_copy(update=dict(image_format=source.image_format, transparent=source.transparent))
+        refreshed = self._make_source(
+            layer,
+            created_at=source.created_at,
+            cached_at=datetime.now(),
+            refresh_interval=source.refresh_interval,
+            cache_backend=source.cache_backend,
+            health=source.health,
+            alias_of=source.alias_of,
+            catalog=source.catalog
+        )
+
+        changes = {
+            field: (getattr(source, field), getattr(refreshed, field))
+            for field in self._REFRESHED_FIELDS
+            if getattr(source, field) != getattr(refreshed, field)
+        }
+        if changes:
+            logging.info('Source %s changed upstream: %s', layer.name, ', '.join(changes))
+
+        self._config.sources[layer.name] = refreshed
+        return changes
+
+    def get_expired_sources(self, now: datetime | None = None) -> list[TMSSourceConfig | ArcgisSourceConfig]:
+        now = now or datetime.now()
+        return [
+            source for source in self._config.sources.values()
+            if source.refresh_interval is not None
+            and (source.cached_at or source.created_at) + timedelta(seconds=source.refresh_interval) <= now
+        ]
 
     def get_sources(self) -> dict[str, TMSSourceConfig]:
         return self._config.sources
@@ -48,7 +97,32 @@ class Project(object):
         return self._config.caches
 
     def remove_source(self, name: str):
-        ...
+        del self._config.sources[name]
+        for source in self._config.sources.values():
+            if source.alias_of == name:
+                source.alias_of = None
+
+        for cache in self._config.caches.values():
+            if name in cache.sources:
+                cache.sources.remove(name)
+
+    def set_alias(self, name: str, alias_of: str | None) -> None:
+        sources = self.get_sources()
+        if alias_of is not None:
+            if alias_of not in sources:
+                raise FileNotFoundError('Layer `%s` does not exist' % alias_of)
+            # aliases always point at a source with a cache of its own
+            if sources[alias_of].alias_of != name:
+                alias_of = sources[alias_of].alias_of or alias_of
+        if alias_of is not None and alias_of != name:
+            # sources aliased to this one follow it to the other cache
+            for source in sources.values():
+                if source.alias_of == name:
+                    source.alias_of = alias_of if source.name != alias_of else None
+        else:
+            alias_of = None
+
+        sources[name].alias_of = alias_of
 
     def add_cache(self, cache_id: str, base_layers: list[str]) -> None:
         project_sources = self.get_sources()
@@ -62,20 +136,37 @@ class Project(object):
     def remove_cache(self, cache_id: str):
         del self._config.caches[cache_id]
 
+    def set_source_backend(self, name: str, backend: CacheBackendConfig | None) -> None:
+        self._config.sources[name].cache_backend = backend
+
+    def set_cache_backend(self, cache_id: str, backend: CacheBackendConfig | None) -> None:
+        self._config.caches[cache_id].backend = backend
+
     @property
     def name(self) -> str:
         return self._config.name
 
-    def save(self, path: Path):
-        logging.info('Saving project %s', path)
-        with open(path / self._CONFIG_FILE, 'w') as f:
-            f.write(self._config.model_dump_json(indent=2))
+    @property
+    def config_layout(self) -> str:
+        return self._config.config_layout
 
-        mapproxy.write_config(
-            self._config.sources.values(),
-            path,
-            additional_caches=list(self._config.caches.values())
-        )
+    def set_config_layout(self, layout: str) -> None:
+        self._config.config_layout = layout
+
+    def save(self, path: Path, force: bool = False):
+        logging.info('Saving project %s', path)
+        with profiling.span('config', 'save', path=str(path)):
+            data = self._config.model_dump_json(indent=2)
+            write_if_changed(path / self._CONFIG_FILE, data)
+
+            mapproxy.write_config(
+                self._config.sources.values(),
+                path,
+                additional_caches=list(self._config.caches.values()),
+                fingerprint=hashlib.sha256(data.encode()).hexdigest(),
+                layout=self._config.config_layout,
+                force=force
+            )
 
     @classmethod
     def load(cls, path: Path) -> Self:
@@ -84,7 +175,11 @@ class Project(object):
         if not config_file.exists():
             raise FileNotFoundError(config_file)
 
-        configuration = ProjectConfigDynamic.validate_json(config_file.read_text())
+        with profiling.span('config', 'read', path=str(config_file)):
+            data = config_file.read_text()
+        with profiling.span('config', 'validate') as span:
+            configuration = ProjectConfigDynamic.validate_json(data)
+            span['sources'] = len(configuration.sources)
         # loop while we can upgrade config to never version
         while upgraded := configuration.upgrade():
             configuration = upgraded
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import threading
+import urllib.parse
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, NamedTuple
+
+import yaml
+
+from geoarchive.config import TMSSourceConfig, ArcgisSourceConfig, CacheConfig
+from geoarchive.mapproxy import cache_grid, grid_levels, merged_seed_name, source_aliases
+from geoarchive.seeding import count_source_tiles
+from geoarchive.tiles import DEFAULT_MAX_LEVEL
+
+
+class SeedTask(NamedTuple):
+    name: str
+    host: str | None
+    tiles: int
+    fingerprint: str
+    depends: tuple[str, ...] = ()
+    degraded: bool = False
+
+
+def load_seed_tasks(path: Path, sources: dict[str, TMSSourceConfig | ArcgisSourceConfig],
+                    caches: dict[str, CacheConfig] | None = None) -> list[SeedTask]:
+    merged_caches = {
+        merged_seed_name(cache.name): cache
+        for cache in (caches or {}).values()
+    }
+
+    aliases = source_aliases(sources.values())
+
+    with open(path / 'seeds.yaml', encoding='utf-8') as f:
+        seeds = yaml.safe_load(f)
+
+    tasks = []
+    for name, seed in seeds['seeds'].items():
+        coverages = {coverage: seeds['coverages'].get(coverage) for coverage in seed.get('coverages', [])}
+        fingerprint = hashlib.md5(
+            json.dumps([seed, coverages], sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+        levels = range(seed['levels'].get('from', 0), seed['levels'].get('to', DEFAULT_MAX_LEVEL) + 1)
+        source = sources.get(name)
+        if source is not None:
+            host = urllib.parse.urlparse(source.url).netloc
+            tiles = sum(count_source_tiles(source, levels).values())
+            depends = ()
+            degraded = source.health is not None and source.health.status == 'degraded'
+        elif name in merged_caches:
+            # merged caches are built from the per-source caches, so they are
+            # seeded after all of their sources which are seeded at all
+            depends = tuple(dict.fromkeys(
+                aliases.get(source, source) for source in merged_caches[name].sources
+                if source in sources and aliases.get(source, source) in seeds['seeds']
+            ))
+            degraded = False
+            host = None
+            # the merged tiles are counted on the grid of the merged cache
+            grid = cache_grid(merged_caches[name], sources.values())
+            tiles = sum(
+                sum(count_source_tiles(sources[source], grid_levels(sources[source], grid), grid).values())
+                for source in depends
+            )
+        else:
+            host, tiles, depends, degraded = None, 0, (), False
+
+        tasks.append(SeedTask(name=name, host=host, tiles=tiles, fingerprint=fingerprint, depends=depends,
+                              degraded=degraded))
+
+    # the largest tasks go first, so they do not end up alone at the tail,
+    # slow and flaky sources get the time which is left after the healthy ones
+    return sorted(tasks, key=lambda task: (task.degraded, -task.tiles))
+
+
+class SeedState:
+    def __init__(self, path: Path):
+        self._path = path
+        self._lock = threading.Lock()
+        try:
+            self._completed = json.loads(path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._completed = {}
+
+    def is_completed(self, task: SeedTask) -> bool:
+        state = self._completed.get(task.name)
+        return state is not None and state['fingerprint'] == task.fingerprint
+
+    def is_name_completed(self, name: str) -> bool:
+        return name in self._completed
+
+    def complete(self, task: SeedTask) -> None:
+        with self._lock:
+            self._completed[task.name] = dict(
+                fingerprint=task.fingerprint,
+                completed_at=datetime.now().isoformat()
+            )
+            self._save()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._completed = {}
+            self._save()
+
+    def _save(self) -> None:
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps(self._completed, indent=2))
+        os.replace(tmp_path, self._path)
+
+
+class SeedScheduler:
+    def __init__(self, state: SeedState, jobs: int = 4, per_host: int | None = None):
+        self._state = state
+        self._jobs = jobs
+        self._per_host = per_host
+
+    def run(self, tasks: list[SeedTask], run_task: Callable[[SeedTask], None]) -> list[SeedTask]:
+        queue = []
+        for task in tasks:
+            if self._state.is_completed(task):
+                logging.info('Skip seed %s because it is already completed', task.name)
+                continue
+            queue.append(task)
+
+        failed = []
+        running: dict[Future, SeedTask] = {}
+        hosts: dict[str | None, int] = {}
+        pending_names = {task.name for task in queue}
+
+        with ThreadPoolExecutor(max_workers=self._jobs) as executor:
+            while queue or running:
+                for task in list(queue):
+                    failed_dependencies = [
+                        dependency for dependency in task.depends
+                        if dependency in {failed_task.name for failed_task in failed}
+                    ]
+                    if failed_dependencies:
+                        logging.error('Skip seed %s because %s failed', task.name, ', '.join(failed_dependencies))
+                        queue.remove(task)
+                        failed.append(task)
+
+                # start every task that fits into the global and per-host budgets
+                for task in list(queue):
+                    if len(running) >= self._jobs:
+                        break
+                    if any(dependency in pending_names or not self._state.is_name_completed(dependency)
+                           for dependency in task.depends):
+                        continue
+                    if self._per_host is not None and task.host is not None \
+                            and hosts.get(task.host, 0) >= self._per_host:
+                        continue
+
+                    queue.remove(task)
+                    hosts[task.host] = hosts.get(task.host, 0) + 1
+                    logging.info('Starting seed %s (~%s tiles)', task.name, task.tiles)
+                    running[executor.submit(run_task, task)] = task
+
+                if not running:
+                    # the remaining tasks depend on seeds which will never complete
+                    for task in queue:
+                        logging.error('Skip seed %s because its sources were not seeded', task.name)
+                    failed.extend(queue)
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    hosts[task.host] -= 1
+                    pending_names.discard(task.name)
+                    try:
+                        future.result()
+                    # a missing or unrunnable mapproxy-seed fails only this task,
+                    # the running ones are still drained and recorded
+                    except (subprocess.CalledProcessError, OSError) as e:
+                        logging.error('Seed %s failed: %s', task.name, e)
+                        failed.append(task)
+                        continue
+
+                    logging.info('Finished seed %s', task.name)
+                    self._state.complete(task)
+
+        return failed
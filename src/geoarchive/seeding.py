@@ -0,0 +1,240 @@
+import dataclasses
+import logging
+import math
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Iterator
+
+import requests
+
+from geoarchive.config import TMSSourceConfig, ArcgisSourceConfig, SourceHealth
+from geoarchive.images import detect_format
+from geoarchive.profiling import percentile
+from geoarchive.services.client import HttpClient
+from geoarchive.storage import open_storage
+from geoarchive.tiles import TileCoord, TileGrid, source_extents, source_grid, source_levels
+
+PROBE_LEVEL = 12
+
+
+def tile_request(source: TMSSourceConfig | ArcgisSourceConfig, z: int, x: int, y: int,
+                 grid: TileGrid | None = None) -> tuple[str, dict | None]:
+    grid = grid or source_grid(source)
+    if source.type == 'tms':
+        return source.url.format(z=z, x=x, y=y), None
+
+    if source.type == 'arcgis':
+        srid = grid.srid.split(':')[-1]
+        params = dict(
+            bbox=','.join(map(str, grid.tile_bbox(z, x, y))),
+            bboxSR=srid,
+            imageSR=srid,
+            size='%d,%d' % grid.tile_size,
+            format='png',
+            transparent='true',
+            f='image',
+        )
+        if source.opts and source.opts.get('layers'):
+            params['layers'] = source.opts['layers']
+        return f'{source.url}/export', params
+
+    raise NotImplementedError('Unsupported layer %s' % source.type)
+
+
+def fetch_tile(client: HttpClient, source: TMSSourceConfig | ArcgisSourceConfig,
+               z: int, x: int, y: int, grid: TileGrid | None = None) -> bytes | None:
+    url, params = tile_request(source, z, x, y, grid=grid)
+    try:
+        return client.get(url, params=params, cache=False).content
+    except requests.HTTPError as e:
+        if e.response is not None and e.response.status_code == 404:
+            return None
+        raise
+
+
+def iter_source_tiles(source: TMSSourceConfig | ArcgisSourceConfig, levels: range,
+                      grid: TileGrid | None = None) -> Iterator[TileCoord]:
+    grid = grid or source_grid(source)
+    bboxes = source_extents(source, grid.srid)
+    for z in levels:
+        yield from grid.iter_tiles_union(bboxes, z)
+
+
+def count_source_tiles(source: TMSSourceConfig | ArcgisSourceConfig, levels: range,
+                       grid: TileGrid | None = None) -> dict[int, int]:
+    grid = grid or source_grid(source)
+    bboxes = source_extents(source, grid.srid)
+    return {z: grid.count_tiles_union(bboxes, z) for z in levels}
+
+
+def sample_tiles(source: TMSSourceConfig | ArcgisSourceConfig, count: int, level: int,
+                 grid: TileGrid | None = None) -> list[TileCoord]:
+    grid = grid or source_grid(source)
+    tile_ranges = [
+        tile_range for tile_range in (grid.tile_range(bbox, level) for bbox in source_extents(source, grid.srid))
+        if tile_range is not None
+    ]
+    if not tile_ranges:
+        return []
+
+    # the same source always gets the same sample
+    generator = random.Random(source.name)
+    weights = [(x1 - x0 + 1) * (y1 - y0 + 1) for x0, y0, x1, y1 in tile_ranges]
+    sample = []
+    for x0, y0, x1, y1 in generator.choices(tile_ranges, weights=weights, k=count):
+        sample.append((level, generator.randint(x0, x1), generator.randint(y0, y1)))
+    return sample
+
+
+@dataclasses.dataclass
+class TileProbe:
+    elapsed: float
+    data: bytes | None = None
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def probe_tiles(client: HttpClient, source: TMSSourceConfig | ArcgisSourceConfig,
+                count: int = 8) -> list[TileProbe]:
+    # the top levels of regional sources are mostly empty,
+    # tiles of a middle level hit the data more often
+    levels = source_levels(source)
+    level = min(max(levels.start, PROBE_LEVEL), levels.stop - 1)
+
+    def fetch(tile: TileCoord) -> TileProbe:
+        started = time.perf_counter()
+        try:
+            data = fetch_tile(client, source, *tile)
+        except requests.RequestException as e:
+            logging.warning('Failed to probe tile %s/%s/%s of %s: %s', *tile, source.name, e)
+            return TileProbe(elapsed=time.perf_counter() - started, error=type(e).__name__)
+        return TileProbe(elapsed=time.perf_counter() - started, data=data)
+
+    with ThreadPoolExecutor(max_workers=count) as executor:
+        return list(executor.map(fetch, sample_tiles(source, count, level)))
+
+
+def probe_image_format(client: HttpClient, source: TMSSourceConfig | ArcgisSourceConfig,
+                       count: int = 8) -> tuple[str | None, bool | None]:
+    return detect_format([probe.data for probe in probe_tiles(client, source, count) if probe.data])
+
+
+def source_health(probes: list[TileProbe], slow: float = 5.0, min_availability: float = 0.9) -> SourceHealth:
+    # missing tiles count as answered, the upstream responded with a 404
+    answered = [probe for probe in probes if probe.ok]
+    availability = len(answered) / len(probes) if probes else 0.0
+    if not answered:
+        return SourceHealth(status='unavailable', requests=len(probes), availability=availability)
+
+    # a probe takes a few samples, the failures allowed are rounded up
+    # so that a single lost request doesn't degrade a source on its own
+    allowed_failures = math.ceil(round(len(probes) * (1 - min_availability), 9))
+    available = len(probes) - len(answered) <= allowed_failures
+
+    elapsed = [probe.elapsed for probe in answered]
+    p95 = percentile(elapsed, 95)
+    return SourceHealth(
+        status='healthy' if available and p95 <= slow else 'degraded',
+        requests=len(probes),
+        availability=availability,
+        p50=percentile(elapsed, 50),
+        p95=p95,
+        bytes_per_second=sum(len(probe.data or b'') for probe in answered) / max(sum(elapsed), 1e-9),
+    )
+
+
+@dataclasses.dataclass
+class SeedStats:
+    tiles: int = 0
+    skipped: int = 0
+    missing: int = 0
+    errors: int = 0
+    bytes: int = 0
+    started: float = dataclasses.field(default_factory=time.perf_counter)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    @property
+    def tiles_per_second(self) -> float:
+        return self.tiles / max(self.elapsed, 1e-9)
+
+    def summary(self) -> str:
+        return 'tiles=%s skipped=%s missing=%s errors=%s size=%.1fMB rate=%.1f tiles/s %.2f MB/s' % (
+            self.tiles, self.skipped, self.missing, self.errors, self.bytes / 1024 / 1024,
+            self.tiles_per_second, self.bytes / 1024 / 1024 / max(self.elapsed, 1e-9))
+
+
+class Seeder:
+    def __init__(self, path: Path, client: HttpClient, workers: int = 16,
+                 report_interval: float = 10):
+        self._path = path
+        self._client = client
+        self._workers = workers
+        self._report_interval = report_interval
+
+    def seed(self, source: TMSSourceConfig | ArcgisSourceConfig, levels: range | None = None) -> SeedStats:
+        levels = levels or source_levels(source)
+        stats = SeedStats()
+        # min_level above max_level, or a native grid without the levels asked for
+        if not levels:
+            logging.warning('Skip source %s because it has no levels to seed', source.name)
+            return stats
+
+        grid = source_grid(source)
+        storage = open_storage(self._path, f'cache-{source.name}', grid, source.cache_backend, source.image_format)
+
+        logging.info('Seeding source %s levels %s-%s', source.name, levels.start, levels.stop - 1)
+        last_report = time.perf_counter()
+        pending: dict[Future, TileCoord] = {}
+
+        def drain(return_when):
+            done, _ = wait(pending, return_when=return_when)
+            for future in done:
+                z, x, y = pending.pop(future)
+                try:
+                    data = future.result()
+                except requests.RequestException as e:
+                    logging.warning('Failed to fetch tile %s/%s/%s of %s: %s', z, x, y, source.name, e)
+                    stats.errors += 1
+                    continue
+
+                if data is None:
+                    stats.missing += 1
+                    continue
+
+                storage.store(z, x, y, data)
+                stats.tiles += 1
+                stats.bytes += len(data)
+
+        try:
+            with ThreadPoolExecutor(max_workers=self._workers) as executor:
+                for z, x, y in iter_source_tiles(source, levels, grid):
+                    if storage.exists(z, x, y):
+                        stats.skipped += 1
+                        continue
+
+                    future = executor.submit(fetch_tile, self._client, source, z, x, y, grid)
+                    pending[future] = (z, x, y)
+
+                    # keep a bounded number of requests in flight
+                    if len(pending) >= self._workers * 4:
+                        drain(FIRST_COMPLETED)
+
+                    if time.perf_counter() - last_report >= self._report_interval:
+                        logging.info('Seeding %s: %s', source.name, stats.summary())
+                        last_report = time.perf_counter()
+
+                while pending:
+                    drain(FIRST_COMPLETED)
+        finally:
+            storage.close()
+
+        logging.info('Seeded %s: %s', source.name, stats.summary())
+        return stats
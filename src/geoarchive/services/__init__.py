@@ -3,6 +3,7 @@ from . import softpro_legacy
 from . import arcgis
 from . import arcgis_layers
 from .base import ServiceProtocol
+from .client import HttpClient
 
 _services = {
     'arcgis': arcgis.ArcGisProtocol,
@@ -12,8 +13,13 @@ _services = {
 }
 
 
-def get_service_protocol(type: str, url: str) -> ServiceProtocol:
+def get_service_types() -> list[str]:
+    return list(_services)
+
+
+def get_service_protocol(type: str, url: str,
+                         client: HttpClient | None = None, max_workers: int = 1) -> ServiceProtocol:
     service = _services.get(type)
     assert service is not None, "Service type '{}' not found".format(type)
 
-    return service(url)
+    return service(url, client=client, max_workers=max_workers)
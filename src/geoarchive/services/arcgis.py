@@ -1,12 +1,16 @@
 import logging
 import urllib.parse
-import warnings
-from typing import TypedDict, Literal, NotRequired
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TypedDict, Literal, NotRequired, NamedTuple, Iterator, Sequence
 
 import requests
+from pyproj.exceptions import CRSError
 from slugify import slugify
 
+from geoarchive.config import TileGridConfig
 from geoarchive.services.base import Layer, ServiceProtocol
+from geoarchive.services.client import HttpClient, default_client
+from geoarchive.tiles import coverage_from_extents, transform_bbox
 
 
 class ArcGisService(TypedDict):
@@ -25,8 +29,24 @@ class Lod(TypedDict):
     scale: float
 
 
+class TileOrigin(TypedDict):
+    x: float
+    y: float
+
+
+class SpatialReference(TypedDict):
+    wkid: NotRequired[int]
+    latestWkid: NotRequired[int]
+    wkt: NotRequired[str]
+
+
 class TileInfo(TypedDict):
+    rows: int
+    cols: int
+    origin: TileOrigin
+    spatialReference: SpatialReference
     lods: list[Lod]
+    format: str
 
 
 class ExtentInfo(TypedDict):
@@ -34,116 +54,234 @@ class ExtentInfo(TypedDict):
     ymin: float
     xmax: float
     ymax: float
+    spatialReference: SpatialReference
+
+
+class LayerListItem(TypedDict):
+    id: int
+    name: str
+    subLayerIds: NotRequired[list[int] | None]
+
+
+class LayerResponse(TypedDict):
+    id: int
+    name: str
+    extent: NotRequired[ExtentInfo]
+    subLayers: NotRequired[list[dict]]
 
 
 class MapServiceResponse(TypedDict):
     serviceDescription: str
-    tileInfo: NotRequired[dict]
+    tileInfo: NotRequired[TileInfo]
+    layers: NotRequired[list[LayerListItem]]
 
     fullExtent: ExtentInfo
 
-    minLOD: int
-    maxLOD: int
+    minLOD: NotRequired[int]
+    maxLOD: NotRequired[int]
+
+
+def build_coverage(extents: list[ExtentInfo], bounds: tuple[float, float, float, float],
+                   srid: str) -> list[tuple[float, float, float, float]] | None:
+    bboxes = []
+    for extent in extents:
+        if not extent.get('spatialReference', {}).get('wkid'):
+            return None
+
+        try:
+            bboxes.append(transform_bbox(
+                (extent['xmin'], extent['ymin'], extent['xmax'], extent['ymax']),
+                f"EPSG:{extent['spatialReference']['wkid']}", srid
+            ))
+        except CRSError:
+            return None
+
+    return coverage_from_extents(bboxes, bounds)
+
+
+class _FolderNode(NamedTuple):
+    folders: list[Future]
+    services: list[tuple[ArcGisService, Future]]
 
 
 class ArcGisProtocol(ServiceProtocol):
-    def __init__(self, url: str):
+    def __init__(self, url: str, client: HttpClient | None = None, max_workers: int = 1):
         self._url = url
         self._url_parts = urllib.parse.urlparse(self._url)
 
-    def _traverse_folders(self, url: str, folders: list[str]):
-        for folder in folders:
-            logging.info('Traversing folder: %s', folder)
+        self._client = client or default_client()
+        self._max_workers = max_workers
 
-            folder_url = url + '/' + folder
-            try:
-                response = self._request_folder(folder_url)
-            except PermissionError:
-                logging.warning('Skip folder %s because of permission error', folder)
+    def _expand_folder(self, executor: ThreadPoolExecutor, response: FolderResponse) -> _FolderNode:
+        # subfolders and services are requested as soon as their parent
+        # folder is known, so the tree is expanded breadth-first
+        folders = [
+            executor.submit(self._expand_subfolder, executor, folder)
+            for folder in response['folders']
+        ]
+
+        services = []
+        for service in response['services']:
+            if service['type'] != 'MapServer':
+                logging.info('Skip layer %s because of type %s', service['name'], service['type'])
                 continue
 
-            yield from self._collect_services(folder_url, response)
+            service = ArcGisService(**service)
+            services.append((service, executor.submit(self._try_request_service, service)))
 
-    def _collect_services(self, url: str, response: FolderResponse):
-        yield from self._traverse_folders(self._url, response['folders'])
+        return _FolderNode(folders=folders, services=services)
 
-        for service in response['services']:
-            yield ArcGisService(**service)
+    def _expand_subfolder(self, executor: ThreadPoolExecutor, folder: str) -> _FolderNode | None:
+        response = self._try_request_folder(folder)
+        if response is None:
+            return None
 
-    def _request_folder(self, url: str) -> FolderResponse:
-        logging.info('Requesting folder: %s', url)
-        # a lot of services of this kind have a very strange
-        # ssl certificates which are not always correctly set up
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
+        return self._expand_folder(executor, response)
+
+    def _collect_layers(self, node: _FolderNode) -> Iterator[Layer]:
+        # results are consumed in the depth-first order of the catalog, every
+        # layer is yielded as soon as the layers before it are, while the
+        # rest of the crawl goes on, so the output never depends on timing
+        for folder in node.folders:
+            subfolder_node = folder.result()
+            if subfolder_node is not None:
+                yield from self._collect_layers(subfolder_node)
+
+        for service, service_data in node.services:
+            if service_data.result() is None:
+                continue
+
+            yield self._build_layer(service, *service_data.result())
 
-            r = requests.get(url, params={'f': 'json'}, verify=False)
-            r.raise_for_status()
+    def _try_request_folder(self, folder: str) -> FolderResponse | None:
+        logging.info('Traversing folder: %s', folder)
+        try:
+            return self._request_folder(self._url + '/' + folder)
+        except PermissionError:
+            logging.warning('Skip folder %s because of permission error', folder)
+            return None
 
-        result = r.json()
+    def _request_folder(self, url: str) -> FolderResponse:
+        logging.info('Requesting folder: %s', url)
+        result = self._client.get_json(url, params={'f': 'json'})
         if result.get('error'):
             raise PermissionError(result['error']['message'])
 
         return result
 
+    def _try_request_service(self, service: ArcGisService) -> tuple[MapServiceResponse, list[ExtentInfo]] | None:
+        try:
+            service_data = self._request_service(self._url, service)
+        except PermissionError:
+            logging.warning('Skip service %s because of permission error', service['name'])
+            return None
+
+        return service_data, self._request_layer_extents(self._url, service, service_data)
+
     def _request_service(self, root_url: str, service: ArcGisService) -> MapServiceResponse:
         service_url = root_url + '/' + service['name'] + '/MapServer'
         logging.info('Requesting folder: %s', service_url)
-        # a lot of services of this kind have a very strange
-        # ssl certificates which are not always correctly set up
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-
-            r = requests.get(service_url, params={'f': 'json'}, verify=False)
-            r.raise_for_status()
-
-        result = r.json()
+        result = self._client.get_json(service_url, params={'f': 'json'})
         if result.get('error'):
             raise PermissionError(result['error']['message'])
 
         return result
 
-    def list_layers(self) -> list[Layer]:
-        layers = []
-
-        response = self._request_folder(url=self._url)
-        services = list(self._collect_services(self._url, response))
-        for service in services:
-            if service['type'] != 'MapServer':
-                logging.info('Skip layer %s because of type %s', service['name'], service['type'])
-                continue
-
-            try:
-                service_data = self._request_service(self._url, service)
-            except PermissionError:
-                logging.warning('Skip service %s because of permission error', service['name'])
-                continue
-
-            name_tokens = [
-                service['name'],
-                service_data['serviceDescription']
-            ]
-            extent = service_data['fullExtent']
-            min_x, min_y, max_x, max_y = extent['xmin'], extent['ymin'], extent['xmax'], extent['ymax']
-
-            if service_data.get('tileInfo'):
-                url = f'{self._url}/{service["name"]}/MapServer/tile/{{z}}/{{y}}/{{x}}'
-                proxy_type = 'tms'
-            else:
-                url = f'{self._url}/{service["name"]}/MapServer'
-                proxy_type = 'arcgis'
-
-            if extent['spatialReference'].get('wkid'):
-                srid = f"EPSG:{extent['spatialReference']['wkid']}"
-            else:
-                srid = extent['spatialReference']['wkt']
-
-            layers.append(Layer(
-                name=slugify(' '.join(name_tokens)),
-                type=proxy_type,
-                bounds=(min_x, min_y, max_x, max_y),
-                bounds_srid=srid,
-                url=url
-            ))
-
-        return layers
+    def _request_layer_extents(self, root_url: str, service: ArcGisService,
+                               service_data: MapServiceResponse) -> list[ExtentInfo]:
+        # the extents of the data layers only say more than the
+        # full extent when a service has several of them
+        data_layers = [layer for layer in service_data.get('layers') or [] if not layer.get('subLayerIds')]
+        if len(data_layers) < 2:
+            return []
+
+        layers_url = root_url + '/' + service['name'] + '/MapServer/layers'
+        logging.info('Requesting layers: %s', layers_url)
+        try:
+            result = self._client.get_json(layers_url, params={'f': 'json'})
+        except (requests.HTTPError, ValueError):
+            return []
+
+        if result.get('error') or 'layers' not in result:
+            return []
+
+        return [layer['extent'] for layer in result['layers'] if layer.get('extent') and not layer.get('subLayers')]
+
+    def _build_layer(self, service: ArcGisService, service_data: MapServiceResponse,
+                     layer_extents: Sequence[ExtentInfo] = ()) -> Layer:
+        name_tokens = [
+            service['name'],
+            service_data['serviceDescription']
+        ]
+        extent = service_data['fullExtent']
+        min_x, min_y, max_x, max_y = extent['xmin'], extent['ymin'], extent['xmax'], extent['ymax']
+
+        min_level = max_level = tile_grid = image_format = transparent = None
+        if service_data.get('tileInfo'):
+            url = f'{self._url}/{service["name"]}/MapServer/tile/{{z}}/{{y}}/{{x}}'
+            proxy_type = 'tms'
+
+            # the cache may be built for a part of the published levels only
+            levels = [lod['level'] for lod in service_data['tileInfo'].get('lods', [])]
+            if levels:
+                min_level = service_data.get('minLOD', min(levels))
+                max_level = service_data.get('maxLOD', max(levels))
+            tile_grid = self._build_tile_grid(service_data['tileInfo'])
+            image_format, transparent = self._tile_format(service_data['tileInfo'])
+        else:
+            url = f'{self._url}/{service["name"]}/MapServer'
+            proxy_type = 'arcgis'
+
+        if extent['spatialReference'].get('wkid'):
+            srid = f"EPSG:{extent['spatialReference']['wkid']}"
+        else:
+            srid = extent['spatialReference']['wkt']
+
+        return Layer(
+            name=slugify(' '.join(name_tokens)),
+            type=proxy_type,
+            bounds=(min_x, min_y, max_x, max_y),
+            bounds_srid=srid,
+            coverage=build_coverage(layer_extents, (min_x, min_y, max_x, max_y), srid) if layer_extents else None,
+            url=url,
+            min_level=min_level,
+            max_level=max_level,
+            tile_grid=tile_grid,
+            image_format=image_format,
+            transparent=transparent
+        )
+
+    @staticmethod
+    def _tile_format(tile_info: TileInfo) -> tuple[str | None, bool | None]:
+        tile_format = tile_info.get('format', '').upper()
+        if tile_format in ('JPEG', 'JPG'):
+            return 'jpeg', False
+        if tile_format == 'MIXED':
+            return 'mixed', True
+        if tile_format.startswith('PNG'):
+            return 'png', True
+        return None, None
+
+    @staticmethod
+    def _build_tile_grid(tile_info: TileInfo) -> TileGridConfig | None:
+        spatial_reference = tile_info.get('spatialReference', {})
+        wkid = spatial_reference.get('latestWkid') or spatial_reference.get('wkid')
+        if not wkid or not tile_info.get('lods') or not tile_info.get('origin'):
+            return None
+
+        lods = sorted(tile_info['lods'], key=lambda lod: lod['level'])
+        return TileGridConfig(
+            srid=f'EPSG:{wkid}',
+            origin=(tile_info['origin']['x'], tile_info['origin']['y']),
+            resolutions=[lod['resolution'] for lod in lods],
+            tile_size=(tile_info.get('cols', 256), tile_info.get('rows', 256))
+        )
+
+    def iter_layers(self) -> Iterator[Layer]:
+        executor = ThreadPoolExecutor(max_workers=self._max_workers)
+        try:
+            response = self._request_folder(url=self._url)
+            yield from self._collect_layers(self._expand_folder(executor, response))
+        finally:
+            # a consumer which stops early must not wait for the rest of the crawl
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -1,12 +1,14 @@
 import logging
 import urllib.parse
-import warnings
-from typing import TypedDict, Literal, NotRequired
+from concurrent.futures import ThreadPoolExecutor
+from typing import TypedDict, Literal, NotRequired, Iterator
 
 import requests
 from slugify import slugify
 
+from geoarchive.services.arcgis import build_coverage
 from geoarchive.services.base import Layer, ServiceProtocol
+from geoarchive.services.client import HttpClient, default_client
 
 
 class ExtentInfo(TypedDict):
@@ -48,21 +50,16 @@ class MapServiceResponse(TypedDict):
 
 
 class ArcGisProtocol(ServiceProtocol):
-    def __init__(self, url: str):
+    def __init__(self, url: str, client: HttpClient | None = None, max_workers: int = 1):
         self._url = url
         self._url_parts = urllib.parse.urlparse(self._url)
 
+        self._client = client or default_client()
+        self._max_workers = max_workers
+
     def _request_service(self, service_url: str) -> MapServiceResponse:
         logging.info('Requesting service: %s', service_url)
-        # a lot of services of this kind have a very strange
-        # ssl certificates which are not always correctly set up
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-
-            r = requests.get(service_url, params={'f': 'json'}, verify=False)
-            r.raise_for_status()
-
-        result = r.json()
+        result = self._client.get_json(service_url, params={'f': 'json'})
         if result.get('error'):
             raise PermissionError(result['error']['message'])
 
@@ -70,62 +67,127 @@ class ArcGisProtocol(ServiceProtocol):
 
     def _request_layer(self, service_url: str, layer_id: int) -> LayerResponse:
         logging.info('Requesting layer: %s/%s', service_url, layer_id)
-        # a lot of services of this kind have a very strange
-        # ssl certificates which are not always correctly set up
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-
-            r = requests.get(f'{service_url}/{layer_id}', params={'f': 'json'}, verify=False)
-            r.raise_for_status()
-
-        result = r.json()
+        result = self._client.get_json(f'{service_url}/{layer_id}', params={'f': 'json'})
         if result.get('error'):
             raise PermissionError(result['error']['message'])
 
         return result
 
-    def list_layers(self) -> list[Layer]:
-        layers = []
-
+    def _request_layers(self, service_url: str) -> list[LayerResponse] | None:
+        logging.info('Requesting layers: %s/layers', service_url)
+        try:
+            result = self._client.get_json(f'{service_url}/layers', params={'f': 'json'})
+        except (requests.HTTPError, ValueError):
+            return None
+
+        if result.get('error') or 'layers' not in result:
+            return None
+
+        return result['layers']
+
+    def _iter_layers_data(self, layers: list[LayerListItem]) -> Iterator[LayerResponse]:
+        # a single document with every layer is much cheaper than a request
+        # per layer, but the endpoint is missing on older servers
+        bulk_layers = self._request_layers(self._url)
+        if bulk_layers is not None:
+            layers_by_id = {layer['id']: layer for layer in bulk_layers}
+            if all(layer['id'] in layers_by_id for layer in layers):
+                for layer in layers:
+                    yield layers_by_id[layer['id']]
+                return
+
+        logging.info('Bulk layers are not available for %s, requesting layers one by one', self._url)
+        executor = ThreadPoolExecutor(max_workers=self._max_workers)
+        try:
+            yield from executor.map(lambda layer: self._request_layer(self._url, layer_id=layer['id']), layers)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def _leaf_extents(layer_id: int, layers: dict[int, LayerListItem],
+                      layers_data: dict[int, LayerResponse]) -> Iterator[ExtentInfo]:
+        sublayer_ids = layers[layer_id].get('subLayerIds') or []
+        if not sublayer_ids:
+            if layers_data[layer_id].get('extent'):
+                yield layers_data[layer_id]['extent']
+            return
+
+        for sublayer_id in sublayer_ids:
+            if sublayer_id in layers:
+                yield from ArcGisProtocol._leaf_extents(sublayer_id, layers, layers_data)
+
+    @staticmethod
+    def _leaves_known(layer_id: int, layers: dict[int, LayerListItem],
+                      layers_data: dict[int, LayerResponse]) -> bool:
+        if layer_id not in layers_data:
+            return False
+
+        return all(
+            ArcGisProtocol._leaves_known(sublayer_id, layers, layers_data)
+            for sublayer_id in layers[layer_id].get('subLayerIds') or [] if sublayer_id in layers
+        )
+
+    def iter_layers(self) -> Iterator[Layer]:
         try:
             service_data = self._request_service(self._url)
         except PermissionError:
             logging.warning('Skip service %s because of permission error', self._url)
-            return []
-
+            return
+
+        layers = service_data['layers']
+        layers_by_id = {layer['id']: layer for layer in layers}
+        layers_data_by_id: dict[int, LayerResponse] = {}
+
+        # layers are yielded in the order of the service as soon as their
+        # data arrives, a group layer also waits for the extents of its sublayers
+        position = 0
+        for layer, layer_data in zip(layers, self._iter_layers_data(layers)):
+            layers_data_by_id[layer['id']] = layer_data
+            while position < len(layers) and self._leaves_known(layers[position]['id'], layers_by_id,
+                                                                 layers_data_by_id):
+                yield self._build_layer(service_data, layers[position], layers_by_id, layers_data_by_id)
+                position += 1
+
+    def _build_layer(self, service_data: MapServiceResponse, layer: LayerListItem,
+                     layers_by_id: dict[int, LayerListItem], layers_data_by_id: dict[int, LayerResponse]) -> Layer:
         name_tokens = [
             service_data['mapName'],
             service_data['serviceDescription']
         ]
-
-        for layer in service_data['layers']:
-            url = self._url
-            proxy_type = 'arcgis'
-
-            layer_data = self._request_layer(self._url, layer_id=layer['id'])
-
-            extent = layer_data['extent']
-            min_x, min_y, max_x, max_y = extent['xmin'], extent['ymin'], extent['xmax'], extent['ymax']
-
-            layer_name_tokens = name_tokens.copy()
-            layer_name_tokens.append(layer_data['name'])
-            layer_name_tokens.append(str(layer_data['id']))
-
-            if extent['spatialReference'].get('wkid'):
-                srid = f"EPSG:{extent['spatialReference']['wkid']}"
-            else:
-                srid = extent['spatialReference']['wkt']
-
-            layers.append(Layer(
-                name=slugify(' '.join(layer_name_tokens)),
-                type=proxy_type,
-                bounds=(min_x, min_y, max_x, max_y),
-                bounds_srid=srid,
-                url=url,
-                opts=dict(
-                    layers=f'show:{layer["id"]}',
-                    official_name=f"{service_data['mapName']}/{layer_data['name']}"
-                )
-            ))
-
-        return layers
+        layer_data = layers_data_by_id[layer['id']]
+
+        url = self._url
+        proxy_type = 'arcgis'
+
+        extent = layer_data['extent']
+        min_x, min_y, max_x, max_y = extent['xmin'], extent['ymin'], extent['xmax'], extent['ymax']
+
+        layer_name_tokens = name_tokens.copy()
+        layer_name_tokens.append(layer_data['name'])
+        layer_name_tokens.append(str(layer_data['id']))
+
+        if extent['spatialReference'].get('wkid'):
+            srid = f"EPSG:{extent['spatialReference']['wkid']}"
+        else:
+            srid = extent['spatialReference']['wkt']
+
+        # a group layer is drawn only where its sublayers have data
+        coverage = None
+        if layer.get('subLayerIds'):
+            coverage = build_coverage(
+                list(self._leaf_extents(layer['id'], layers_by_id, layers_data_by_id)),
+                (min_x, min_y, max_x, max_y), srid
+            )
+
+        return Layer(
+            name=slugify(' '.join(layer_name_tokens)),
+            type=proxy_type,
+            bounds=(min_x, min_y, max_x, max_y),
+            bounds_srid=srid,
+            coverage=coverage,
+            url=url,
+            opts=dict(
+                layers=f'show:{layer["id"]}',
+                official_name=f"{service_data['mapName']}/{layer_data['name']}"
+            )
+        )
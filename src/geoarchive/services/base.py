@@ -1,8 +1,11 @@
 import typing
-from typing import Literal
+from typing import Literal, Iterator
 
 import pydantic
 
+from geoarchive.config import TileGridConfig
+from geoarchive.services.client import HttpClient
+
 
 class Layer(pydantic.BaseModel):
     name: str
@@ -11,14 +14,24 @@ class Layer(pydantic.BaseModel):
 
     bounds: tuple[float, float, float, float]
     bounds_srid: str = 'EPSG:4326'
+    coverage: list[tuple[float, float, float, float]] | None = None
 
     opts: dict | None = None
 
+    min_level: int | None = None
+    max_level: int | None = None
+    tile_grid: TileGridConfig | None = None
+    image_format: Literal['png', 'jpeg', 'mixed'] | None = None
+    transparent: bool | None = None
+
 
 class ServiceProtocol(typing.Protocol):
 
-    def __init__(self, url):
+    def __init__(self, url, client: HttpClient | None = None, max_workers: int = 1):
         ...
 
-    def list_layers(self) -> list[Layer]:
+    def iter_layers(self) -> Iterator[Layer]:
         ...
+
+    def list_layers(self) -> list[Layer]:
+        return list(self.iter_layers())
@@ -0,0 +1,175 @@
+import dataclasses
+import logging
+import random
+import threading
+import time
+import urllib.parse
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+from geoarchive import profiling
+from geoarchive.services.concurrency import HostLimiter
+from geoarchive.services.response_cache import ResponseCache
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+@dataclasses.dataclass
+class HostStats:
+    requests: int = 0
+    retries: int = 0
+    errors: int = 0
+    bytes: int = 0
+    elapsed: float = 0.0
+    cache_hits: int = 0
+    revalidated: int = 0
+
+
+class HttpClient:
+    def __init__(self,
+                 timeout: float | tuple[float, float] = (10, 60),
+                 retries: int = 3,
+                 backoff: float = 0.5,
+                 max_backoff: float = 30,
+                 pool_size: int = 10,
+                 max_per_host: int | None = None,
+                 verify: bool = False,
+                 cache: ResponseCache | None = None):
+        self._timeout = timeout
+        self._retries = retries
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._pool_size = pool_size
+        self._verify = verify
+        self._cache = cache
+
+        self._limiter = HostLimiter(max_per_host)
+        self._lock = threading.Lock()
+        self._sessions: dict[str, requests.Session] = {}
+        self.stats: dict[str, HostStats] = {}
+
+        if not verify:
+            # a lot of services of this kind have a very strange
+            # ssl certificates which are not always correctly set up
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    def _session(self, host: str) -> requests.Session:
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                session.verify = self._verify
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self._pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._sessions[host] = session
+            return session
+
+    def _host_stats(self, host: str) -> HostStats:
+        with self._lock:
+            return self.stats.setdefault(host, HostStats())
+
+    def _delay(self, attempt: int, response: requests.Response | None) -> float:
+        if response is not None and response.headers.get('Retry-After', '').isdigit():
+            return min(self._max_backoff, float(response.headers['Retry-After']))
+
+        # exponential backoff with full jitter
+        return random.uniform(0, min(self._max_backoff, self._backoff * 2 ** attempt))
+
+    def get(self, url: str, params: dict | None = None, headers: dict | None = None,
+            cache: bool = True) -> requests.Response:
+        host = urllib.parse.urlparse(url).netloc
+        stats = self._host_stats(host)
+        # tiles are fetched once or have to be current, only
+        # the catalog responses are worth keeping on disk
+        use_cache = cache and self._cache is not None
+
+        cached = None
+        if use_cache and headers is None:
+            cached = self._cache.get(url, params)
+            if cached is not None and cached.is_fresh(self._cache.ttl):
+                with self._lock:
+                    stats.cache_hits += 1
+                return cached.to_response()
+
+            if cached is not None:
+                headers = cached.conditional_headers()
+
+        response = self._request(url, params, headers, stats)
+
+        if cached is not None and response.status_code == 304:
+            with self._lock:
+                stats.revalidated += 1
+            self._cache.revalidated(cached)
+            return cached.to_response()
+
+        if use_cache and response.status_code == 200:
+            self._cache.put(url, params, response)
+
+        return response
+
+    def _request(self, url: str, params: dict | None, headers: dict | None, stats: HostStats) -> requests.Response:
+        host = urllib.parse.urlparse(url).netloc
+        session = self._session(host)
+
+        attempt = 0
+        while True:
+            response = None
+            started = time.perf_counter()
+            try:
+                with self._limiter.acquire(url), profiling.span('http', url, host=host) as span:
+                    response = session.get(url, params=params, headers=headers, timeout=self._timeout)
+                    span.update(status=response.status_code, bytes=len(response.content))
+            except (requests.ConnectionError, requests.Timeout):
+                with self._lock:
+                    stats.requests += 1
+                    if attempt >= self._retries:
+                        stats.errors += 1
+                if attempt >= self._retries:
+                    raise
+            finally:
+                with self._lock:
+                    stats.elapsed += time.perf_counter() - started
+
+            if response is not None:
+                with self._lock:
+                    stats.requests += 1
+                    stats.bytes += len(response.content)
+
+                if response.status_code not in RETRY_STATUSES or attempt >= self._retries:
+                    break
+
+            delay = self._delay(attempt, response)
+            logging.warning('Retrying %s in %.1fs (attempt %s of %s)', url, delay, attempt + 1, self._retries)
+            with self._lock:
+                stats.retries += 1
+            time.sleep(delay)
+            attempt += 1
+
+        if response.status_code >= 400:
+            with self._lock:
+                stats.errors += 1
+        response.raise_for_status()
+        return response
+
+    def get_json(self, url: str, params: dict | None = None):
+        return self.get(url, params=params).json()
+
+    def log_stats(self) -> None:
+        for host, stats in sorted(self.stats.items()):
+            logging.info('Host %s: requests=%s retries=%s errors=%s bytes=%s time=%.2fs '
+                         'cache_hits=%s revalidated=%s',
+                         host, stats.requests, stats.retries, stats.errors, stats.bytes, stats.elapsed,
+                         stats.cache_hits, stats.revalidated)
+
+
+_default_client: HttpClient | None = None
+
+
+def default_client() -> HttpClient:
+    global _default_client
+    if _default_client is None:
+        _default_client = HttpClient()
+    return _default_client
@@ -0,0 +1,27 @@
+import contextlib
+import threading
+import urllib.parse
+
+
+class HostLimiter:
+    def __init__(self, limit: int | None = None):
+        self._limit = limit
+        self._lock = threading.Lock()
+        self._semaphores: dict[str, threading.BoundedSemaphore] = {}
+
+    def _semaphore(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            semaphore = self._semaphores.get(host)
+            if semaphore is None:
+                semaphore = self._semaphores[host] = threading.BoundedSemaphore(self._limit)
+            return semaphore
+
+    @contextlib.contextmanager
+    def acquire(self, url: str):
+        if self._limit is None:
+            yield
+            return
+
+        semaphore = self._semaphore(urllib.parse.urlparse(url).netloc)
+        with semaphore:
+            yield
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import urllib.parse
+from pathlib import Path
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+class CachedResponse:
+    def __init__(self, key: str, meta: dict, body_path: Path):
+        self.key = key
+        self.meta = meta
+        self._body_path = body_path
+
+    def is_fresh(self, ttl: float) -> bool:
+        return time.time() - self.meta['stored_at'] < ttl
+
+    def conditional_headers(self) -> dict:
+        headers = {}
+        if self.meta.get('etag'):
+            headers['If-None-Match'] = self.meta['etag']
+        if self.meta.get('last_modified'):
+            headers['If-Modified-Since'] = self.meta['last_modified']
+        return headers
+
+    def to_response(self) -> requests.Response:
+        response = requests.Response()
+        response.status_code = 200
+        response.url = self.meta['url']
+        response.headers = CaseInsensitiveDict(self.meta.get('headers', {}))
+        response.encoding = self.meta.get('encoding')
+        response._content = self._body_path.read_bytes()
+        return response
+
+
+class ResponseCache:
+    def __init__(self, path: Path, ttl: float = 3600, max_bytes: int = 512 * 1024 * 1024):
+        self._path = path
+        self.ttl = ttl
+        self._max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        # key -> (size, last used), populated lazily from the disk
+        self._index: dict[str, tuple[int, float]] | None = None
+        self._total = 0
+
+    @staticmethod
+    def make_key(url: str, params: dict | None = None) -> str:
+        query = urllib.parse.urlencode(sorted((params or {}).items()))
+        return hashlib.sha256(f'{url}?{query}'.encode()).hexdigest()
+
+    def _paths(self, key: str) -> tuple[Path, Path]:
+        directory = self._path / key[:2]
+        return directory / f'{key}.json', directory / f'{key}.body'
+
+    def _load_index(self) -> dict[str, tuple[int, float]]:
+        if self._index is None:
+            self._index = {}
+            self._total = 0
+            if self._path.exists():
+                for body_path in self._path.glob('*/*.body'):
+                    stat = body_path.stat()
+                    self._index[body_path.stem] = (stat.st_size, stat.st_mtime)
+                    self._total += stat.st_size
+        return self._index
+
+    def get(self, url: str, params: dict | None = None) -> CachedResponse | None:
+        key = self.make_key(url, params)
+        meta_path, body_path = self._paths(key)
+        try:
+            meta = json.loads(meta_path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        if not body_path.exists():
+            return None
+
+        self._touch(key, body_path)
+        return CachedResponse(key, meta, body_path)
+
+    def _touch(self, key: str, body_path: Path) -> None:
+        now = time.time()
+        with self._lock:
+            index = self._load_index()
+            if key in index:
+                index[key] = (index[key][0], now)
+        try:
+            os.utime(body_path, (now, now))
+        except FileNotFoundError:
+            pass
+
+    def revalidated(self, entry: CachedResponse) -> None:
+        entry.meta['stored_at'] = time.time()
+        meta_path, _ = self._paths(entry.key)
+        self._write(meta_path, json.dumps(entry.meta).encode())
+
+    def put(self, url: str, params: dict | None, response: requests.Response) -> None:
+        key = self.make_key(url, params)
+        meta_path, body_path = self._paths(key)
+        meta = dict(
+            url=url,
+            etag=response.headers.get('ETag'),
+            last_modified=response.headers.get('Last-Modified'),
+            headers={
+                name: value for name, value in response.headers.items()
+                if name.lower() in ('content-type', 'etag', 'last-modified')
+            },
+            encoding=response.encoding,
+            stored_at=time.time(),
+        )
+
+        body = response.content
+        self._write(body_path, body)
+        self._write(meta_path, json.dumps(meta).encode())
+
+        with self._lock:
+            index = self._load_index()
+            previous_size, _ = index.get(key, (0, 0))
+            index[key] = (len(body), time.time())
+            self._total += len(body) - previous_size
+            self._evict()
+
+    def _write(self, path: Path, data: bytes) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f'{path.name}.{threading.get_ident()}.tmp')
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+    def _evict(self) -> None:
+        if self._total <= self._max_bytes:
+            return
+
+        for key, (size, _) in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if self._total <= self._max_bytes:
+                break
+
+            logging.debug('Evicting cached response %s', key)
+            for path in self._paths(key):
+                path.unlink(missing_ok=True)
+            del self._index[key]
+            self._total -= size
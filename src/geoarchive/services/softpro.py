@@ -1,12 +1,11 @@
 import logging
 import urllib.parse
-import warnings
-from typing import TypedDict, Literal, NotRequired
+from typing import TypedDict, Literal, NotRequired, Iterator
 
-import requests
 from slugify import slugify
 
 from geoarchive.services.base import Layer, ServiceProtocol
+from geoarchive.services.client import HttpClient, default_client
 
 
 class _SoftProLayer(TypedDict):
@@ -21,22 +20,18 @@ class _SoftProLayer(TypedDict):
 
 
 class SoftProService(ServiceProtocol):
-    def __init__(self, url: str):
+    def __init__(self, url: str, client: HttpClient | None = None, max_workers: int = 1):
         self._url = url
         self._url_parts = urllib.parse.urlparse(self._url)
 
-    def list_layers(self) -> list[Layer]:
-        # a lot of services of this kind have a very strange
-        # ssl certificates which are not always correctly set up
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
+        self._client = client or default_client()
+        self._max_workers = max_workers
 
-            r = requests.get(self._url, verify=False)
-            r.raise_for_status()
+    def iter_layers(self) -> Iterator[Layer]:
+        r = self._client.get(self._url)
 
         response: list[_SoftProLayer] = r.json()
 
-        layers = []
         for layer in response:
             if layer['service'].lower() != 'tms':
                 logging.info('Skip %s layer because of incompatible type %s',
@@ -53,11 +48,9 @@ class SoftProService(ServiceProtocol):
                     layer['category'], layer['name']
                 ) if token is not None
             ]
-            layers.append(Layer(
+            yield Layer(
                 name=slugify(' '.join(name_tokens)),
                 type='tms',
                 bounds=tuple(map(float, layer['bounds'].split(','))),
-                url=f"{self._url_parts.scheme}://{self._url_parts.hostname}{url}"
-            ))
-
-        return layers
+                url=f"{self._url_parts.scheme}://{self._url_parts.netloc}{url}"
+            )
@@ -1,43 +1,36 @@
 import logging
 import urllib.parse
-import warnings
-from typing import TypedDict, Literal, NotRequired
+from typing import TypedDict, Literal, NotRequired, Iterator
 
 from bs4 import BeautifulSoup
 
-import requests
 from slugify import slugify
 
 from geoarchive.services.base import Layer, ServiceProtocol
+from geoarchive.services.client import HttpClient, default_client
 
 
 class SoftProService(ServiceProtocol):
-    def __init__(self, url: str):
+    def __init__(self, url: str, client: HttpClient | None = None, max_workers: int = 1):
         self._url = url
         self._url_parts = urllib.parse.urlparse(self._url)
 
-    def list_layers(self) -> list[Layer]:
-        # a lot of services of this kind have a very strange
-        # ssl certificates which are not always correctly set up
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
+        self._client = client or default_client()
+        self._max_workers = max_workers
 
-            r = requests.get(self._url, verify=False)
-            r.raise_for_status()
+    def iter_layers(self) -> Iterator[Layer]:
+        r = self._client.get(self._url)
 
         soup = BeautifulSoup(r.text, "html.parser")
 
-        layers = []
         for layer in soup.find_all(attrs={'class': 'access-list__item'}):
             map_id = layer.find_next('input').attrs['map-layer']
             map_name = layer.find_next(attrs={'class': 'access-list__item_name'}).text
 
             url = f"/map/rtile/carto_{map_id}/ua/{{z}}/{{x}}/{{y}}.png"
-            layers.append(Layer(
+            yield Layer(
                 name=slugify(map_name),
                 type='tms',
                 bounds=(21.225586, 44.318589, 40.363770, 52.709394),
-                url=f"{self._url_parts.scheme}://{self._url_parts.hostname}{url}"
-            ))
-
-        return layers
+                url=f"{self._url_parts.scheme}://{self._url_parts.netloc}{url}"
+            )
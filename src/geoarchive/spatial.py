@@ -0,0 +1,24 @@
+import logging
+import math
+
+from pyproj.exceptions import CRSError
+
+from geoarchive.tiles import Bbox, transform_bbox
+
+WGS84 = 'EPSG:4326'
+
+
+def to_wgs84(bbox: Bbox, srid: str) -> Bbox | None:
+    try:
+        bbox = tuple(transform_bbox(tuple(bbox), srid, WGS84))
+    except (CRSError, RuntimeError, ValueError) as e:
+        logging.debug('Failed to transform %s from %s: %s', bbox, srid, e)
+        return None
+
+    if not all(math.isfinite(value) for value in bbox) or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+        return None
+    return bbox
+
+
+def bbox_intersects(a: Bbox, b: Bbox) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
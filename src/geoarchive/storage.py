@@ -0,0 +1,309 @@
+import hashlib
+import os
+import sqlite3
+import struct
+import typing
+from pathlib import Path
+
+from geoarchive.config import CacheBackendConfig
+from geoarchive.tiles import TileGrid
+
+BUNDLE_V2_GRID_SIZE = 128
+BUNDLE_V2_TILES = BUNDLE_V2_GRID_SIZE * BUNDLE_V2_GRID_SIZE
+BUNDLE_V2_INDEX_SIZE = BUNDLE_V2_TILES * 8
+BUNDLE_V2_HEADER_SIZE = 64
+BUNDLE_V2_HEADER_STRUCT = struct.Struct('<4I3Q6I')
+BUNDLE_V2_INDEX_STRUCT = struct.Struct('<Q')
+BUNDLE_V2_SIZE_STRUCT = struct.Struct('<I')
+
+
+class _BundleV2:
+    def __init__(self, filename: Path):
+        self._filename = filename
+        if not filename.exists():
+            filename.parent.mkdir(parents=True, exist_ok=True)
+            header = BUNDLE_V2_HEADER_STRUCT.pack(
+                3,  # version
+                BUNDLE_V2_TILES,  # number of records
+                0,  # max record size
+                5,  # offset size
+                0,  # slack space
+                BUNDLE_V2_HEADER_SIZE + BUNDLE_V2_INDEX_SIZE,  # file size
+                40,  # user header offset
+                20 + BUNDLE_V2_INDEX_SIZE,  # user header size
+                3, 16, BUNDLE_V2_TILES, 5,  # legacy fields
+                BUNDLE_V2_INDEX_SIZE,  # index size
+            )
+            filename.write_bytes(header + bytes(BUNDLE_V2_INDEX_SIZE))
+
+        with open(filename, 'rb') as f:
+            self._header = list(BUNDLE_V2_HEADER_STRUCT.unpack(f.read(BUNDLE_V2_HEADER_SIZE)))
+            self._index = bytearray(f.read(BUNDLE_V2_INDEX_SIZE))
+
+        # tiles are only appended, the index is written back once on close,
+        # so an interrupted seed never leaves a bundle with a broken index
+        self._file = open(filename, 'ab')
+        self._end = self._file.tell()
+        self._modified = False
+
+    @staticmethod
+    def _index_position(x: int, y: int) -> int:
+        return ((y % BUNDLE_V2_GRID_SIZE) * BUNDLE_V2_GRID_SIZE + x % BUNDLE_V2_GRID_SIZE) * 8
+
+    def exists(self, x: int, y: int) -> bool:
+        position = self._index_position(x, y)
+        return BUNDLE_V2_INDEX_STRUCT.unpack_from(self._index, position)[0] >> 40 > 0
+
+    def load(self, x: int, y: int) -> bytes | None:
+        value = BUNDLE_V2_INDEX_STRUCT.unpack_from(self._index, self._index_position(x, y))[0]
+        size, offset = value >> 40, value & (1 << 40) - 1
+        if not size:
+            return None
+
+        self._file.flush()
+        with open(self._filename, 'rb') as f:
+            f.seek(offset)
+            return f.read(size)
+
+    def store(self, x: int, y: int, data: bytes) -> None:
+        offset = self._end + BUNDLE_V2_SIZE_STRUCT.size
+        self._file.write(BUNDLE_V2_SIZE_STRUCT.pack(len(data)) + data)
+        self._end = offset + len(data)
+
+        position = self._index_position(x, y)
+        BUNDLE_V2_INDEX_STRUCT.pack_into(self._index, position, offset + (len(data) << 40))
+
+        self._header[2] = max(self._header[2], len(data))
+        self._header[5] = self._end
+        self._modified = True
+
+    def close(self) -> None:
+        self._file.close()
+        if not self._modified:
+            return
+
+        with open(self._filename, 'r+b') as f:
+            f.write(BUNDLE_V2_HEADER_STRUCT.pack(*self._header) + self._index)
+        self._modified = False
+
+
+class CompactCacheV2:
+    _MAX_OPEN_BUNDLES = 64
+
+    def __init__(self, cache_dir: Path):
+        self._cache_dir = cache_dir
+        self._bundles: dict[Path, _BundleV2] = {}
+
+    def _bundle(self, z: int, x: int, y: int) -> _BundleV2:
+        row = y // BUNDLE_V2_GRID_SIZE * BUNDLE_V2_GRID_SIZE
+        column = x // BUNDLE_V2_GRID_SIZE * BUNDLE_V2_GRID_SIZE
+        filename = self._cache_dir / f'L{z:02d}' / f'R{row:04x}C{column:04x}.bundle'
+
+        bundle = self._bundles.pop(filename, None)
+        if bundle is None:
+            if len(self._bundles) >= self._MAX_OPEN_BUNDLES:
+                oldest = next(iter(self._bundles))
+                self._bundles.pop(oldest).close()
+            bundle = _BundleV2(filename)
+
+        # keep the most recently used bundles at the end
+        self._bundles[filename] = bundle
+        return bundle
+
+    def exists(self, z: int, x: int, y: int) -> bool:
+        return self._bundle(z, x, y).exists(x, y)
+
+    def load(self, z: int, x: int, y: int) -> bytes | None:
+        return self._bundle(z, x, y).load(x, y)
+
+    def store(self, z: int, x: int, y: int, data: bytes) -> None:
+        self._bundle(z, x, y).store(x, y, data)
+
+    def close(self) -> None:
+        for bundle in self._bundles.values():
+            bundle.close()
+        self._bundles.clear()
+
+
+def _tile_path_tc(z: int, x: int, y: int) -> str:
+    return '%02d/%03d/%03d/%03d/%03d/%03d/%03d' % (
+        z, x // 1000000, x // 1000 % 1000, x % 1000, y // 1000000, y // 1000 % 1000, y % 1000)
+
+
+def _tile_path_mp(z: int, x: int, y: int) -> str:
+    return '%02d/%04d/%04d/%04d/%04d' % (z, x // 10000, x % 10000, y // 10000, y % 10000)
+
+
+def _tile_path_quadkey(z: int, x: int, y: int) -> str:
+    return ''.join(str((x >> i & 1) + (y >> i & 1) * 2) for i in range(z - 1, -1, -1))
+
+
+# the directory layouts of the MapProxy file cache
+_TILE_PATHS = {
+    'tc': _tile_path_tc,
+    'mp': _tile_path_mp,
+    'tms': lambda z, x, y: f'{z}/{x}/{y}',
+    'reverse_tms': lambda z, x, y: f'{y}/{x}/{z}',
+    'quadkey': _tile_path_quadkey,
+    'arcgis': lambda z, x, y: 'L%02d/R%08x/C%08x' % (z, y, x),
+}
+
+# uniform tiles compress to a few hundred bytes, larger
+# tiles are never worth looking up for a shared copy
+_LINKED_TILE_SIZE = 4096
+
+
+class FileCache:
+    def __init__(self, cache_dir: Path, directory_layout: str = 'tc', link_single_color_images: bool = False,
+                 extension: str = 'png'):
+        self._cache_dir = cache_dir
+        self._tile_path = _TILE_PATHS[directory_layout]
+        self._link = link_single_color_images
+        self._extension = extension
+
+    def _location(self, z: int, x: int, y: int) -> Path:
+        return self._cache_dir / f'{self._tile_path(z, x, y)}.{self._extension}'
+
+    def exists(self, z: int, x: int, y: int) -> bool:
+        return os.path.lexists(self._location(z, x, y))
+
+    def load(self, z: int, x: int, y: int) -> bytes | None:
+        try:
+            return self._location(z, x, y).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def store(self, z: int, x: int, y: int, data: bytes) -> None:
+        location = self._location(z, x, y)
+        location.parent.mkdir(parents=True, exist_ok=True)
+        if not self._link or len(data) > _LINKED_TILE_SIZE:
+            location.write_bytes(data)
+            return
+
+        # repeated small tiles, which are the empty and single color tiles
+        # of sparse sources, are stored once and linked like MapProxy does
+        shared = self._cache_dir / 'single_color_tiles' / f'{hashlib.sha1(data).hexdigest()}.{self._extension}'
+        if not shared.exists():
+            shared.parent.mkdir(exist_ok=True)
+            shared.write_bytes(data)
+        if os.path.lexists(location):
+            location.unlink()
+        location.symlink_to(os.path.relpath(shared, location.parent))
+
+    def close(self) -> None:
+        pass
+
+
+class MBTilesCache:
+    _COMMIT_INTERVAL = 1000
+
+    def __init__(self, filename: Path, wal: bool = False, timestamps: bool = False):
+        self._timestamps = timestamps
+        self._uncommitted = 0
+
+        filename.parent.mkdir(parents=True, exist_ok=True)
+        exists = filename.exists()
+        self._db = sqlite3.connect(filename)
+        if wal:
+            self._db.execute('PRAGMA journal_mode=wal')
+        if not exists:
+            # the schema MapProxy creates, the level caches of
+            # the sqlite backend keep a modification time
+            self._db.execute(
+                'CREATE TABLE tiles (zoom_level integer, tile_column integer, tile_row integer, tile_data blob%s)'
+                % (", last_modified datetime DEFAULT (datetime('now','localtime'))" if timestamps else '')
+            )
+            self._db.execute('CREATE TABLE metadata (name text, value text)')
+            self._db.execute('CREATE UNIQUE INDEX idx_tile on tiles (zoom_level, tile_column, tile_row)')
+            self._db.commit()
+
+    def exists(self, z: int, x: int, y: int) -> bool:
+        return self._db.execute(
+            'SELECT 1 FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?', (z, x, y)
+        ).fetchone() is not None
+
+    def load(self, z: int, x: int, y: int) -> bytes | None:
+        row = self._db.execute(
+            'SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?', (z, x, y)
+        ).fetchone()
+        return row[0] if row else None
+
+    def store(self, z: int, x: int, y: int, data: bytes) -> None:
+        if self._timestamps:
+            self._db.execute(
+                'INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data, last_modified) '
+                "VALUES (?, ?, ?, ?, datetime('now', 'localtime'))", (z, x, y, data)
+            )
+        else:
+            self._db.execute(
+                'INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)',
+                (z, x, y, data)
+            )
+
+        # a transaction per tile would spend most of the time in fsync
+        self._uncommitted += 1
+        if self._uncommitted >= self._COMMIT_INTERVAL:
+            self._db.commit()
+            self._uncommitted = 0
+
+    def close(self) -> None:
+        self._db.commit()
+        self._db.close()
+
+
+class MBTilesLevelCache:
+    def __init__(self, cache_dir: Path, wal: bool = False):
+        self._cache_dir = cache_dir
+        self._wal = wal
+        self._levels: dict[int, MBTilesCache] = {}
+
+    def _level(self, z: int) -> MBTilesCache:
+        if z not in self._levels:
+            self._levels[z] = MBTilesCache(self._cache_dir / f'{z}.mbtiles', wal=self._wal, timestamps=True)
+        return self._levels[z]
+
+    def exists(self, z: int, x: int, y: int) -> bool:
+        return self._level(z).exists(z, x, y)
+
+    def load(self, z: int, x: int, y: int) -> bytes | None:
+        return self._level(z).load(z, x, y)
+
+    def store(self, z: int, x: int, y: int, data: bytes) -> None:
+        self._level(z).store(z, x, y, data)
+
+    def close(self) -> None:
+        for level in self._levels.values():
+            level.close()
+        self._levels.clear()
+
+
+class TileStorage(typing.Protocol):
+
+    def exists(self, z: int, x: int, y: int) -> bool:
+        ...
+
+    def load(self, z: int, x: int, y: int) -> bytes | None:
+        ...
+
+    def store(self, z: int, x: int, y: int, data: bytes) -> None:
+        ...
+
+    def close(self) -> None:
+        ...
+
+
+def open_storage(path: Path, cache_name: str, grid: TileGrid, backend: CacheBackendConfig | None,
+                 image_format: str | None = None) -> TileStorage:
+    # the locations mirror the defaults of the MapProxy cache types
+    cache_data = path / 'cache_data'
+    if backend is None or backend.type == 'compact':
+        return CompactCacheV2(cache_data / cache_name / grid.name)
+    if backend.type == 'file':
+        return FileCache(cache_data / f'{cache_name}_{grid.srid.replace(":", "")}', backend.directory_layout,
+                         backend.link_single_color_images, extension=image_format or 'png')
+    if backend.type == 'sqlite':
+        return MBTilesLevelCache(cache_data / cache_name / grid.name, wal=backend.wal)
+    if backend.type == 'mbtiles':
+        return MBTilesCache(cache_data / f'{cache_name}.mbtiles', wal=backend.wal)
+
+    raise NotImplementedError('Seeding into a %s cache is not supported, use mapproxy-seed' % backend.type)
@@ -0,0 +1,271 @@
+import hashlib
+import math
+from typing import Iterable, Iterator
+
+import pyproj
+
+EARTH_RADIUS = 6378137.0
+ORIGIN_SHIFT = math.pi * EARTH_RADIUS
+MAX_LATITUDE = 85.0511287798066
+
+DEFAULT_MAX_LEVEL = 18
+
+WEBMERCATOR_SRIDS = frozenset({'EPSG:3857', 'EPSG:900913', 'EPSG:102100', 'EPSG:102113'})
+
+Bbox = tuple[float, float, float, float]
+TileCoord = tuple[int, int, int]
+
+
+class TileGrid:
+    def __init__(self, name: str, srid: str, bbox: Bbox, resolutions: list[float],
+                 tile_size: tuple[int, int] = (256, 256)):
+        self.name = name
+        self.srid = srid
+        self.bbox = bbox
+        self.resolutions = resolutions
+        self.tile_size = tile_size
+
+    @property
+    def origin(self) -> tuple[float, float]:
+        # tiles are counted from the top left corner of the grid
+        return self.bbox[0], self.bbox[3]
+
+    def tile_bbox(self, z: int, x: int, y: int) -> Bbox:
+        width, height = self._tile_extent(z)
+        origin_x, origin_y = self.origin
+        return (
+            origin_x + x * width,
+            origin_y - (y + 1) * height,
+            origin_x + (x + 1) * width,
+            origin_y - y * height,
+        )
+
+    def _tile_extent(self, z: int) -> tuple[float, float]:
+        resolution = self.resolutions[z]
+        return resolution * self.tile_size[0], resolution * self.tile_size[1]
+
+    def tile_range(self, bbox: Bbox, z: int) -> tuple[int, int, int, int] | None:
+        width, height = self._tile_extent(z)
+        origin_x, origin_y = self.origin
+        max_x = math.ceil((self.bbox[2] - self.bbox[0]) / width - 1e-9) - 1
+        max_y = math.ceil((self.bbox[3] - self.bbox[1]) / height - 1e-9) - 1
+
+        x0 = max(0, math.floor((bbox[0] - origin_x) / width))
+        x1 = min(max_x, math.ceil((bbox[2] - origin_x) / width) - 1)
+        y0 = max(0, math.floor((origin_y - bbox[3]) / height))
+        y1 = min(max_y, math.ceil((origin_y - bbox[1]) / height) - 1)
+
+        if x0 > x1 or y0 > y1:
+            return None
+        return x0, y0, x1, y1
+
+    def count_tiles(self, bbox: Bbox, z: int) -> int:
+        tile_range = self.tile_range(bbox, z)
+        if tile_range is None:
+            return 0
+
+        x0, y0, x1, y1 = tile_range
+        return (x1 - x0 + 1) * (y1 - y0 + 1)
+
+    def count_tiles_union(self, bboxes: list[Bbox], z: int) -> int:
+        tile_ranges = [tile_range for tile_range in (self.tile_range(bbox, z) for bbox in bboxes) if tile_range]
+        if len(tile_ranges) == 1:
+            x0, y0, x1, y1 = tile_ranges[0]
+            return (x1 - x0 + 1) * (y1 - y0 + 1)
+
+        # overlapping ranges are counted once: columns are split at
+        # every range border and the rows of each column are merged
+        count = 0
+        borders = sorted({x for x0, _, x1, _ in tile_ranges for x in (x0, x1 + 1)})
+        for left, right in zip(borders, borders[1:]):
+            rows = sorted((y0, y1) for x0, y0, x1, y1 in tile_ranges if x0 <= left and right - 1 <= x1)
+            covered, last = 0, -1
+            for y0, y1 in rows:
+                if y1 > last:
+                    covered += y1 - max(y0, last + 1) + 1
+                    last = y1
+            count += covered * (right - left)
+        return count
+
+    def iter_tiles_union(self, bboxes: list[Bbox], z: int) -> Iterator[TileCoord]:
+        seen = []
+        for bbox in bboxes:
+            tile_range = self.tile_range(bbox, z)
+            if tile_range is None:
+                continue
+
+            for tile in self.iter_tiles(bbox, z):
+                _, x, y = tile
+                if not any(x0 <= x <= x1 and y0 <= y <= y1 for x0, y0, x1, y1 in seen):
+                    yield tile
+            seen.append(tile_range)
+
+    def iter_tiles(self, bbox: Bbox, z: int) -> Iterator[TileCoord]:
+        tile_range = self.tile_range(bbox, z)
+        if tile_range is None:
+            return
+
+        x0, y0, x1, y1 = tile_range
+        for y in range(y0, y1 + 1):
+            for x in range(x0, x1 + 1):
+                yield z, x, y
+
+
+WEBMERCATOR = TileGrid(
+    name='webmercator',
+    srid='EPSG:3857',
+    bbox=(-ORIGIN_SHIFT, -ORIGIN_SHIFT, ORIGIN_SHIFT, ORIGIN_SHIFT),
+    resolutions=[2 * ORIGIN_SHIFT / 256 / 2 ** z for z in range(25)],
+)
+
+
+def _area(bbox: Bbox) -> float:
+    return (bbox[2] - bbox[0]) * (bbox[3] - bbox[1])
+
+
+def _union(a: Bbox, b: Bbox) -> Bbox:
+    return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+
+def _intersects(a: Bbox, b: Bbox) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def merge_extents(extents: Iterable[Bbox], max_count: int = 8) -> list[Bbox]:
+    bboxes = [
+        tuple(bbox) for bbox in extents
+        if all(math.isfinite(value) for value in bbox) and bbox[0] <= bbox[2] and bbox[1] <= bbox[3]
+    ]
+
+    # overlapping extents are always merged, then the pair which adds
+    # the least empty space is merged until few enough extents remain
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(bboxes)):
+            for j in range(i + 1, len(bboxes)):
+                if _intersects(bboxes[i], bboxes[j]):
+                    bboxes[i] = _union(bboxes[i], bboxes.pop(j))
+                    merged = True
+                    break
+            if merged:
+                break
+
+    while len(bboxes) > max_count:
+        cost, i, j = min(
+            (_area(_union(bboxes[i], bboxes[j])) - _area(bboxes[i]) - _area(bboxes[j]), i, j)
+            for i in range(len(bboxes)) for j in range(i + 1, len(bboxes))
+        )
+        bboxes[i] = _union(bboxes[i], bboxes.pop(j))
+        # the merged extent may overlap others now
+        bboxes = merge_extents(bboxes, max_count=len(bboxes))
+
+    return bboxes
+
+
+def coverage_from_extents(extents: Iterable[Bbox], bounds: Bbox, max_count: int = 8) -> list[Bbox] | None:
+    coverage = merge_extents(extents, max_count=max_count)
+    # a coverage which is not much tighter than the bounds is not worth keeping
+    if not coverage or sum(map(_area, coverage)) >= 0.8 * _area(bounds):
+        return None
+    return coverage
+
+
+def source_extents(source, srid: str) -> list[Bbox]:
+    return [
+        transform_bbox(bbox, source.bounds_srid, srid)
+        for bbox in (getattr(source, 'coverage', None) or [source.bounds])
+    ]
+
+
+def _is_webmercator_scheme(tile_grid) -> bool:
+    if _normalize_srid(tile_grid.srid) != WEBMERCATOR.srid or tuple(tile_grid.tile_size) != WEBMERCATOR.tile_size:
+        return False
+    if not all(math.isclose(a, b, rel_tol=1e-6) for a, b in zip(tile_grid.origin, WEBMERCATOR.origin)):
+        return False
+    return len(tile_grid.resolutions) <= len(WEBMERCATOR.resolutions) and all(
+        math.isclose(a, b, rel_tol=1e-6) for a, b in zip(tile_grid.resolutions, WEBMERCATOR.resolutions))
+
+
+def scheme_name(tile_grid) -> str:
+    digest = hashlib.md5(repr((
+        _normalize_srid(tile_grid.srid),
+        tuple(round(value, 6) for value in tile_grid.origin),
+        tuple(round(value, 9) for value in tile_grid.resolutions),
+        tuple(tile_grid.tile_size),
+    )).encode()).hexdigest()
+    return '%s-%s' % (_normalize_srid(tile_grid.srid).replace(':', '').lower(), digest[:8])
+
+
+def scheme_grid(tile_grid, extents: Iterable[Bbox]) -> TileGrid:
+    # tiles are addressed from the origin, so the grid starts there and
+    # is extended by whole top level tiles until it covers every extent
+    origin_x, origin_y = tile_grid.origin
+    width = tile_grid.resolutions[0] * tile_grid.tile_size[0]
+    height = tile_grid.resolutions[0] * tile_grid.tile_size[1]
+
+    columns = rows = 1
+    for extent in extents:
+        columns = max(columns, math.ceil((extent[2] - origin_x) / width - 1e-9))
+        rows = max(rows, math.ceil((origin_y - extent[1]) / height - 1e-9))
+
+    return TileGrid(
+        name=scheme_name(tile_grid),
+        srid=_normalize_srid(tile_grid.srid),
+        bbox=(origin_x, origin_y - rows * height, origin_x + columns * width, origin_y),
+        resolutions=list(tile_grid.resolutions),
+        tile_size=tuple(tile_grid.tile_size),
+    )
+
+
+def source_grid(source) -> TileGrid:
+    tile_grid = getattr(source, 'tile_grid', None)
+    if tile_grid is None or _is_webmercator_scheme(tile_grid):
+        return WEBMERCATOR
+    return scheme_grid(tile_grid, [transform_bbox(source.bounds, source.bounds_srid, tile_grid.srid)])
+
+
+def source_levels(source) -> range:
+    min_level = source.min_level if source.min_level is not None else 0
+    max_level = source.max_level if source.max_level is not None else DEFAULT_MAX_LEVEL
+    if getattr(source, 'tile_grid', None) is not None:
+        max_level = min(max_level, len(source.tile_grid.resolutions) - 1)
+    return range(min_level, max_level + 1)
+
+
+def _normalize_srid(srid: str) -> str:
+    if srid.upper().startswith(('EPSG:', 'CRS:')):
+        srid = srid.upper()
+
+    if srid in WEBMERCATOR_SRIDS:
+        return 'EPSG:3857'
+    if srid == 'CRS:84':
+        return 'EPSG:4326'
+    return srid
+
+
+def _lonlat_to_webmercator(lon: float, lat: float) -> tuple[float, float]:
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    x = math.radians(lon) * EARTH_RADIUS
+    y = math.log(math.tan(math.pi / 4 + math.radians(lat) / 2)) * EARTH_RADIUS
+    return x, y
+
+
+def _webmercator_to_lonlat(x: float, y: float) -> tuple[float, float]:
+    lon = math.degrees(x / EARTH_RADIUS)
+    lat = math.degrees(2 * math.atan(math.exp(y / EARTH_RADIUS)) - math.pi / 2)
+    return lon, lat
+
+
+def transform_bbox(bbox: Bbox, from_srid: str, to_srid: str) -> Bbox:
+    from_srid, to_srid = _normalize_srid(from_srid), _normalize_srid(to_srid)
+    if from_srid == to_srid:
+        return bbox
+
+    if (from_srid, to_srid) == ('EPSG:4326', 'EPSG:3857'):
+        return _lonlat_to_webmercator(*bbox[:2]) + _lonlat_to_webmercator(*bbox[2:])
+    if (from_srid, to_srid) == ('EPSG:3857', 'EPSG:4326'):
+        return _webmercator_to_lonlat(*bbox[:2]) + _webmercator_to_lonlat(*bbox[2:])
+
+    transformer = pyproj.Transformer.from_crs(from_srid, to_srid, always_xy=True)
+    return transformer.transform_bounds(*bbox, densify_pts=21)
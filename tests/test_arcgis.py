@@ -0,0 +1,60 @@
+import random
+import threading
+import time
+
+from geoarchive.services.arcgis import ArcGisProtocol
+
+ROOT = 'http://example.com/arcgis/rest/services'
+
+
+class FakeClient:
+    """Answers a catalog of nested folders after a random delay, so responses arrive out of order."""
+
+    def __init__(self, folders: int = 3, depth: int = 2, services: int = 4):
+        self._random = random.Random()
+        self._lock = threading.Lock()
+        self._responses = {}
+        self._add_folder('', folders, depth, services)
+
+    def _add_folder(self, path: str, folders: int, depth: int, services: int) -> None:
+        prefix = f'{path}/' if path else ''
+        subfolders = [f'{prefix}f{i}' for i in range(folders)] if depth else []
+        names = [f'{prefix}s{i}' for i in range(services)]
+        self._responses[f'{ROOT}/{path}'.rstrip('/')] = dict(
+            folders=subfolders,
+            services=[dict(name=name, type='MapServer') for name in names] + [dict(name=f'{prefix}x', type='FeatureServer')],
+        )
+        for name in names:
+            self._responses[f'{ROOT}/{name}/MapServer'] = dict(
+                serviceDescription=name,
+                fullExtent=dict(xmin=30, ymin=50, xmax=31, ymax=51, spatialReference=dict(wkid=4326)),
+                layers=[dict(id=0, name='layer')],
+            )
+        for subfolder in subfolders:
+            self._add_folder(subfolder, folders, depth - 1, services)
+
+    def get_json(self, url: str, params: dict | None = None) -> dict:
+        with self._lock:
+            delay = self._random.uniform(0, 0.01)
+        time.sleep(delay)
+        return self._responses[url]
+
+
+def _names(max_workers: int) -> list[str]:
+    return [layer.name for layer in ArcGisProtocol(ROOT, client=FakeClient(), max_workers=max_workers).iter_layers()]
+
+
+def test_layers_in_catalog_order():
+    expected = _names(max_workers=1)
+    assert len(expected) == 4 * (1 + 3 + 9)
+    # depth-first, the layers of subfolders come before the services of a folder
+    assert expected[:4] == ['f0-f0-s0-f0-f0-s0', 'f0-f0-s1-f0-f0-s1', 'f0-f0-s2-f0-f0-s2', 'f0-f0-s3-f0-f0-s3']
+
+    for _ in range(3):
+        assert _names(max_workers=8) == expected
+
+
+def test_stop_early():
+    layers = ArcGisProtocol(ROOT, client=FakeClient(), max_workers=8).iter_layers()
+    assert next(layers).name == 'f0-f0-s0-f0-f0-s0'
+    layers.close()
@@ -0,0 +1,71 @@
+import random
+import threading
+import time
+
+import pytest
+import requests
+
+from geoarchive.services.arcgis_layers import ArcGisProtocol
+
+SERVICE = 'http://example.com/arcgis/rest/services/Ortho/MapServer'
+
+# two groups, one nested in the other, listed before their sublayers
+LAYERS = [
+    dict(id=0, name='All', subLayerIds=[1, 4]),
+    dict(id=1, name='Cities', subLayerIds=[2, 3]),
+    dict(id=2, name='Kyiv', subLayerIds=None),
+    dict(id=3, name='Lviv', subLayerIds=None),
+    dict(id=4, name='Rural', subLayerIds=None),
+]
+EXTENTS = {2: (30, 50, 31, 51), 3: (23, 49, 24, 50), 4: (35, 47, 36, 48)}
+
+
+def _extent(layer_id: int) -> dict:
+    bboxes = [EXTENTS[leaf] for leaf in _leaves(layer_id)]
+    return dict(xmin=min(b[0] for b in bboxes), ymin=min(b[1] for b in bboxes),
+                xmax=max(b[2] for b in bboxes), ymax=max(b[3] for b in bboxes), spatialReference=dict(wkid=4326))
+
+
+def _leaves(layer_id: int) -> list[int]:
+    sublayer_ids = LAYERS[layer_id]['subLayerIds']
+    return [leaf for sublayer_id in sublayer_ids for leaf in _leaves(sublayer_id)] if sublayer_ids else [layer_id]
+
+
+class FakeClient:
+    def __init__(self, bulk: bool):
+        self._bulk = bulk
+        self._random = random.Random()
+        self._lock = threading.Lock()
+
+    def get_json(self, url: str, params: dict | None = None) -> dict:
+        with self._lock:
+            delay = self._random.uniform(0, 0.01)
+        time.sleep(delay)
+
+        if url == SERVICE:
+            return dict(mapName='Ortho', serviceDescription='Imagery', layers=LAYERS,
+                        fullExtent=_extent(0))
+        layers = [dict(id=layer['id'], name=layer['name'], type='Raster Layer', extent=_extent(layer['id']))
+                  for layer in LAYERS]
+        if url == f'{SERVICE}/layers':
+            if not self._bulk:
+                raise requests.HTTPError('404 Client Error')
+            return dict(layers=layers)
+        return layers[int(url.rsplit('/', 1)[-1])]
+
+
+@pytest.mark.parametrize('max_workers', [1, 8])
+def test_bulk_and_fallback_layers_are_the_same(max_workers):
+    bulk = list(ArcGisProtocol(SERVICE, client=FakeClient(bulk=True)).iter_layers())
+    fallback = list(ArcGisProtocol(SERVICE, client=FakeClient(bulk=False), max_workers=max_workers).iter_layers())
+
+    assert fallback == bulk
+    assert [layer.opts['layers'] for layer in bulk] == ['show:0', 'show:1', 'show:2', 'show:3', 'show:4']
+
+
+def test_group_coverage():
+    layers = {layer.opts['layers']: layer for layer in ArcGisProtocol(SERVICE, client=FakeClient(bulk=True)).iter_layers()}
+    assert layers['show:0'].bounds == (23, 47, 36, 51)
+    assert sorted(layers['show:0'].coverage) == sorted(EXTENTS.values())
+    assert sorted(layers['show:1'].coverage) == [EXTENTS[3], EXTENTS[2]]
+    assert layers['show:2'].coverage is None
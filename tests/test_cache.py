@@ -0,0 +1,129 @@
+import hashlib
+import json
+import logging
+from datetime import datetime
+
+import pytest
+
+from geoarchive.cache import CacheService, CatalogStore
+from geoarchive.services.base import Layer
+
+CATALOG = 'http://example.com/catalog'
+
+
+def _layer(name: str, bounds=(30, 50, 31, 51), bounds_srid='EPSG:4326') -> Layer:
+    return Layer(name=name, type='tms', url=f'http://example.com/{name}/{{z}}/{{x}}/{{y}}.png',
+                 bounds=bounds, bounds_srid=bounds_srid)
+
+
+def _legacy_path(project_path):
+    return project_path / '.cache/remotes' / f'{hashlib.md5(CATALOG.encode()).hexdigest()}.json'
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = CatalogStore(tmp_path)
+    yield store
+    store.close()
+
+
+def test_upsert_keeps_first_seen(store):
+    store.upsert(CATALOG, [_layer('a')], seen_at=datetime(2024, 1, 1))
+    store.upsert(CATALOG, [_layer('a', bounds=(10, 10, 11, 11)), _layer('b')], seen_at=datetime(2024, 2, 1))
+
+    rows = store._db.execute('SELECT name, first_seen, last_seen, data FROM layers ORDER BY name').fetchall()
+    assert [row[:3] for row in rows] == [
+        ('a', '2024-01-01T00:00:00', '2024-02-01T00:00:00'),
+        ('b', '2024-02-01T00:00:00', '2024-02-01T00:00:00'),
+    ]
+    assert Layer.model_validate_json(rows[0][3]).bounds == (10, 10, 11, 11)
+
+
+def test_upsert_separates_catalogs(store):
+    store.upsert(CATALOG, [_layer('a')])
+    store.upsert('http://example.com/other', [_layer('a')])
+
+    assert store.exists(CATALOG, 'a') and not store.exists(CATALOG, 'b')
+    assert len(store.query((0, 0, 90, 90))) == 2
+    assert store.query((0, 0, 90, 90), catalogs=[CATALOG]) == [(CATALOG, 'a', (30, 50, 31, 51))]
+
+
+def test_query_follows_updated_and_deleted_bounds(store):
+    store.upsert(CATALOG, [_layer('a'), _layer('b', bounds=(-10, -10, -9, -9))])
+    assert [name for _, name, _ in store.query((29, 49, 32, 52))] == ['a']
+
+    store.upsert(CATALOG, [_layer('a', bounds=(-10.5, -10.5, -9.5, -9.5))])
+    assert store.query((29, 49, 32, 52)) == []
+    assert [name for _, name, _ in store.query((-11, -11, -8, -8))] == ['a', 'b']
+
+    with store._db:
+        store._db.execute("DELETE FROM layers WHERE name = 'b'")
+    assert [name for _, name, _ in store.query((-11, -11, -8, -8))] == ['a']
+    if store._rtree:
+        assert store._db.execute('SELECT count(*) FROM layer_bounds').fetchone()[0] == 1
+
+
+def test_layers_without_bounds_are_not_indexed(store):
+    store.upsert(CATALOG, [_layer('a', bounds=(0, 0, 1, 1), bounds_srid='EPSG:999999')])
+
+    assert store.exists(CATALOG, 'a')
+    assert store.query((-180, -90, 180, 90)) == []
+    if store._rtree:
+        assert store._db.execute('SELECT count(*) FROM layer_bounds').fetchone()[0] == 0
+
+
+def test_cache_service_saves_pending_layers(tmp_path):
+    cache = CacheService.load(CATALOG, tmp_path)
+    cache.set(_layer('a'))
+    assert cache.exists(_layer('a'))
+
+    cache.checkpoint(every=2)
+    assert not cache._store.exists(CATALOG, 'a')
+    cache.set(_layer('b'))
+    cache.checkpoint(every=2)
+    assert cache._store.exists(CATALOG, 'a') and cache._store.exists(CATALOG, 'b')
+    cache.close()
+
+
+def test_migrate_legacy_cache(tmp_path):
+    legacy_path = _legacy_path(tmp_path)
+    legacy_path.parent.mkdir(parents=True)
+    legacy_path.write_text(json.dumps({'a': _layer('a').model_dump(), 'b': _layer('b').model_dump()}))
+    legacy_path.with_suffix('.index.json').write_text('{}')
+
+    cache = CacheService.load(CATALOG, tmp_path)
+    assert cache.exists(_layer('a')) and cache.exists(_layer('b'))
+    cache.close()
+
+    assert not legacy_path.exists()
+    assert not legacy_path.with_suffix('.index.json').exists()
+
+
+def test_migrate_keeps_stored_layers(tmp_path):
+    store = CatalogStore(tmp_path)
+    store.upsert(CATALOG, [_layer('a')])
+    legacy_path = _legacy_path(tmp_path)
+    legacy_path.parent.mkdir(parents=True)
+    legacy_path.write_text(json.dumps({'b': _layer('b').model_dump()}))
+
+    store.migrate(CATALOG)
+    assert store.exists(CATALOG, 'a') and not store.exists(CATALOG, 'b')
+    assert not legacy_path.exists()
+    store.close()
+
+
+@pytest.mark.parametrize('content', ['{"a": ', '[1, 2]', '{"a": {"name": "a"}}'])
+def test_migrate_unreadable_legacy_cache(tmp_path, caplog, content):
+    legacy_path = _legacy_path(tmp_path)
+    legacy_path.parent.mkdir(parents=True)
+    legacy_path.write_text(content)
+
+    store = CatalogStore(tmp_path)
+    with caplog.at_level(logging.WARNING):
+        store.migrate(CATALOG)
+
+    assert not legacy_path.exists()
+    assert legacy_path.with_suffix('.json.bak').read_text() == content
+    assert 'Failed to migrate' in caplog.text
+    assert not store.exists(CATALOG, 'a')
+    store.close()
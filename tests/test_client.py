@@ -0,0 +1,22 @@
+from geoarchive.services.client import HttpClient
+from geoarchive.services.response_cache import ResponseCache
+
+
+def test_cached_responses(tmp_path, http_server):
+    client = HttpClient(cache=ResponseCache(tmp_path))
+    first = client.get(f'{http_server.url}/catalog.json').content
+
+    assert client.get(f'{http_server.url}/catalog.json').content == first
+    assert len(http_server.requests) == 1
+
+
+def test_uncached_requests(tmp_path, http_server):
+    cache = ResponseCache(tmp_path)
+    client = HttpClient(cache=cache)
+    client.get(f'{http_server.url}/tiles/1/2/3.png', cache=False)
+    assert cache.get(f'{http_server.url}/tiles/1/2/3.png') is None
+
+    # a response cached before is not read either
+    cached = client.get(f'{http_server.url}/tiles/1/2/4.png').content
+    assert client.get(f'{http_server.url}/tiles/1/2/4.png', cache=False).content != cached
+    assert len(http_server.requests) == 3
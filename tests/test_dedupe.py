@@ -0,0 +1,117 @@
+import pytest
+
+from geoarchive.cli import _add_layer
+from geoarchive.config import ArcgisSourceConfig, CatalogConfig, ProjectConfig, SourceHealth, TMSSourceConfig
+from geoarchive.dedupe import candidate_pairs, find_duplicates, source_key
+from geoarchive.project import Project
+from geoarchive.services.base import Layer
+
+
+def _tms(name: str, url: str, bounds=(30, 50, 31, 51), **kwargs) -> TMSSourceConfig:
+    return TMSSourceConfig(type='tms', name=name, url=url, bounds=bounds, **kwargs)
+
+
+def _arcgis(name: str, url: str, layers: str | None = None, **kwargs) -> ArcgisSourceConfig:
+    return ArcgisSourceConfig(type='arcgis', name=name, url=url, bounds=(30, 50, 31, 51),
+                              opts=dict(layers=layers) if layers else None, **kwargs)
+
+
+class FakeFingerprints:
+    def __init__(self, same: set[frozenset[str]]):
+        self._same = same
+        self.compared: list[frozenset[str]] = []
+
+    def same_content(self, a, b, min_matches: int = 4) -> bool:
+        self.compared.append(frozenset((a.name, b.name)))
+        return frozenset((a.name, b.name)) in self._same
+
+
+@pytest.mark.parametrize('a, b', [
+    ('http://tiles.example.com/{z}/{x}/{y}.png', 'https://tiles.example.com/{z}/{x}/{y}.png'),
+    ('http://www.tiles.example.com/{z}/{x}/{y}.png', 'http://TILES.example.com/{z}/{x}/{y}.png'),
+    ('http://tiles.example.com:80/{z}/{x}/{y}.png', 'http://tiles.example.com//{z}/{x}/{y}.png/'),
+    ('https://tiles.example.com:443/{z}/{x}/{y}.png', 'http://tiles.example.com/%7Bz%7D/{x}/{y}.png'),
+    ('http://tiles.example.com/{z}/{x}/{y}.png?b=2&a=1', 'http://tiles.example.com/{z}/{x}/{y}.png?a=1&b=2'),
+])
+def test_source_key_normalises_urls(a, b):
+    assert source_key(_tms('a', a)) == source_key(_tms('b', b))
+
+
+@pytest.mark.parametrize('a, b', [
+    ('http://tiles.example.com/{z}/{x}/{y}.png', 'http://tiles.example.com:8080/{z}/{x}/{y}.png'),
+    ('http://tiles.example.com/Ortho/{z}/{x}/{y}.png', 'http://tiles.example.com/ortho/{z}/{x}/{y}.png'),
+    ('http://tiles.example.com/{z}/{x}/{y}.png?a=1', 'http://tiles.example.com/{z}/{x}/{y}.png?a=2'),
+])
+def test_source_key_keeps_differences(a, b):
+    assert source_key(_tms('a', a)) != source_key(_tms('b', b))
+
+
+def test_source_key_of_arcgis():
+    url = 'https://example.com/arcgis/rest/services/Ortho/MapServer'
+    assert source_key(_arcgis('a', url, 'show:1')) == source_key(_arcgis('b', url.upper(), 'show:1'))
+    assert source_key(_arcgis('a', url, 'show:1')) != source_key(_arcgis('b', url, 'show:2'))
+    assert source_key(_arcgis('a', url)) != source_key(_tms('b', url))
+
+
+def test_candidate_pairs_overlap_only():
+    sources = [
+        _tms('a', 'http://a/{z}/{x}/{y}.png', bounds=(0, 0, 10, 10)),
+        _tms('b', 'http://b/{z}/{x}/{y}.png', bounds=(5, 5, 15, 15)),
+        _tms('c', 'http://c/{z}/{x}/{y}.png', bounds=(20, 0, 30, 10)),
+        _tms('d', 'http://d/{z}/{x}/{y}.png', bounds=(-10, -10, 25, 1)),
+        _tms('e', 'http://e/{z}/{x}/{y}.png', bounds=(0, 0, 1, 1), bounds_srid='EPSG:999999'),
+    ]
+    pairs = {frozenset((a.name, b.name)) for a, b in candidate_pairs(sources)}
+    assert pairs == {frozenset(pair) for pair in (('a', 'b'), ('a', 'd'), ('c', 'd'))}
+
+
+def test_find_duplicates_merges_keys_aliases_and_content():
+    sources = [
+        _tms('a', 'http://tiles.example.com/{z}/{x}/{y}.png'),
+        _tms('a-https', 'https://tiles.example.com/{z}/{x}/{y}.png'),
+        _tms('b', 'http://mirror.example.com/{z}/{x}/{y}.png'),
+        _tms('c', 'http://other.example.com/{z}/{x}/{y}.png', alias_of='b'),
+        _tms('far', 'http://far.example.com/{z}/{x}/{y}.png', bounds=(-120, 30, -119, 31)),
+        _tms('alone', 'http://alone.example.com/{z}/{x}/{y}.png'),
+    ]
+    fingerprints = FakeFingerprints({frozenset(('a-https', 'b')), frozenset(('a', 'far'))})
+
+    clusters = find_duplicates(sources, fingerprints)
+    assert [[source.name for source in cluster] for cluster in clusters] == [['a', 'a-https', 'b', 'c']]
+    # sources far apart are never compared, nor those found to be the same already
+    assert frozenset(('a', 'far')) not in fingerprints.compared
+    assert frozenset(('a', 'a-https')) not in fingerprints.compared
+
+
+def test_find_duplicates_without_content():
+    sources = [
+        _tms('a', 'http://tiles.example.com/{z}/{x}/{y}.png'),
+        _tms('b', 'http://mirror.example.com/{z}/{x}/{y}.png'),
+    ]
+    assert find_duplicates(sources) == []
+
+
+def test_find_duplicates_keeps_the_preferred_source():
+    url = 'http://tiles.example.com/{z}/{x}/{y}.png'
+    sources = [
+        _tms('alias', url, alias_of='unavailable'),
+        _tms('unavailable', url, health=SourceHealth(status='unavailable', requests=8, availability=0)),
+        _tms('healthy', url, health=SourceHealth(status='healthy', requests=8, availability=1)),
+        _tms('unknown', url),
+    ]
+    [cluster] = find_duplicates(sources)
+    assert [source.name for source in cluster] == ['healthy', 'unknown', 'unavailable', 'alias']
+
+
+@pytest.mark.parametrize('alias_duplicates, alias_of', [(True, 'a'), (False, None)])
+def test_add_layer_aliases_duplicates(alias_duplicates, alias_of):
+    project = Project(ProjectConfig(name='test'))
+    catalog = CatalogConfig(type='softpro', url='http://example.com/layers.json')
+    source_keys = {}
+    for name, url in (('a', 'http://tiles.example.com/{z}/{x}/{y}.png'),
+                      ('mirror', 'https://www.tiles.example.com/{z}/{x}/{y}.png')):
+        layer = Layer(name=name, type='tms', url=url, bounds=(30, 50, 31, 51))
+        _add_layer(project, layer, catalog, None, source_keys, alias_duplicates)
+
+    assert project.get_sources()['mirror'].alias_of == alias_of
+    assert project.get_sources()['a'].alias_of is None
@@ -0,0 +1,106 @@
+import pytest
+
+from geoarchive.config import CacheConfig, TileGridConfig, TMSSourceConfig
+from geoarchive.mapproxy import FRAGMENTS_DIR, build_config, grid_levels, write_config
+from geoarchive.tiles import WEBMERCATOR, source_grid, source_levels
+
+resolutions = pytest.importorskip('mapproxy.grid.resolutions')
+mapproxy_srs = pytest.importorskip('mapproxy.srs')
+mapproxy_loader = pytest.importorskip('mapproxy.config.loader')
+
+
+def _served_levels(min_level: int | None, max_level: int | None) -> list[int]:
+    source = TMSSourceConfig(type='tms', name='test', url='http://example.com/{z}/{x}/{y}.png',
+                             bounds=(30, 50, 31, 51), min_level=min_level, max_level=max_level)
+    config, _ = build_config([source], [])
+    source_config = config['sources']['test']
+
+    res_range = resolutions.ResolutionRange(source_config.get('min_res'), source_config.get('max_res'))
+    srs = mapproxy_srs.SRS(3857)
+    return [
+        z for z in range(len(WEBMERCATOR.resolutions))
+        if res_range.contains(WEBMERCATOR.tile_bbox(z, 0, 0), WEBMERCATOR.tile_size, srs)
+    ]
+
+
+def test_source_levels_include_min_and_max_level():
+    assert _served_levels(3, 15) == list(range(3, 16))
+
+
+def test_source_levels_at_the_ends_of_the_grid():
+    assert _served_levels(0, len(WEBMERCATOR.resolutions) - 1) == list(range(len(WEBMERCATOR.resolutions)))
+
+
+def test_source_levels_without_limits():
+    source = TMSSourceConfig(type='tms', name='test', url='http://example.com/{z}/{x}/{y}.png', bounds=(30, 50, 31, 51))
+    config, _ = build_config([source], [])
+    assert 'min_res' not in config['sources']['test'] and 'max_res' not in config['sources']['test']
+
+
+def _native_source(**kwargs) -> TMSSourceConfig:
+    # a grid of EPSG:2180 with 1m tiles at level 9, about z17 at the latitude of the source
+    tile_grid = TileGridConfig(srid='EPSG:2180', origin=(0, 1_000_000), resolutions=[512 / 2 ** z for z in range(12)])
+    return TMSSourceConfig(type='tms', name='native', url='http://example.com/native/{z}/{x}/{y}.png',
+                           bounds=(19, 51, 20, 52), tile_grid=tile_grid, **kwargs)
+
+
+def test_grid_levels_of_native_source():
+    source = _native_source(min_level=5, max_level=9)
+    assert grid_levels(source, source_grid(source)) == source_levels(source)
+    assert grid_levels(source, WEBMERCATOR) == range(13, 18)
+
+
+def test_merged_levels_of_native_and_webmercator_sources():
+    sources = [
+        _native_source(min_level=5, max_level=9),
+        TMSSourceConfig(type='tms', name='webmercator', url='http://example.com/{z}/{x}/{y}.png',
+                        bounds=(19, 51, 20, 52), min_level=8, max_level=10),
+    ]
+    _, seeds = build_config(sources, [CacheConfig(name='all', sources=['native', 'webmercator'])])
+    assert seeds['seeds']['merged-all']['levels'] == {'from': 8, 'to': 17}
+
+    _, seeds = build_config(sources, [CacheConfig(name='native', sources=['native'])])
+    assert seeds['seeds']['merged-native']['levels'] == {'from': 13, 'to': 17}
+    assert seeds['seeds']['native']['levels'] == {'from': 5, 'to': 9}
+
+
+def _config_files(path) -> dict[str, int]:
+    return {
+        filename.relative_to(path).as_posix(): filename.stat().st_mtime_ns
+        for filename in path.rglob('*.yaml')
+    }
+
+
+def test_sharded_config(tmp_path):
+    sources = [
+        _native_source(min_level=5, max_level=9),
+        TMSSourceConfig(type='tms', name='webmercator', url='http://example.com/{z}/{x}/{y}.png',
+                        bounds=(19, 51, 20, 52), min_level=8, max_level=10),
+    ]
+    caches = [CacheConfig(name='all', sources=['native', 'webmercator'])]
+    write_config(sources, tmp_path, caches, fingerprint='1', layout='sharded')
+
+    files = _config_files(tmp_path)
+    assert set(files) == {
+        'mapproxy.yaml', 'seeds.yaml',
+        f'{FRAGMENTS_DIR}/sources/native.yaml', f'{FRAGMENTS_DIR}/sources/webmercator.yaml',
+        f'{FRAGMENTS_DIR}/caches/cache-merged-all.yaml',
+    }
+    config = mapproxy_loader.load_configuration(str(tmp_path / 'mapproxy.yaml'))
+    assert {'native', 'webmercator', 'all'} <= set(config.layers)
+    assert {'cache-native', 'cache-webmercator', 'cache-merged-all'} <= set(config.caches)
+
+    # neither the same project nor the same configs touch the files
+    write_config(sources, tmp_path, caches, fingerprint='1', layout='sharded')
+    assert _config_files(tmp_path) == files
+    write_config(sources, tmp_path, caches, fingerprint='2', layout='sharded')
+    assert _config_files(tmp_path) == files
+
+    # a changed source only rewrites its own fragment, a removed one is deleted
+    sources[1] = sources[1].model_copy(update=dict(max_level=11))
+    write_config(sources, tmp_path, caches, fingerprint='3', layout='sharded')
+    changed = {filename for filename, mtime in _config_files(tmp_path).items() if files[filename] != mtime}
+    assert changed == {'seeds.yaml', f'{FRAGMENTS_DIR}/sources/webmercator.yaml'}
+
+    write_config(sources[:1], tmp_path, fingerprint='4', layout='sharded')
+    assert set(_config_files(tmp_path)) == {'mapproxy.yaml', 'seeds.yaml', f'{FRAGMENTS_DIR}/sources/native.yaml'}
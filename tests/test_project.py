@@ -0,0 +1,48 @@
+from datetime import datetime
+
+from geoarchive.config import CatalogConfig, ProjectConfig, SourceHealth, SqliteCacheBackend
+from geoarchive.project import Project
+from geoarchive.services.base import Layer
+
+CATALOG = CatalogConfig(type='softpro', url='http://example.com/layers.json')
+
+
+def _layer(name: str, bounds=(30, 50, 31, 51), **kwargs) -> Layer:
+    return Layer(name=name, type='tms', url=f'http://example.com/{name}/{{z}}/{{x}}/{{y}}.png',
+                 bounds=bounds, **kwargs)
+
+
+def test_reimport_keeps_source_settings():
+    project = Project(ProjectConfig(name='test'))
+    project.add_source(_layer('a'), catalog=CATALOG, refresh_interval=3600)
+    project.add_source(_layer('b'))
+    source = project.get_sources()['a']
+    created_at = source.created_at
+    source.health = SourceHealth(status='degraded', requests=8, availability=0.75)
+    source.cache_backend = SqliteCacheBackend(type='sqlite')
+    source.image_format = 'jpeg'
+    project.set_alias('b', 'a')
+
+    project.add_source(_layer('a', bounds=(30, 50, 32, 52)), catalog=CATALOG)
+    project.add_source(_layer('b'))
+
+    source = project.get_sources()['a']
+    assert source.bounds == (30, 50, 32, 52)
+    assert source.refresh_interval == 3600
+    assert source.health.status == 'degraded'
+    assert source.cache_backend.type == 'sqlite'
+    assert source.image_format == 'jpeg'
+    assert source.created_at == created_at
+    assert source.catalog == CATALOG
+    assert project.get_sources()['b'].alias_of == 'a'
+
+
+def test_reimport_updates_refresh_interval_and_format():
+    project = Project(ProjectConfig(name='test'))
+    project.add_source(_layer('a'), refresh_interval=3600)
+    project.add_source(_layer('a', image_format='png', transparent=True), refresh_interval=60)
+
+    source = project.get_sources()['a']
+    assert source.refresh_interval == 60
+    assert source.image_format == 'png'
+    assert source.cached_at is not None and source.cached_at <= datetime.now()
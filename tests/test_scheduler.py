@@ -0,0 +1,110 @@
+import subprocess
+import threading
+import time
+
+import yaml
+
+from geoarchive.config import CacheConfig, TMSSourceConfig
+from geoarchive.mapproxy import build_config
+from geoarchive.scheduler import SeedScheduler, SeedState, SeedTask, load_seed_tasks
+
+
+def _task(name: str, host: str | None = None, depends: tuple[str, ...] = (), fingerprint: str = 'v1') -> SeedTask:
+    return SeedTask(name=name, host=host, tiles=0, fingerprint=fingerprint, depends=depends)
+
+
+class Recorder:
+    def __init__(self, delay: float = 0.02, fail: dict[str, Exception] | None = None):
+        self._delay = delay
+        self._fail = fail or {}
+        self._lock = threading.Lock()
+        self.events: list[tuple[str, str]] = []
+        self.hosts: dict[str | None, int] = {}
+        self.max_per_host: dict[str | None, int] = {}
+
+    def __call__(self, task: SeedTask) -> None:
+        with self._lock:
+            self.events.append(('start', task.name))
+            self.hosts[task.host] = self.hosts.get(task.host, 0) + 1
+            self.max_per_host[task.host] = max(self.max_per_host.get(task.host, 0), self.hosts[task.host])
+        time.sleep(self._delay)
+        with self._lock:
+            self.hosts[task.host] -= 1
+            self.events.append(('finish', task.name))
+        if task.name in self._fail:
+            raise self._fail[task.name]
+
+    def started(self) -> list[str]:
+        return [name for event, name in self.events if event == 'start']
+
+
+def test_merged_seeds_run_after_their_sources(tmp_path):
+    tasks = [_task('merged-all', depends=('a', 'b')), _task('a', 'x'), _task('b', 'y'), _task('c', 'z')]
+    recorder = Recorder()
+
+    assert SeedScheduler(SeedState(tmp_path / 'state.json'), jobs=4).run(tasks, recorder) == []
+    merged = recorder.events.index(('start', 'merged-all'))
+    assert recorder.events.index(('finish', 'a')) < merged
+    assert recorder.events.index(('finish', 'b')) < merged
+
+
+def test_merged_seed_skipped_when_a_source_fails(tmp_path):
+    tasks = [_task('a', 'x'), _task('b', 'y'), _task('merged-all', depends=('a', 'b'))]
+    recorder = Recorder(fail={'a': subprocess.CalledProcessError(1, 'mapproxy-seed')})
+
+    failed = SeedScheduler(SeedState(tmp_path / 'state.json'), jobs=2).run(tasks, recorder)
+    assert {task.name for task in failed} == {'a', 'merged-all'}
+    assert 'merged-all' not in recorder.started()
+
+
+def test_per_host_limit(tmp_path):
+    tasks = [_task(f'x{i}', 'x') for i in range(4)] + [_task(f'y{i}', 'y') for i in range(4)]
+    recorder = Recorder()
+
+    SeedScheduler(SeedState(tmp_path / 'state.json'), jobs=4, per_host=1).run(tasks, recorder)
+    assert recorder.max_per_host == {'x': 1, 'y': 1}
+    assert sorted(recorder.started()) == sorted(task.name for task in tasks)
+
+
+def test_completed_seeds_are_skipped_until_restart(tmp_path):
+    tasks = [_task('a', 'x'), _task('b', 'y')]
+    SeedScheduler(SeedState(tmp_path / 'state.json'), jobs=2).run(tasks, Recorder())
+
+    # the state survives a new process, a changed seed runs again
+    recorder = Recorder()
+    SeedScheduler(SeedState(tmp_path / 'state.json'), jobs=2).run([tasks[0], _task('b', 'y', fingerprint='v2')], recorder)
+    assert recorder.started() == ['b']
+
+    state = SeedState(tmp_path / 'state.json')
+    state.reset()
+    recorder = Recorder()
+    SeedScheduler(state, jobs=2).run(tasks, recorder)
+    assert sorted(recorder.started()) == ['a', 'b']
+
+
+def test_missing_binary_fails_only_its_task(tmp_path):
+    tasks = [_task('a', 'x'), _task('b', 'y'), _task('c', 'z')]
+    recorder = Recorder(fail={'b': FileNotFoundError('mapproxy-seed')})
+
+    failed = SeedScheduler(SeedState(tmp_path / 'state.json'), jobs=3).run(tasks, recorder)
+    assert [task.name for task in failed] == ['b']
+
+    state = SeedState(tmp_path / 'state.json')
+    assert state.is_name_completed('a') and state.is_name_completed('c') and not state.is_name_completed('b')
+
+
+def test_load_seed_tasks(tmp_path):
+    sources = [
+        TMSSourceConfig(type='tms', name=name, url=f'http://{name}.example.com/{{z}}/{{x}}/{{y}}.png',
+                        bounds=(30, 50, 31, 51), min_level=5, max_level=8)
+        for name in ('a', 'b')
+    ]
+    caches = [CacheConfig(name='all', sources=['a', 'b'])]
+    _, seeds = build_config(sources, caches)
+    (tmp_path / 'seeds.yaml').write_text(yaml.safe_dump(seeds))
+
+    tasks = {task.name: task for task in load_seed_tasks(tmp_path, {source.name: source for source in sources},
+                                                           {cache.name: cache for cache in caches})}
+    assert tasks['a'].host == 'a.example.com'
+    assert tasks['merged-all'].depends == ('a', 'b')
+    assert tasks['merged-all'].tiles == tasks['a'].tiles + tasks['b'].tiles
@@ -0,0 +1,58 @@
+import pytest
+
+from geoarchive.config import TMSSourceConfig
+from geoarchive.seeding import PROBE_LEVEL, TileProbe, fetch_tile, probe_tiles, sample_tiles, source_health
+from geoarchive.services.client import HttpClient
+from geoarchive.services.response_cache import ResponseCache
+
+
+def _source(url: str) -> TMSSourceConfig:
+    return TMSSourceConfig(type='tms', name='test', url=f'{url}/tiles/{{z}}/{{x}}/{{y}}.png', bounds=(30, 50, 31, 51))
+
+
+def _probes(answered: int, failed: int, elapsed: float = 0.1) -> list[TileProbe]:
+    return [TileProbe(elapsed=elapsed, data=b'tile')] * answered + [TileProbe(elapsed=1, error='503')] * failed
+
+
+@pytest.mark.parametrize('answered, failed, min_availability, status', [
+    (8, 0, 0.9, 'healthy'),
+    (7, 1, 0.9, 'healthy'),
+    (6, 2, 0.9, 'degraded'),
+    (19, 1, 0.95, 'healthy'),
+    (18, 2, 0.95, 'degraded'),
+    (90, 10, 0.9, 'healthy'),
+    (89, 11, 0.9, 'degraded'),
+    (7, 1, 1.0, 'degraded'),
+    (4, 4, 0.5, 'healthy'),
+    (0, 8, 0.5, 'unavailable'),
+])
+def test_source_health_availability(answered, failed, min_availability, status):
+    health = source_health(_probes(answered, failed), min_availability=min_availability)
+    assert health.status == status
+    assert health.availability == answered / (answered + failed)
+
+
+def test_source_health_slow():
+    assert source_health(_probes(8, 0, elapsed=6), slow=5).status == 'degraded'
+
+
+def test_tiles_are_not_cached(tmp_path, http_server):
+    client = HttpClient(cache=ResponseCache(tmp_path))
+    source = _source(http_server.url)
+
+    assert fetch_tile(client, source, 3, 4, 5) != fetch_tile(client, source, 3, 4, 5)
+    assert len(http_server.requests) == 2
+    assert not list(tmp_path.iterdir())
+
+
+def test_probes_bypass_cached_tiles(tmp_path, http_server):
+    client = HttpClient(cache=ResponseCache(tmp_path))
+    source = _source(http_server.url)
+    # the same tiles cached by a client without the bypass are stale
+    stale = {client.get(f'{http_server.url}/tiles/{z}/{x}/{y}.png').content
+             for z, x, y in sample_tiles(source, 4, PROBE_LEVEL)}
+
+    probes = probe_tiles(client, source, count=4)
+    assert len(http_server.requests) == 8
+    assert all(probe.ok for probe in probes)
+    assert stale.isdisjoint(probe.data for probe in probes)
@@ -0,0 +1,91 @@
+import pytest
+from pydantic import TypeAdapter
+
+from geoarchive.config import CacheBackendConfig, TMSSourceConfig
+from geoarchive.mapproxy import build_config
+from geoarchive.storage import CompactCacheV2, open_storage
+from geoarchive.tiles import source_grid
+
+compact = pytest.importorskip('mapproxy.cache.compact')
+mapproxy_tile = pytest.importorskip('mapproxy.cache.tile')
+mapproxy_loader = pytest.importorskip('mapproxy.config.loader')
+
+
+def _mapproxy_load(cache, z: int, x: int, y: int) -> bytes | None:
+    tile = mapproxy_tile.Tile((x, y, z))
+    if not cache.load_tile(tile):
+        return None
+    return tile.image_result_buffer().read()
+
+
+def test_compact_cache_is_read_by_mapproxy(tmp_path):
+    storage = CompactCacheV2(tmp_path)
+    storage.store(5, 3, 7, b'first')
+    storage.store(5, 130, 7, b'second bundle')
+    storage.store(5, 4, 7, b'')
+    storage.store(5, 3, 8, b'old')
+    storage.store(5, 3, 8, b'rewritten')
+    storage.close()
+
+    cache = compact.CompactCacheV2(str(tmp_path))
+    assert _mapproxy_load(cache, 5, 3, 7) == b'first'
+    assert _mapproxy_load(cache, 5, 130, 7) == b'second bundle'
+    assert _mapproxy_load(cache, 5, 3, 8) == b'rewritten'
+    # an empty tile has no size in the index and reads as missing
+    assert _mapproxy_load(cache, 5, 4, 7) is None
+    assert not cache.is_cached(mapproxy_tile.Tile((4, 7, 5)))
+    assert _mapproxy_load(cache, 5, 5, 7) is None
+
+
+def test_compact_cache_reopened(tmp_path):
+    storage = CompactCacheV2(tmp_path)
+    storage.store(3, 1, 1, b'first')
+    storage.close()
+
+    storage = CompactCacheV2(tmp_path)
+    assert storage.exists(3, 1, 1) and not storage.exists(3, 1, 2)
+    storage.store(3, 1, 2, b'appended')
+    storage.store(3, 1, 1, b'rewritten')
+    storage.close()
+
+    cache = compact.CompactCacheV2(str(tmp_path))
+    assert _mapproxy_load(cache, 3, 1, 1) == b'rewritten'
+    assert _mapproxy_load(cache, 3, 1, 2) == b'appended'
+
+
+@pytest.mark.parametrize('backend, image_format', [
+    (dict(type='file'), 'png'),
+    (dict(type='file', directory_layout='tms'), 'png'),
+    (dict(type='file', directory_layout='mp'), 'jpeg'),
+    (dict(type='file', link_single_color_images=True), 'png'),
+    (dict(type='sqlite'), 'png'),
+    (dict(type='sqlite', wal=True), 'png'),
+    (dict(type='mbtiles'), 'png'),
+    (dict(type='compact'), 'png'),
+])
+def test_storage_is_read_by_mapproxy(tmp_path, backend, image_format):
+    backend = TypeAdapter(CacheBackendConfig).validate_python(backend)
+    source = TMSSourceConfig(type='tms', name='test', url='http://example.com/{z}/{x}/{y}.png',
+                             bounds=(30, 50, 31, 51), cache_backend=backend, image_format=image_format)
+    grid = source_grid(source)
+
+    storage = open_storage(tmp_path, 'cache-test', grid, backend, image_format)
+    storage.store(10, 600, 300, b'first')
+    storage.store(10, 601, 300, b'old')
+    storage.store(10, 601, 300, b'rewritten')
+    storage.store(12, 2400, 1200, b'first')
+    storage.close()
+
+    config, _ = build_config([source], [])
+    config['globals'] = dict(cache=dict(base_dir=str(tmp_path / 'cache_data')))
+    mapproxy_grid, _, tile_manager = mapproxy_loader.ProxyConfiguration(
+        config, conf_base_dir=str(tmp_path)
+    ).caches['cache-test'].caches()[0]
+    cache = tile_manager.cache
+
+    # the coordinates address the same tile in both grids
+    assert mapproxy_grid.tile_bbox((600, 300, 10)) == pytest.approx(grid.tile_bbox(10, 600, 300))
+    assert _mapproxy_load(cache, 10, 600, 300) == b'first'
+    assert _mapproxy_load(cache, 10, 601, 300) == b'rewritten'
+    assert _mapproxy_load(cache, 12, 2400, 1200) == b'first'
+    assert _mapproxy_load(cache, 10, 602, 300) is None